@@ -1,109 +1,622 @@
-import csv
+import asyncio
+import hmac
+import ipaddress
+import itertools
 import os
-from websocket_server import WebsocketServer
+import sys
 import threading
+import time
+from http import HTTPStatus
 
-# Archivo CSV donde se almacenarán los datos
-CSV_FILE = "data.csv"
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
 
-# Crear el archivo CSV si no existe
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["Nivel", "Potencia"])  # Encabezados del archivo
+import modelo_planta
+import protocolo
+from dispositivos import DISPOSITIVO_PREDETERMINADO, RegistroDispositivos, id_valido
+from mpc import ControladorMPC
+from recetas import EjecucionReceta, ErrorReceta, Receta, predecir, texto_prediccion
 
-# Función que se ejecuta cuando un cliente se conecta
-def new_client(client, server):
-    print(f"Cliente conectado: {client['id']}")
+# Dirección del servidor WebSocket
+HOST = "0.0.0.0"
+PUERTO = 8765
 
-# Función que se ejecuta cuando se recibe un mensaje
-def message_received(client, server, message):
-    
+# Ruta de la API de comandos (los ESP32 se conectan a "/")
+RUTA_CONTROL = "/control"
+
+# Clave compartida de la API de comandos (variable de entorno LEVELSENSE_TOKEN). Sin clave,
+# /control solo acepta conexiones desde esta misma máquina; con clave, las de cualquier
+# cliente que la envíe en la cabecera "Authorization: Bearer <clave>"
+TOKEN_CONTROL = os.environ.get("LEVELSENSE_TOKEN") or None
+
+# Comandos de la API que se reenvían al dispositivo: setpoint, geometría y ajustes del lazo (protocolo.py)
+COMANDOS_DISPOSITIVO = ("s:", "c:") + protocolo.COMANDOS_AJUSTE + (protocolo.CONSULTA_AJUSTES,)
+
+# Cada cuántos segundos la tarea de escritura fuerza los buffers a disco
+SINCRONIZAR_CADA = 5.0
+
+# Lotes de muestras que pueden esperar a la tarea de escritura; con el disco trabado los
+# siguientes se descartan (siguen en la ventana en memoria, pero no llegan al disco)
+MAX_LOTES_ESCRITURA = 1000
+
+# Dispositivos conocidos, cada uno con su propio buffer circular de telemetría
+registro = RegistroDispositivos()
+registro.cargar_existentes()
+
+# Estado del servidor en ejecución (bucle de eventos, cola de escritura y evento de parada)
+_loop = None
+_cola_escritura = None
+_detener = None
+_despachadores = {}  # id del dispositivo → (tarea que envía sus comandos, evento que la despierta)
+escritura = {"descartados": 0, "errores": 0}  # Lotes que no llegaron al disco (se informan con METRICAS)
+
+# Recetas de setpoint lanzadas desde la API (número → ejecución) y sus tareas en el bucle
+recetas = {}
+_tareas_recetas = {}
+_numeros_receta = itertools.count(1)
+
+# Dispositivos en modo predictivo: id → controlador que calcula su mando directo p: en cada ciclo
+controladores = {}
+_tareas_mpc = {}  # id → tarea que envía el mando directo a periodo fijo
+
+# La API corre en hilos aparte: las altas y bajas de recetas y controladores se hacen con este lock
+estado_lock = threading.Lock()
+
+# Funciones suscritas que reciben cada muestra en cuanto llega
+suscriptores = []
+suscriptores_lock = threading.Lock()
+
+def suscribir(callback):
+    """Registra una función callback(dispositivo, nivel, potencia, tiempo) que se llama con cada muestra recibida.
+
+    El callback se ejecuta en el hilo del bucle de eventos del servidor, por lo que debe ser rápido
+    y no tocar directamente widgets de Qt (usar una señal para pasar al hilo de la interfaz).
+    """
+    with suscriptores_lock:
+        suscriptores.append(callback)
+
+def desuscribir(callback):
+    """Elimina un callback registrado con suscribir()."""
+    with suscriptores_lock:
+        if callback in suscriptores:
+            suscriptores.remove(callback)
+
+def publicar(dispositivo, nivel, potencia, tiempo):
+    """Entrega una muestra a todos los suscriptores."""
+    with suscriptores_lock:
+        callbacks = list(suscriptores)
+    for callback in callbacks:
+        try:
+            callback(dispositivo, nivel, potencia, tiempo)
+        except Exception as e:
+            print(f"Error en un suscriptor de telemetría: {e}")
+
+def asociar_dispositivo(websocket, id_dispositivo, con_ack=False):
+    """Asocia la conexión al dispositivo indicado; una reconexión reemplaza a la conexión anterior.
+
+    Los comandos que quedaron pendientes mientras estaba desconectado se envían enseguida.
+    """
+    dispositivo = registro.obtener(id_dispositivo)
+    dispositivo.cliente = websocket
+    dispositivo.comandos.reconectado(con_ack)
+    _despertar(dispositivo)
+    print(f"Cliente {websocket.remote_address} identificado como dispositivo {dispositivo.id}")
+    return dispositivo
+
+# Manejo de un mensaje recibido de un ESP32
+async def message_received(websocket, dispositivo, message):
+    """Procesa un mensaje y devuelve el dispositivo asociado a la conexión (puede cambiar con el saludo)."""
     try:
-        # Procesar el mensaje recibido (formato esperado: [nivel, potencia])
-        data = eval(message)  # Convertir el mensaje en una lista
-        if len(data) == 2:
-            nivel, potencia = data
-
-            # Leer los datos existentes del archivo CSV
-            rows = []
-            if os.path.exists(CSV_FILE):
-                with open(CSV_FILE, mode="r") as file:
-                    reader = csv.reader(file)
-                    rows = list(reader)
-
-            # Eliminar encabezados y mantener solo los últimos 100 datos
-            if len(rows) > 1:
-                rows = rows[1:]  # Eliminar encabezados
-            if len(rows) >= 1000:
-                rows.pop(0)  # Eliminar el dato más antiguo
-
-            # Agregar el nuevo dato al final
-            rows.append([nivel, potencia])
-
-            # Escribir los datos actualizados en el archivo CSV
-            with open(CSV_FILE, mode="w", newline="") as file:
-                writer = csv.writer(file)
-                writer.writerow(["Nivel", "Potencia"])  # Encabezados
-                writer.writerows(rows)  # Escribir los datos actualizados
+        # Saludo del dispositivo: identificarlo y negociar el formato de telemetría
+        if isinstance(message, str) and message.startswith(protocolo.PREFIJO_SALUDO):
+            saludo = protocolo.parsear_saludo(message)
+            id_dispositivo = saludo.get("id", DISPOSITIVO_PREDETERMINADO)
+            if not id_valido(id_dispositivo):
+                print(f"Identificador de dispositivo inválido: {id_dispositivo!r}")
+                return dispositivo
+            # Un dispositivo conectado no puede ser reemplazado desde otra dirección (la conexión
+            # colgada de un ESP32 que cambió de IP se cierra sola al fallar los ping)
+            actual = registro.buscar(id_dispositivo)
+            if (actual is not None and actual.conectado and actual.cliente is not websocket
+                    and _direccion(actual.cliente) != _direccion(websocket)):
+                print(f"Saludo de {websocket.remote_address} rechazado: {id_dispositivo} sigue conectado "
+                      f"desde {actual.cliente.remote_address}")
+                await websocket.close(1008, "identificador en uso")
+                return dispositivo
+            dispositivo = asociar_dispositivo(websocket, id_dispositivo, saludo.get("a") == "1")
+            dispositivo.formato = protocolo.negociar_formato(saludo, binario_disponible=True)
+            await websocket.send(protocolo.PREFIJO_FORMATO + dispositivo.formato)
+            print(f"Dispositivo {dispositivo.id} usa el formato de telemetría '{dispositivo.formato}'")
+            return dispositivo
+
+        # Acuse de un comando numerado: deja de reintentarlo y pasa al siguiente
+        if isinstance(message, str) and message.startswith(protocolo.PREFIJO_ACUSE):
+            if dispositivo is not None and dispositivo.comandos.confirmar(protocolo.parsear_acuse(message), time.monotonic()):
+                _despertar(dispositivo)
+            return dispositivo
+
+        # Reporte periódico del lazo de control del firmware (atrasos del ciclo y ecos perdidos)
+        if isinstance(message, str) and message.startswith(protocolo.PREFIJO_LAZO):
+            if dispositivo is None:
+                dispositivo = asociar_dispositivo(websocket, DISPOSITIVO_PREDETERMINADO)
+            dispositivo.metricas.lazo = protocolo.parsear_lazo(message)  # Se consulta con METRICAS
+            return dispositivo
+
+        # Parámetros del lazo en uso (al conectarse y tras cada ajuste k:, h:, m:, r:); los muestra la interfaz
+        if isinstance(message, str) and message.startswith(protocolo.PREFIJO_AJUSTES):
+            if dispositivo is None:
+                dispositivo = asociar_dispositivo(websocket, DISPOSITIVO_PREDETERMINADO)
+            dispositivo.ajustes = protocolo.parsear_ajustes(message)
+            print(f"Dispositivo {dispositivo.id}: {dispositivo.texto_ajustes()}")
+            with estado_lock:  # Con r: o m: cambian la malla y los mandos posibles del modo predictivo
+                controlador = controladores.get(dispositivo.id)
+                if controlador is not None and opciones_mpc(dispositivo.ajustes) != opciones_mpc(None, controlador):
+                    controladores[dispositivo.id] = crear_controlador(dispositivo.ajustes, controlador)
+            return dispositivo
+
+        # Procesar las muestras recibidas (trama binaria, t:..., l:... o el formato anterior [nivel, potencia])
+        t_recepcion = time.time()
+        if isinstance(message, bytes):
+            muestras = protocolo.parsear_binario(message)
         else:
-            print("Formato de mensaje inválido")
+            muestras = protocolo.parsear_texto(message)
+
+        # Los clientes que no saludan (firmware anterior) se asignan al dispositivo predeterminado
+        if dispositivo is None:
+            dispositivo = asociar_dispositivo(websocket, DISPOSITIVO_PREDETERMINADO)
+        filas = dispositivo.procesar(muestras, t_recepcion)
+
+        # Notificar a los suscriptores (interfaz gráfica) de inmediato; el disco lo atiende la tarea de escritura
+        for nivel, potencia, tiempo, *_ in filas:
+            publicar(dispositivo.id, nivel, potencia, tiempo)
+        try:
+            _cola_escritura.put_nowait((dispositivo, filas))
+        except asyncio.QueueFull:
+            if escritura["descartados"] % 100 == 0:
+                print(f"Cola de escritura llena: se descartan muestras del disco ({escritura['descartados'] + 1} lotes)")
+            escritura["descartados"] += 1
+    except protocolo.ErrorProtocolo as e:
+        print(f"Formato de mensaje inválido: {e}")
     except Exception as e:
         print(f"Error al procesar el mensaje: {e}")
+    return dispositivo
 
-# Función para enviar un mensaje al ESP
-def enviar_mensaje(mensaje):
-    """Envía un mensaje al ESP a través del servidor WebSocket."""
+def _direccion(websocket):
+    return websocket.remote_address[0] if websocket.remote_address else None
+
+def es_local(direccion):
+    """True si la dirección IP es de esta misma máquina (127.0.0.0/8, ::1 o ::ffff:127.x.x.x)."""
     try:
-        if server.clients:
-            for client in server.clients:
-                server.send_message(client, mensaje)
-                print(f"Mensaje enviado al cliente {client['id']}: {mensaje}")
-        else:
-            print("No hay clientes conectados para enviar el mensaje.")
+        ip = ipaddress.ip_address(direccion)
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_loopback
+
+def validar_solicitud(conexion, solicitud):
+    """Rechaza en el handshake las conexiones a /control no autorizadas (ver TOKEN_CONTROL)."""
+    if solicitud.path != RUTA_CONTROL:
+        return None
+    if TOKEN_CONTROL:
+        recibida = solicitud.headers.get("Authorization", "")
+        autorizada = hmac.compare_digest(recibida.encode(errors="replace"), f"Bearer {TOKEN_CONTROL}".encode())
+    else:
+        autorizada = es_local(_direccion(conexion))
+    if autorizada:
+        return None
+    print(f"Conexión a {RUTA_CONTROL} rechazada desde {conexion.remote_address}")
+    return conexion.respond(HTTPStatus.FORBIDDEN, "Acceso denegado a la API de comandos\n")
+
+async def manejar_cliente(websocket):
+    """Atiende una conexión: los ESP32 envían telemetría a "/" y las herramientas envían comandos a /control."""
+    if websocket.request.path == RUTA_CONTROL:
+        await manejar_control(websocket)
+        return
+
+    print(f"Cliente conectado: {websocket.remote_address}")
+    dispositivo = None
+    try:
+        async for message in websocket:
+            dispositivo = await message_received(websocket, dispositivo, message)
+    except ConnectionClosed:
+        pass
+    finally:
+        if dispositivo is not None and dispositivo.cliente is websocket:
+            dispositivo.cliente = None
+            print(f"Dispositivo {dispositivo.id} desconectado")
+
+async def manejar_control(websocket):
+    """API de comandos: cada mensaje de texto es un comando y se responde con el resultado."""
+    async for comando in websocket:
+        # En un hilo aparte: predecir una receta o exportar los CSV no debe frenar la recepción
+        await websocket.send(await asyncio.to_thread(ejecutar_comando, str(comando)))
+
+async def escribir_telemetria():
+    """Tarea de fondo que persiste las muestras y sincroniza los buffers con el disco.
+
+    Las escrituras se agrupan por lotes y la sincronización (la parte lenta) corre en un hilo
+    aparte, así que un disco lento no frena la recepción de ningún cliente. Un error de disco
+    se informa y se pierde solo ese lote: la tarea sigue atendiendo la cola.
+    """
+    ultima_sincronizacion = time.monotonic()
+    while True:
+        guardar(*await _cola_escritura.get())
+        while not _cola_escritura.empty():
+            guardar(*_cola_escritura.get_nowait())
+
+        if time.monotonic() - ultima_sincronizacion >= SINCRONIZAR_CADA:
+            ultima_sincronizacion = time.monotonic()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, sincronizar)
+            except Exception as e:
+                print(f"Error al sincronizar la telemetría con el disco: {e}")
+
+def guardar(dispositivo, filas):
+    try:
+        dispositivo.guardar(filas)
     except Exception as e:
+        escritura["errores"] += 1
+        print(f"Error al guardar {len(filas)} muestras del dispositivo {dispositivo.id}: {e}")
+
+def sincronizar():
+    for dispositivo in registro.todos():
+        dispositivo.sincronizar()
+
+def vaciar_cola_escritura():
+    while _cola_escritura is not None and not _cola_escritura.empty():
+        guardar(*_cola_escritura.get_nowait())
+
+# Función para enviar un mensaje al ESP
+def enviar_mensaje(mensaje, dispositivo=None):
+    """Encola un comando para el ESP indicado; no bloquea y puede llamarse desde cualquier hilo.
+
+    Si no se indica el dispositivo, solo se envía cuando hay exactamente uno conectado;
+    los comandos nunca se difunden a todos los dispositivos. Un dispositivo conocido pero
+    desconectado recibe el comando al reconectarse. Devuelve True si el comando quedó encolado.
+    """
+    if dispositivo is None:
+        conectados = registro.conectados()
+        if not conectados:
+            print("No hay dispositivos conectados para enviar el mensaje.")
+            return False
+        if len(conectados) > 1:
+            print("Hay varios dispositivos conectados; indique a cuál enviar el mensaje.")
+            return False
+        destino = conectados[0]
+    else:
+        destino = registro.buscar(dispositivo)
+        if destino is None:
+            print(f"El dispositivo {dispositivo} no existe.")
+            return False
+        if not destino.conectado:
+            print(f"El dispositivo {dispositivo} no está conectado; el comando se enviará al reconectarse.")
+
+    if _loop is None or _loop.is_closed():
+        print("El servidor WebSocket no está en ejecución.")
+        return False
+    _loop.call_soon_threadsafe(_encolar, destino, mensaje)
+    return True
+
+def _encolar(destino, mensaje):
+    controlador = controladores.get(destino.id)
+    if controlador is not None and mensaje.startswith("s:"):
+        try:
+            controlador.setpoint = float(mensaje[2:])  # Las recetas y la interfaz siguen cambiando el setpoint
+        except ValueError:
+            pass
+    destino.comandos.agregar(mensaje, time.monotonic())
+    _despertar(destino)
+
+def _despertar(dispositivo):
+    """Avisa a la tarea de envío del dispositivo (y la crea si no existe) que hay algo que hacer."""
+    if dispositivo.id not in _despachadores:
+        evento = asyncio.Event()
+        _despachadores[dispositivo.id] = (asyncio.ensure_future(_despachar(dispositivo, evento)), evento)
+    _despachadores[dispositivo.id][1].set()
+
+async def _despachar(dispositivo, evento):
+    """Envía los comandos del dispositivo de a uno y los reintenta con espera exponencial hasta su acuse."""
+    cola = dispositivo.comandos
+    while True:
+        espera = None
+        if dispositivo.conectado:
+            mensaje, espera = cola.siguiente(time.monotonic())
+            if mensaje is not None:
+                await _enviar(dispositivo, mensaje)
+                continue
+        try:
+            await asyncio.wait_for(evento.wait(), espera)
+        except asyncio.TimeoutError:
+            pass
+        evento.clear()
+
+async def _enviar(destino, mensaje):
+    cliente = destino.cliente
+    if cliente is None:
+        return
+    try:
+        await cliente.send(mensaje)
+    except ConnectionClosed as e:
         print(f"Error al enviar el mensaje: {e}")
 
-# Crear el servidor WebSocket
-server = WebsocketServer(host="0.0.0.0", port=8765)
-server.set_fn_new_client(new_client)
-server.set_fn_message_received(message_received)
+def exportar_csv():
+    """Exporta la ventana de cada dispositivo a su CSV (el predeterminado a data.csv)."""
+    lineas = []
+    for dispositivo in registro.todos():
+        cantidad = dispositivo.exportar_csv()
+        lineas.append(f"{cantidad} datos del dispositivo {dispositivo.id} exportados")
+    return "\n".join(lineas) or "No hay dispositivos."
 
-# Ejemplo: Enviar un mensaje al ESP
-def enviar_comandos():
-    """Función para enviar comandos al ESP desde la consola."""
-    print("Servidor WebSocket corriendo en 0.0.0.0:8765")
+def iniciar_receta(fuente, ids):
+    """Predice y lanza una receta de setpoint (texto o archivo .json) sobre los dispositivos indicados.
+
+    La predicción parte del último nivel medido del primer dispositivo y usa los ajustes del
+    lazo que reportó (g:). Devuelve el texto de respuesta de la API.
+    """
     try:
-        while True:
-            comando = input("Ingrese el comando a enviar (formato: 's:25.0' o 'c:50.0,10.0', SALIR para salir): ").strip()
-            if comando.lower().startswith(("s:", "c:")):
-                enviar_mensaje(comando)  # Llamar a enviar_mensaje directamente
-            elif comando.upper() == "SALIR":
-                print("Cerrando el servidor...")
-                server.shutdown()
-                break
-            else:
-                print("Comando no reconocido. Use 's:<altura>', 'c:<altura>,<diámetro>' o 'SALIR'.")
-    except KeyboardInterrupt:
-        print("\nServidor detenido manualmente.")
+        receta = Receta.cargar(fuente)
+    except ErrorReceta as e:
+        return f"error: {e}"
+    destinos = []
+    for id_dispositivo in ids:
+        destino = registro.buscar(id_dispositivo)
+        if destino is None:
+            return f"error: el dispositivo {id_dispositivo} no existe"
+        destinos.append(destino)
+    if _loop is None or _loop.is_closed():
+        return "error: el servidor WebSocket no está en ejecución"
+
+    ultimas = destinos[0].telemetria.ultimas(1)
+    inicial = ultimas[0][0] if ultimas else 0.0
+    prediccion = predecir(receta, inicial, destinos[0].ajustes)
+    with estado_lock:  # Dos RECETA simultáneas no pueden tomar el mismo dispositivo
+        for ejecucion in recetas.values():
+            ocupados = [destino.id for destino in destinos if destino in ejecucion.dispositivos]
+            if ejecucion.activa and ocupados:
+                return f"error: {ocupados[0]} ya ejecuta la receta {ejecucion.numero}; use 'CANCELAR {ejecucion.numero}'"
+        ejecucion = EjecucionReceta(next(_numeros_receta), receta, destinos, inicial, prediccion)
+        recetas[ejecucion.numero] = ejecucion
+    _loop.call_soon_threadsafe(_lanzar_receta, ejecucion)
+    return f"Receta {ejecucion.numero} iniciada en {','.join(ids)} desde {inicial:.1f} cm: {texto_prediccion(prediccion)}"
+
+def cancelar_receta(numero):
+    """Detiene una receta en curso; el setpoint queda en el último valor enviado."""
+    ejecucion = recetas.get(numero)
+    if ejecucion is None or not ejecucion.activa or _loop is None or _loop.is_closed():
+        return False
+    _loop.call_soon_threadsafe(_cancelar_receta, numero)
+    return True
+
+def _lanzar_receta(ejecucion):
+    tarea = asyncio.ensure_future(ejecucion.ejecutar(_encolar))
+    _tareas_recetas[ejecucion.numero] = tarea
+    tarea.add_done_callback(lambda _: _receta_terminada(ejecucion, tarea))
+
+def _receta_terminada(ejecucion, tarea):
+    _tareas_recetas.pop(ejecucion.numero, None)
+    if tarea.cancelled() and ejecucion.activa:
+        ejecucion.estado = "cancelada"  # Cancelada antes de llegar a ejecutarse
+
+def _cancelar_receta(numero):
+    tarea = _tareas_recetas.get(numero)
+    if tarea is not None:
+        tarea.cancel()
+
+def activar_mpc(id_dispositivo, setpoint):
+    """Pasa el dispositivo al control predictivo del backend (mpc.py) con el setpoint indicado.
+
+    El firmware también recibe el setpoint: si deja de llegar el mando directo (backend
+    detenido o red caída) vuelve solo a su PID con ese mismo objetivo.
+    """
+    destino = registro.buscar(id_dispositivo)
+    if destino is None:
+        print(f"El dispositivo {id_dispositivo} no existe.")
+        return False
+    with estado_lock:
+        controlador = controladores.get(id_dispositivo)
+        if controlador is None:
+            controlador = crear_controlador(destino.ajustes)
+        controlador.setpoint = setpoint
+        controladores[id_dispositivo] = controlador
+    enviado = enviar_mensaje(f"s:{setpoint:.1f}", id_dispositivo)
+    if enviado:
+        _loop.call_soon_threadsafe(_iniciar_mpc, destino)
+    return enviado
+
+def _iniciar_mpc(dispositivo):
+    tarea = _tareas_mpc.get(dispositivo.id)
+    if tarea is None or tarea.done():
+        _tareas_mpc[dispositivo.id] = asyncio.ensure_future(_controlar_mpc(dispositivo))
+
+async def _controlar_mpc(dispositivo):
+    """Envía el mando directo p: a periodo fijo, el del lazo del firmware, mientras el dispositivo siga en modo predictivo.
+
+    El envío no depende de la llegada de telemetría: con lotes llega un mensaje cada varios
+    ciclos y un p: por mensaje podía superar el TIMEOUT_DIRECTO del firmware. El mando se
+    calcula con el último nivel recibido, que con lotes tiene hasta un lote de atraso.
+    """
+    loop = asyncio.get_running_loop()
+    proximo = loop.time()
+    while True:
+        with estado_lock:
+            controlador = controladores.get(dispositivo.id)  # Puede ser otro si g: cambió el periodo
+        if controlador is None:
+            _tareas_mpc.pop(dispositivo.id, None)
+            return
+        if dispositivo.conectado and dispositivo.nivel is not None:
+            await _enviar(dispositivo, f"{protocolo.PREFIJO_POTENCIA}{controlador.mando(dispositivo.nivel) * 100:.1f}")
+        # Plazos absolutos; si el bucle se atrasó más de un periodo se sigue desde ahora sin ráfagas
+        proximo = max(proximo + controlador.periodo, loop.time())
+        await asyncio.sleep(proximo - loop.time())
+
+def opciones_mpc(ajustes, controlador=None):
+    """Periodo y mando mínimo del controlador predictivo: los del reporte g: del firmware o los de un controlador."""
+    if controlador is not None:
+        return {"periodo": controlador.periodo, "mando_minimo": controlador.mando_minimo}
+    if ajustes is None:
+        return {}
+    return {"periodo": ajustes.periodo_ms / 1000, "mando_minimo": max(ajustes.pwm_llenado, ajustes.pwm_vaciado) / 255}
+
+def crear_controlador(ajustes, anterior=None):
+    """Controlador predictivo para los ajustes reportados; al reemplazar uno conserva su setpoint y último mando."""
+    # El periodo y el PWM mínimo que reportó el firmware definen la malla y los mandos posibles
+    if anterior is None:
+        return ControladorMPC(modelo_planta.cargar(), **opciones_mpc(ajustes))
+    controlador = ControladorMPC(anterior.modelo, **opciones_mpc(ajustes))
+    controlador.setpoint, controlador.u, controlador.sentido = anterior.setpoint, anterior.u, anterior.sentido
+    return controlador
+
+def desactivar_mpc(id_dispositivo):
+    """Devuelve el dispositivo a su PID de inmediato (sin esperar el timeout del mando directo)."""
+    with estado_lock:
+        controlador = controladores.pop(id_dispositivo, None)
+    if controlador is None:
+        return False
+    return enviar_mensaje(protocolo.PREFIJO_POTENCIA + "off", id_dispositivo)
+
+def ejecutar_comando(comando):
+    """Ejecuta un comando de la API ('[dispositivo] s:25.0', '[dispositivo] c:50.0,10.0', 'RECETA <dispositivos> <receta>',
+    RECETAS, 'CANCELAR <receta>', 'MPC <dispositivo> <setpoint|off>', LISTA, METRICAS, CSV) y devuelve la respuesta.
+
+    Los ajustes del lazo ('[dispositivo] k:<Kp>,<Ki>,<Kd>', h:, m:, r: y q:) se envían igual que s: y c:.
+    """
+    comando = comando.strip()
+    partes = comando.split(maxsplit=1)
+    if partes and partes[0].upper() == "RECETA":
+        argumentos = partes[1].split(maxsplit=1) if len(partes) == 2 else []
+        if len(argumentos) != 2:
+            return "error: use 'RECETA <dispositivo>[,<dispositivo>...] <receta>', por ejemplo 'RECETA tanque1 10,m60,20/120,m30,0'"
+        return iniciar_receta(argumentos[1], argumentos[0].split(","))
+    elif comando.upper() == "RECETAS":
+        with estado_lock:
+            ejecuciones = list(recetas.values())
+        return "\n".join(ejecucion.texto() for ejecucion in ejecuciones) or "No hay recetas."
+    elif partes and partes[0].upper() == "CANCELAR":
+        try:
+            numero = int(partes[1])
+        except (IndexError, ValueError):
+            return "error: use 'CANCELAR <número de receta>'"
+        with estado_lock:
+            ejecucion = recetas.get(numero)
+        if ejecucion is None:
+            return "error: receta desconocida"
+        if not ejecucion.activa:
+            return f"error: la receta {numero} ya terminó ({ejecucion.estado})"
+        return "ok" if cancelar_receta(numero) else "error: el servidor no está en marcha"
+    elif partes and partes[0].upper() == "MPC":
+        argumentos = partes[1].split() if len(partes) == 2 else []
+        if len(argumentos) != 2:
+            return "error: use 'MPC <dispositivo> <setpoint>' o 'MPC <dispositivo> off'"
+        if argumentos[1].lower() == "off":
+            enviado = desactivar_mpc(argumentos[0])
+        else:
+            try:
+                enviado = activar_mpc(argumentos[0], float(argumentos[1]))
+            except ValueError:
+                return "error: el setpoint debe ser un número (cm)"
+    elif len(partes) == 2 and partes[1].lower().startswith(COMANDOS_DISPOSITIVO):
+        enviado = enviar_mensaje(partes[1], partes[0])  # Enviar solo al dispositivo indicado
+    elif comando.lower().startswith(COMANDOS_DISPOSITIVO):
+        enviado = enviar_mensaje(comando)
+    elif comando.upper() == "LISTA":
+        lineas = []
+        for dispositivo in registro.todos():
+            estado = "conectado" if dispositivo.conectado else "desconectado"
+            lineas.append(f"{dispositivo.id}: {estado}, {len(dispositivo.telemetria)} muestras, {dispositivo.perdidas} perdidas, "
+                          f"{len(dispositivo.comandos)} comandos pendientes")
+        return "\n".join(lineas) or "No hay dispositivos."
+    elif comando.upper() == "METRICAS":
+        lineas = []
+        for dispositivo in registro.todos():
+            linea = (f"{dispositivo.id}: {dispositivo.metricas.texto()}; comandos: {dispositivo.comandos.texto()}; "
+                     f"ajustes: {dispositivo.texto_ajustes()}")
+            controlador = controladores.get(dispositivo.id)
+            if controlador is not None:
+                linea += f"; MPC: {controlador.texto()}"
+            lineas.append(linea)
+        cola = _cola_escritura.qsize() if _cola_escritura is not None else 0
+        lineas.append(f"escritura: {cola}/{MAX_LOTES_ESCRITURA} lotes en cola, {escritura['descartados']} descartados, "
+                      f"{escritura['errores']} con error")
+        return "\n".join(lineas)
+    elif comando.upper() == "CSV":
+        return exportar_csv()
+    else:
+        return ("Comando no reconocido. Use '[dispositivo] s:<altura>', '[dispositivo] c:<altura>,<diámetro>', "
+                "'[dispositivo] k:<Kp>,<Ki>,<Kd>', 'h:<histéresis>', 'm:<pwm llenado>[,<pwm vaciado>]', 'r:<periodo ms>', 'q:', "
+                "'RECETA <dispositivos> <receta>', 'RECETAS', 'CANCELAR <receta>', 'MPC <dispositivo> <setpoint|off>', "
+                "'LISTA', 'METRICAS' o 'CSV'.")
+    return "ok" if enviado else "error: no se pudo enviar el mensaje"
+
+async def servir(host=HOST, puerto=PUERTO, listo=None):
+    """Ejecuta el servidor WebSocket y la tarea de escritura hasta que se llame a detener()."""
+    global _loop, _cola_escritura, _detener
+    _loop = asyncio.get_running_loop()
+    _cola_escritura = asyncio.Queue(MAX_LOTES_ESCRITURA)
+    _detener = asyncio.Event()
+
+    escritor = asyncio.create_task(escribir_telemetria())
+    try:
+        # Sin compresión: el ESP32 no la usa y las tramas son de pocos bytes
+        async with serve(manejar_cliente, host, puerto, compression=None, process_request=validar_solicitud):
+            print(f"Servidor WebSocket corriendo en {host}:{puerto}")
+            if listo is not None:
+                listo.set()
+            await _detener.wait()
     finally:
-        server.shutdown()
-
-# Ejecutar el servidor WebSocket en un hilo separado
-def start_websocket_server():
-    print("Iniciando servidor WebSocket...")
-    server.run_forever()
-
-# Ejecutar enviar_comandos en un hilo separado
-def start_enviar_comandos():
-    print("Iniciando consola de comandos...")
-    enviar_comandos()
-
-# Iniciar ambos hilos
-websocket_thread = threading.Thread(target=start_websocket_server)
-websocket_thread.daemon = True
-websocket_thread.start()
-
-comandos_thread = threading.Thread(target=start_enviar_comandos)
-comandos_thread.daemon = True
-comandos_thread.start()
\ No newline at end of file
+        escritor.cancel()
+        for tarea in list(_tareas_recetas.values()):
+            tarea.cancel()
+        for tarea, _ in _despachadores.values():
+            tarea.cancel()
+        _despachadores.clear()
+        for tarea in list(_tareas_mpc.values()):
+            tarea.cancel()
+        _tareas_mpc.clear()
+        vaciar_cola_escritura()
+        exportar_csv()  # Dejar los CSV actualizados para las herramientas de análisis
+        sincronizar()
+        print("Servidor detenido.")
+
+def detener():
+    """Detiene el servidor en ejecución (se puede llamar desde cualquier hilo)."""
+    if _loop is not None and _detener is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_detener.set)
+
+def iniciar_en_hilo(host=HOST, puerto=PUERTO):
+    """Arranca el servidor en un hilo de fondo (para la interfaz gráfica) y espera a que esté escuchando."""
+    listo = threading.Event()
+
+    def ejecutar():
+        try:
+            asyncio.run(servir(host, puerto, listo))
+        except OSError as e:
+            print(f"Error al iniciar el servidor WebSocket: {e}")
+            listo.set()
+
+    hilo = threading.Thread(target=ejecutar, daemon=True)
+    hilo.start()
+    listo.wait()
+    return hilo
+
+async def enviar_comando_remoto(comando, host="localhost", puerto=PUERTO, token=TOKEN_CONTROL):
+    """Envía un comando a la API de un backend en ejecución y devuelve su respuesta.
+
+    Con token (por defecto LEVELSENSE_TOKEN) se envía la clave de la API en la cabecera Authorization.
+    """
+    cabeceras = {"Authorization": f"Bearer {token}"} if token else None
+    async with connect(f"ws://{host}:{puerto}{RUTA_CONTROL}", additional_headers=cabeceras) as websocket:
+        await websocket.send(comando)
+        return await websocket.recv()
+
+if __name__ == "__main__":
+    # python Backend.py                      -> ejecutar el servidor
+    # python Backend.py "<dispositivo> s:25" -> enviar un comando al servidor en ejecución
+    if len(sys.argv) > 1:
+        print(asyncio.run(enviar_comando_remoto(" ".join(sys.argv[1:]))))
+    else:
+        try:
+            asyncio.run(servir())
+        except KeyboardInterrupt:
+            print("\nServidor detenido manualmente.")
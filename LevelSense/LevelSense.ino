@@ -11,10 +11,93 @@ const uint16_t websocket_port = 8765;
 
 WebSocketsClient webSocket;
 
+// Identificador del dispositivo ante el backend; si queda vacío se deriva de la MAC (ls-XXXXXX)
+char deviceId[33] = "";
+
+// --- Protocolo de telemetría (ver protocolo.py) ---
+#define PROTOCOLO_VERSION 1
+#define TIPO_MUESTRA      1
+#define TIPO_LOTE         2
+
+// Muestras que se agrupan en cada trama (1 = una trama por ciclo de control, máximo 255)
+#define MUESTRAS_POR_LOTE 1
+
+// Periodo del ciclo de control (ms); con lotes se puede bajar a 10-20 ms sin saturar el enlace.
+// El sensor se lee en segundo plano, así que el ciclo puede ser tan corto como PERIODO_SENSOR_MS
+#define PERIODO_CONTROL_MS 100
+
+// Planificación (FreeRTOS): el control y el sensor corren en tareas periódicas de mayor prioridad
+// que loop(), que solo atiende la red y el registro por Serial
+#define NUCLEO_CONTROL       1     // El WiFi corre en el núcleo 0; loop() también corre en el 1, con menos prioridad
+#define PRIORIDAD_CONTROL    3
+#define PRIORIDAD_SENSOR     2     // loop() corre con prioridad 1
+#define TOLERANCIA_ATRASO_US 2000  // Un ciclo que empieza más tarde que esto cuenta como atraso
+#define MUESTRAS_EN_COLA     32    // Muestras que esperan a la red; si se llena se descartan (hueco en la secuencia)
+#define PERIODO_REPORTE_MS   1000  // Cada cuánto se envía el estado del lazo (o:...)
+
+// 1 = imprimir por Serial el detalle de cada ciclo; desactivar para periodos cortos
+#define REGISTRO_SERIAL 1
+
+// Trama binaria de una muestra: 18 bytes, little-endian, sin relleno
+struct __attribute__((packed)) TramaMuestra {
+  uint8_t  version;
+  uint8_t  tipo;
+  uint32_t seq;       // Número de secuencia
+  uint32_t t_ms;      // Tiempo del dispositivo (millis)
+  float    nivel;     // cm
+  float    potencia;  // %
+};
+
+// Lote binario: cabecera de 7 bytes seguida de registros de 12 bytes
+struct __attribute__((packed)) CabeceraLote {
+  uint8_t  version;
+  uint8_t  tipo;
+  uint8_t  cantidad;
+  uint32_t seq;       // Secuencia de la primera muestra del lote
+};
+
+struct __attribute__((packed)) RegistroLote {
+  uint32_t t_ms;
+  float    nivel;
+  float    potencia;
+};
+
+struct __attribute__((packed)) TramaLote {
+  CabeceraLote cabecera;
+  RegistroLote muestras[MUESTRAS_POR_LOTE];
+};
+
+// Muestra que la tarea de control deja en la cola para que loop() la envíe
+struct MuestraControl {
+  uint32_t seq;
+  uint32_t t_ms;
+  float    nivel;
+  float    potencia;
+  int8_t   bomba;
+};
+
+bool usarBinario = false;   // Se activa solo si el backend responde "f:bin"
+uint32_t secuencia = 0;     // Solo la modifica la tarea de control
+QueueHandle_t colaMuestras;
+TramaLote lote;
+uint8_t muestrasEnLote = 0;
+char mensajeTexto[64 + MUESTRAS_POR_LOTE * 32];  // Buffer fijo para el formato de texto compacto
+uint32_t ultimoComando = 0;  // Secuencia del último comando aplicado (s:25.0#17); un reintento repetido solo se vuelve a confirmar
+
 // Sensor ultrasónico
 #define TRIGGER_PIN 14
 #define ECHO_PIN    13
 
+// Lectura no bloqueante: el eco se mide por interrupción y loop() nunca espera al sensor
+#define PERIODO_SENSOR_MS  30     // Entre disparos (el HC-SR04 necesita ~25 ms para que se apaguen los ecos)
+#define TIMEOUT_ECO_US     25000  // Un eco más largo se descarta (~4 m); debe ser menor que el periodo
+#define MUESTRAS_MEDIANA   5      // Lecturas del filtro de mediana (impar, máximo 15)
+#define ALFA_EMA           0.3    // Peso de la lectura nueva en el filtro exponencial (1.0 = sin filtro)
+
+#if PERIODO_SENSOR_MS * 1000 <= TIMEOUT_ECO_US
+#error "PERIODO_SENSOR_MS debe ser mayor que TIMEOUT_ECO_US"
+#endif
+
 // Puente H
 #define IN1     25
 #define IN2     27
@@ -30,10 +113,33 @@ float setpoint = 0.0;          // Nivel deseado del líquido (cm)
 float hysteresis = 1.0;         // Histeresis
 float power=0.0; // potencia de los motores
 
+// --- Mando directo (p:<potencia>) del control predictivo del backend (mpc.py) ---
+#define TIMEOUT_DIRECTO_MS 1000  // Sin un p: nuevo en este tiempo se vuelve al PID
+bool modoDirecto = false;
+float potenciaDirecta = 0.0;     // %, de -100 (vaciar) a 100 (llenar)
+uint32_t tUltimoDirecto = 0;
+portMUX_TYPE muxDirecto = portMUX_INITIALIZER_UNLOCKED;
+
 
 // Variables del sensor ultrasónico
 long duration;
 float distance;
+portMUX_TYPE muxSensor = portMUX_INITIALIZER_UNLOCKED;  // Protege waterLevel entre tareas
+
+// Estado compartido con la interrupción del eco
+volatile uint32_t ecoSubida = 0;    // micros() del flanco de subida
+volatile uint32_t ecoDuracion = 0;  // Ancho del pulso de eco (us)
+volatile bool ecoIniciado = false;
+volatile bool ecoListo = false;
+
+bool midiendo = false;        // Hay un disparo esperando su eco
+uint32_t ecosPerdidos = 0;    // Mediciones descartadas por falta de eco
+
+// Filtro: mediana de las últimas lecturas seguida de un promedio exponencial
+float lecturas[MUESTRAS_MEDIANA];
+uint8_t cantidadLecturas = 0;
+uint8_t posicionLectura = 0;
+bool nivelInicializado = false;
 
 // --- PID ---
 float Kp = 0.15;
@@ -44,6 +150,25 @@ float prev_error = 0.0;
 unsigned long last_time = 0;
 int bomba_estado = 0; // 0=apagada, 1=llenando, -1=vaciando
 
+// --- Ajustes en tiempo de ejecución (k:, h:, m:, r:) que se reportan con g: ---
+#define PERIODO_MINIMO_MS 20
+#define PERIODO_MAXIMO_MS 1000
+uint32_t periodoControlMs = PERIODO_CONTROL_MS;
+int pwmMinimoLlenado = 65;
+int pwmMinimoVaciado = 65;
+bool reiniciarIntegral = false;  // Lo pide webSocketEvent al cambiar las ganancias; lo atiende la tarea de control
+// Protege setpoint, Kp, Ki, Kd, hysteresis, reiniciarIntegral, los PWM mínimos y periodoControlMs: los escribe
+// webSocketEvent desde loop() y los lee tareaControl, que tiene más prioridad y puede desalojarla en medio de una escritura
+portMUX_TYPE muxAjustes = portMUX_INITIALIZER_UNLOCKED;
+
+// --- Estadísticas del lazo de control (las lee loop() para el reporte o:...) ---
+uint32_t ciclosControl = 0;
+uint32_t atrasosControl = 0;    // Ciclos que empezaron con más de TOLERANCIA_ATRASO_US de retraso o no cupieron en el periodo
+uint32_t dtMaximoUs = 0;        // Mayor periodo medido desde el último reporte
+uint32_t ejecucionMaximaUs = 0; // Mayor duración de un ciclo desde el último reporte
+portMUX_TYPE muxLazo = portMUX_INITIALIZER_UNLOCKED;
+uint32_t ultimoReporte = 0;
+
 // ==== Función de conexión WiFi ====
 void connectToWiFi() {
   Serial.print("Conectando a WiFi: ");
@@ -65,79 +190,220 @@ void connectToWebSocket() {
   webSocket.onEvent(webSocketEvent);
 }
 
-// ==== Función de lectura del sensor ultrasónico ====
-void readUltrasonicSensor() {
+// ==== Lectura no bloqueante del sensor ultrasónico ====
+void IRAM_ATTR isrEco() {
+  uint32_t ahora = micros();
+  if (digitalRead(ECHO_PIN) == HIGH) {
+    ecoSubida = ahora;
+    ecoIniciado = true;
+  } else if (ecoIniciado) {
+    ecoDuracion = ahora - ecoSubida;
+    ecoIniciado = false;
+    ecoListo = true;
+  }
+}
+
+void dispararSensor() {
+  ecoIniciado = false;
+  ecoListo = false;
   digitalWrite(TRIGGER_PIN, LOW);
   delayMicroseconds(2);
   digitalWrite(TRIGGER_PIN, HIGH);
   delayMicroseconds(10);
   digitalWrite(TRIGGER_PIN, LOW);
+  midiendo = true;
+}
+
+// Se llama cada PERIODO_SENSOR_MS desde tareaSensor: recoge el eco del disparo anterior y vuelve a disparar
+void actualizarSensor() {
+  if (midiendo) {
+    midiendo = false;
+    if (ecoListo && ecoDuracion <= TIMEOUT_ECO_US) {
+      procesarEco(ecoDuracion);
+    } else {
+      ecosPerdidos++;
+    }
+  }
+  dispararSensor();
+}
+
+float medianaLecturas() {
+  float orden[MUESTRAS_MEDIANA];
+  for (uint8_t i = 0; i < cantidadLecturas; i++) {
+    // Inserción ordenada (ventana pequeña)
+    float valor = lecturas[i];
+    int8_t j = i - 1;
+    while (j >= 0 && orden[j] > valor) {
+      orden[j + 1] = orden[j];
+      j--;
+    }
+    orden[j + 1] = valor;
+  }
+  return orden[cantidadLecturas / 2];
+}
 
-  duration = pulseIn(ECHO_PIN, HIGH);
+void procesarEco(uint32_t ancho) {
+  duration = ancho;
   distance = duration * 0.034 / 2;  // Convertir duración a distancia en cm
 
   // Calcular la altura del líquido en el contenedor
-  waterLevel = containerHeight - distance*1.04;
-  if (waterLevel < 0) waterLevel = 0;  // Asegurarse de que no sea negativo
-  if (waterLevel > containerHeight) waterLevel = containerHeight;  // Limitar al máximo
+  float nivel = containerHeight - distance*1.04;
+  if (nivel < 0) nivel = 0;  // Asegurarse de que no sea negativo
+  if (nivel > containerHeight) nivel = containerHeight;  // Limitar al máximo
+
+  // La mediana quita los ecos espurios aislados; el promedio exponencial suaviza el ruido restante
+  lecturas[posicionLectura] = nivel;
+  posicionLectura = (posicionLectura + 1) % MUESTRAS_MEDIANA;
+  if (cantidadLecturas < MUESTRAS_MEDIANA) cantidadLecturas++;
+  float mediana = medianaLecturas();
+  static float filtrado = 0.0;
+  if (!nivelInicializado) {
+    filtrado = mediana;
+    nivelInicializado = true;
+  } else {
+    filtrado += ALFA_EMA * (mediana - filtrado);
+  }
+
+  taskENTER_CRITICAL(&muxSensor);
+  waterLevel = filtrado;
+  taskEXIT_CRITICAL(&muxSensor);
+}
 
-  Serial.print("Distancia medida: ");
-  Serial.print(distance);
-  Serial.println(" cm");
+// ==== Tareas periódicas ====
+void tareaSensor(void* parametro) {
+  TickType_t despertar = xTaskGetTickCount();
+  for (;;) {
+    actualizarSensor();
+    vTaskDelayUntil(&despertar, pdMS_TO_TICKS(PERIODO_SENSOR_MS));
+  }
+}
 
-  Serial.print("Altura del líquido: ");
-  Serial.print(waterLevel);
-  Serial.println(" cm");
+// Ciclo de control a periodo fijo: el dt del PID es el medido, no el nominal
+void tareaControl(void* parametro) {
+  TickType_t despertar = xTaskGetTickCount();
+  int64_t anterior = esp_timer_get_time();
+  for (;;) {
+    taskENTER_CRITICAL(&muxAjustes);
+    uint32_t periodoMs = periodoControlMs;  // Puede cambiar con r: entre ciclos
+    taskEXIT_CRITICAL(&muxAjustes);
+    uint32_t periodoUs = periodoMs * 1000UL;
+    vTaskDelayUntil(&despertar, pdMS_TO_TICKS(periodoMs));
+    int64_t inicio = esp_timer_get_time();
+    uint32_t dtUs = (uint32_t)(inicio - anterior);
+    anterior = inicio;
+
+    // La muestra lleva el instante de inicio del ciclo (ms desde el arranque, la base de millis()):
+    // así el periodo y el jitter que mide el backend son los del lazo de control y no los del sensor
+    uint32_t tCiclo = (uint32_t)(inicio / 1000);
+    taskENTER_CRITICAL(&muxSensor);
+    float nivel = waterLevel;
+    taskEXIT_CRITICAL(&muxSensor);
+
+    // Mando directo vigente: se aplica tal cual; si el backend deja de enviarlo, vuelve el PID
+    taskENTER_CRITICAL(&muxDirecto);
+    if (modoDirecto && millis() - tUltimoDirecto > TIMEOUT_DIRECTO_MS) modoDirecto = false;
+    bool directo = modoDirecto;
+    float u = potenciaDirecta / 100.0;
+    taskEXIT_CRITICAL(&muxDirecto);
+
+    if (directo) {
+      accionarBombas(u);
+      bomba_estado = (u > 0.01) ? 1 : (u < -0.01) ? -1 : 0;
+      // Al volver al PID no arrastra integral ni derivada de antes del mando directo
+      taskENTER_CRITICAL(&muxAjustes);
+      float objetivo = setpoint;
+      taskEXIT_CRITICAL(&muxAjustes);
+      integral = 0.0;
+      prev_error = objetivo - nivel;
+    } else {
+      controlMotors(nivel, dtUs / 1e6);
+    }
+
+    // La red la atiende loop(); si está atrasada la muestra se descarta y el backend ve el hueco en la secuencia
+    MuestraControl muestra = {++secuencia, tCiclo, nivel, power, (int8_t)bomba_estado};
+    xQueueSend(colaMuestras, &muestra, 0);
+
+    uint32_t ejecucionUs = (uint32_t)(esp_timer_get_time() - inicio);
+    taskENTER_CRITICAL(&muxLazo);
+    ciclosControl++;
+    if (dtUs > periodoUs + TOLERANCIA_ATRASO_US || ejecucionUs > periodoUs) {
+      atrasosControl++;
+    }
+    if (dtUs > dtMaximoUs) dtMaximoUs = dtUs;
+    if (ejecucionUs > ejecucionMaximaUs) ejecucionMaximaUs = ejecucionUs;
+    taskEXIT_CRITICAL(&muxLazo);
+  }
 }
 
-void controlMotors() {
-  float error = setpoint - waterLevel;
-  unsigned long now = millis();
-  float dt = 0.1; // 100 ms en segundos
+void controlMotors(float nivel, float dt) {
+  // Setpoint, ganancias e histéresis vigentes (los cambia webSocketEvent con s:, k: y h:)
+  taskENTER_CRITICAL(&muxAjustes);
+  if (dt <= 0) dt = periodoControlMs / 1000.0;  // Periodo medido en segundos
+  float objetivo = setpoint;
+  float kp = Kp, ki = Ki, kd = Kd, banda = hysteresis;
+  if (reiniciarIntegral) {
+    integral = 0.0;
+    reiniciarIntegral = false;
+  }
+  taskEXIT_CRITICAL(&muxAjustes);
+  float error = objetivo - nivel;
 
   // Integral y derivada
   integral += error * dt;
   float derivative = (error - prev_error) / dt;
 
   // Ley de control PID
-  float u = Kp * error + Ki * integral + Kd * derivative;
+  float u = kp * error + ki * integral + kd * derivative;
 
   // Saturación de la señal de control
   if (u > 1.0) u = 1.0;
   if (u < -1.0) u = -1.0;
 
   // --- HISTERESIS ---
-  float upper = setpoint + hysteresis / 2.0;
-  float lower = setpoint - hysteresis / 2.0;
+  float upper = objetivo + banda / 2.0;
+  float lower = objetivo - banda / 2.0;
 
-  if (waterLevel < lower) {
+  if (nivel < lower) {
     bomba_estado = 1; // Llenar
-  } else if (waterLevel > upper) {
+  } else if (nivel > upper) {
     bomba_estado = -1; // Vaciar
   } // Si está dentro de la banda, mantiene el último estado
 
-  if (bomba_estado == 1 && u > 0.01) {
+  if ((bomba_estado == 1 && u > 0.01) || (bomba_estado == -1 && u < -0.01)) {
+    accionarBombas(u);
+  } else {
+    accionarBombas(0.0);
+  }
+
+  prev_error = error;
+}
+
+// Aplica el mando u (-1 a 1) a las bombas: positivo llena, negativo vacía, |u| <= 0.01 las apaga
+void accionarBombas(float u) {
+  taskENTER_CRITICAL(&muxAjustes);  // PWM mínimos vigentes (los cambia webSocketEvent con m:)
+  int minimoLlenado = pwmMinimoLlenado, minimoVaciado = pwmMinimoVaciado;
+  taskEXIT_CRITICAL(&muxAjustes);
+
+  if (u > 0.01) {
     // Llenar
     int pwm = (int)(u * 255.0);
-    if (pwm < 65) pwm = 65;
+    if (pwm < minimoLlenado) pwm = minimoLlenado;
     if (pwm > 255) pwm = 255;
     digitalWrite(IN1, HIGH);
     digitalWrite(IN2, LOW);
     analogWrite(PWM1, pwm);
     analogWrite(PWM2, 0);
     power = u * 100.0;
-    Serial.println("PID: Llenando");
-  } else if (bomba_estado == -1 && u < -0.01) {
+  } else if (u < -0.01) {
     // Vaciar
     int pwm = (int)(-u * 255.0);
-    if (pwm < 65) pwm = 65;
+    if (pwm < minimoVaciado) pwm = minimoVaciado;
     if (pwm > 255) pwm = 255;
     digitalWrite(IN1, LOW);
     digitalWrite(IN2, HIGH);
     analogWrite(PWM1, 0);
     analogWrite(PWM2, pwm);
     power = u * 100.0;
-    Serial.println("PID: Vaciando");
   } else {
     // Apagar ambas bombas
     digitalWrite(IN1, LOW);
@@ -145,10 +411,82 @@ void controlMotors() {
     analogWrite(PWM1, 0);
     analogWrite(PWM2, 0);
     power = 0;
-    Serial.println("PID: Apagando bombas");
   }
+}
 
-  prev_error = error;
+// ==== Envío de telemetría ====
+// Parámetros del lazo en uso: g:<Kp>,<Ki>,<Kd>,<histéresis>,<pwm llenado>,<pwm vaciado>,<periodo ms>
+void enviarAjustes() {
+  taskENTER_CRITICAL(&muxAjustes);
+  float kp = Kp, ki = Ki, kd = Kd, banda = hysteresis;
+  int minimoLlenado = pwmMinimoLlenado, minimoVaciado = pwmMinimoVaciado;
+  uint32_t periodoMs = periodoControlMs;
+  taskEXIT_CRITICAL(&muxAjustes);
+  snprintf(mensajeTexto, sizeof(mensajeTexto), "g:%.4f,%.4f,%.4f,%.2f,%d,%d,%lu", kp, ki, kd, banda,
+           minimoLlenado, minimoVaciado, (unsigned long)periodoMs);
+  webSocket.sendTXT(mensajeTexto);
+}
+
+void enviarMuestra(const MuestraControl& muestra) {
+  uint32_t ahora = muestra.t_ms;  // Reloj monotónico del dispositivo al empezar el ciclo de control
+
+  if (MUESTRAS_POR_LOTE > 1) {
+    // Acumular la muestra con su tiempo de medición y enviar cuando el lote esté completo
+    if (muestrasEnLote > 0 && muestra.seq != lote.cabecera.seq + muestrasEnLote) {
+      enviarLote();  // Hubo muestras descartadas: el lote debe tener secuencias consecutivas
+    }
+    if (muestrasEnLote == 0) lote.cabecera.seq = muestra.seq;
+    lote.muestras[muestrasEnLote] = {ahora, muestra.nivel, muestra.potencia};
+    muestrasEnLote++;
+    if (muestrasEnLote == MUESTRAS_POR_LOTE) enviarLote();
+    return;
+  }
+
+  if (usarBinario) {
+    TramaMuestra trama = {PROTOCOLO_VERSION, TIPO_MUESTRA, muestra.seq, ahora, muestra.nivel, muestra.potencia};
+    webSocket.sendBIN((uint8_t*)&trama, sizeof(trama));
+  } else {
+    // Texto compacto sin objetos String: t:<seq>,<t_ms>,<nivel>,<potencia>
+    snprintf(mensajeTexto, sizeof(mensajeTexto), "t:%lu,%lu,%.1f,%.1f",
+             (unsigned long)muestra.seq, (unsigned long)ahora, muestra.nivel, muestra.potencia);
+    webSocket.sendTXT(mensajeTexto);
+  }
+}
+
+// Estado del lazo: o:<ciclos>,<atrasos>,<dt_max_us>,<ejecucion_max_us>,<ecos_perdidos>
+void enviarEstadoLazo() {
+  taskENTER_CRITICAL(&muxLazo);
+  uint32_t ciclos = ciclosControl;
+  uint32_t atrasos = atrasosControl;
+  uint32_t dtMaximo = dtMaximoUs;
+  uint32_t ejecucionMaxima = ejecucionMaximaUs;
+  dtMaximoUs = 0;
+  ejecucionMaximaUs = 0;
+  taskEXIT_CRITICAL(&muxLazo);
+
+  snprintf(mensajeTexto, sizeof(mensajeTexto), "o:%lu,%lu,%lu,%lu,%lu", (unsigned long)ciclos, (unsigned long)atrasos,
+           (unsigned long)dtMaximo, (unsigned long)ejecucionMaxima, (unsigned long)ecosPerdidos);
+  webSocket.sendTXT(mensajeTexto);
+}
+
+void enviarLote() {
+  lote.cabecera.version = PROTOCOLO_VERSION;
+  lote.cabecera.tipo = TIPO_LOTE;
+  lote.cabecera.cantidad = muestrasEnLote;
+
+  if (usarBinario) {
+    size_t largo = sizeof(CabeceraLote) + muestrasEnLote * sizeof(RegistroLote);
+    webSocket.sendBIN((uint8_t*)&lote, largo);
+  } else {
+    // l:<seq>;<t_ms>,<nivel>,<potencia>;...
+    int largo = snprintf(mensajeTexto, sizeof(mensajeTexto), "l:%lu", (unsigned long)lote.cabecera.seq);
+    for (uint8_t i = 0; i < muestrasEnLote && largo < (int)sizeof(mensajeTexto); i++) {
+      largo += snprintf(mensajeTexto + largo, sizeof(mensajeTexto) - largo, ";%lu,%.1f,%.1f",
+                        (unsigned long)lote.muestras[i].t_ms, lote.muestras[i].nivel, lote.muestras[i].potencia);
+    }
+    webSocket.sendTXT(mensajeTexto);
+  }
+  muestrasEnLote = 0;
 }
 
 // ==== Manejo de eventos del WebSocket ====
@@ -160,12 +498,49 @@ void webSocketEvent(WStype_t type, uint8_t * payload, size_t length) {
       break;
     case WStype_CONNECTED:
       Serial.println("Conectado al WebSocket!");
-      webSocket.sendTXT("ESP32 conectado");
+      muestrasEnLote = 0;  // Descartar un lote a medias de la conexión anterior
+      // Anunciar versión y formatos soportados; hasta recibir "f:bin" se envía texto
+      usarBinario = false;
+      snprintf(mensajeTexto, sizeof(mensajeTexto), "hola:id=%s;v=%d;f=bin|txt;a=1", deviceId, PROTOCOLO_VERSION);
+      webSocket.sendTXT(mensajeTexto);
+      enviarAjustes();  // El backend conoce los parámetros del lazo desde la conexión
       break;
-    case WStype_TEXT:
+    case WStype_TEXT: {
+      // Mando directo del control predictivo (p:<potencia> o p:off); llega en cada ciclo, no se registra
+      if (msg.startsWith("p:")) {
+        taskENTER_CRITICAL(&muxDirecto);
+        modoDirecto = !msg.startsWith("p:off");
+        if (modoDirecto) {
+          potenciaDirecta = constrain(msg.substring(2).toFloat(), -100.0, 100.0);
+          tUltimoDirecto = millis();
+        }
+        taskEXIT_CRITICAL(&muxDirecto);
+        if (msg.indexOf('#') == -1) break;  // p:off se envía numerado y se confirma como los demás comandos
+      }
+
       Serial.print("Mensaje recibido: ");
       Serial.println(msg);
 
+      // Comando numerado (<comando>#<seq>): se confirma con a:<seq> y un reintento ya aplicado no se repite
+      uint32_t seqComando = 0;
+      int separador = msg.lastIndexOf('#');
+      if (separador != -1) {
+        seqComando = strtoul(msg.c_str() + separador + 1, NULL, 10);
+        msg = msg.substring(0, separador);
+        if (seqComando != 0 && seqComando == ultimoComando) {
+          snprintf(mensajeTexto, sizeof(mensajeTexto), "a:%lu", (unsigned long)seqComando);
+          webSocket.sendTXT(mensajeTexto);
+          break;
+        }
+      }
+
+      // Formato de telemetría negociado por el backend (f:bin o f:txt)
+      if (msg.startsWith("f:")) {
+        usarBinario = (msg.substring(2) == "bin");
+        Serial.print("Formato de telemetría: ");
+        Serial.println(usarBinario ? "binario" : "texto");
+      }
+
       // Manejar mensaje de configuración (c:<altura>,<diámetro>)
       if (msg.startsWith("c:")) {
         String configStr = msg.substring(2); // Extraer el valor después de "c:"
@@ -189,11 +564,84 @@ void webSocketEvent(WStype_t type, uint8_t * payload, size_t length) {
       // Manejar mensaje de setpoint (s:<altura>)
       if (msg.startsWith("s:")) {
         String setpointStr = msg.substring(2); // Extraer el valor después de "s:"
-        setpoint = setpointStr.toFloat();      // Actualizar el setpoint
+        float nuevo = setpointStr.toFloat();
+        taskENTER_CRITICAL(&muxAjustes);        // Lo lee tareaControl, que puede desalojar a loop()
+        setpoint = nuevo;
+        taskEXIT_CRITICAL(&muxAjustes);
         Serial.print("Nuevo setpoint recibido: ");
-        Serial.println(setpoint);
+        Serial.println(nuevo);
+      }
+
+      // Ganancias del PID (k:<Kp>,<Ki>,<Kd>): la integral acumulada con las ganancias anteriores se descarta
+      if (msg.startsWith("k:")) {
+        float kp, ki, kd;
+        if (sscanf(msg.c_str() + 2, "%f,%f,%f", &kp, &ki, &kd) == 3 && kp >= 0 && ki >= 0 && kd >= 0) {
+          taskENTER_CRITICAL(&muxAjustes);
+          Kp = kp;
+          Ki = ki;
+          Kd = kd;
+          reiniciarIntegral = true;
+          taskEXIT_CRITICAL(&muxAjustes);
+        } else {
+          Serial.println("Error: Use k:<Kp>,<Ki>,<Kd> con valores no negativos");
+        }
+        enviarAjustes();
+      }
+
+      // Histéresis de la bomba (h:<cm>)
+      if (msg.startsWith("h:")) {
+        float banda = msg.substring(2).toFloat();
+        if (banda >= 0 && banda <= containerHeight) {
+          taskENTER_CRITICAL(&muxAjustes);
+          hysteresis = banda;
+          taskEXIT_CRITICAL(&muxAjustes);
+        } else {
+          Serial.println("Error: Histéresis fuera de rango");
+        }
+        enviarAjustes();
+      }
+
+      // PWM mínimo de las bombas (m:<llenado>[,<vaciado>], 0 a 255)
+      if (msg.startsWith("m:")) {
+        int llenado, vaciado;
+        int leidos = sscanf(msg.c_str() + 2, "%d,%d", &llenado, &vaciado);
+        if (leidos == 1) vaciado = llenado;
+        if (leidos >= 1 && llenado >= 0 && llenado <= 255 && vaciado >= 0 && vaciado <= 255) {
+          taskENTER_CRITICAL(&muxAjustes);
+          pwmMinimoLlenado = llenado;
+          pwmMinimoVaciado = vaciado;
+          taskEXIT_CRITICAL(&muxAjustes);
+        } else {
+          Serial.println("Error: Use m:<pwm llenado>[,<pwm vaciado>] entre 0 y 255");
+        }
+        enviarAjustes();
+      }
+
+      // Periodo del lazo de control (r:<ms>); el dt del PID es el medido, así que cambia en el ciclo siguiente
+      if (msg.startsWith("r:")) {
+        long periodo = msg.substring(2).toInt();
+        if (periodo >= PERIODO_MINIMO_MS && periodo <= PERIODO_MAXIMO_MS) {
+          taskENTER_CRITICAL(&muxAjustes);
+          periodoControlMs = periodo;
+          taskEXIT_CRITICAL(&muxAjustes);
+        } else {
+          Serial.println("Error: Periodo fuera de rango (20 a 1000 ms)");
+        }
+        enviarAjustes();
+      }
+
+      // Consulta de los parámetros en uso (q:)
+      if (msg.startsWith("q:")) {
+        enviarAjustes();
+      }
+
+      if (seqComando != 0) {
+        ultimoComando = seqComando;
+        snprintf(mensajeTexto, sizeof(mensajeTexto), "a:%lu", (unsigned long)seqComando);
+        webSocket.sendTXT(mensajeTexto);
       }
       break;
+    }
     case WStype_ERROR:
       Serial.println("Error en el WebSocket");
       break;
@@ -208,6 +656,7 @@ void setup() {
   // Configurar pines del sensor ultrasónico
   pinMode(TRIGGER_PIN, OUTPUT);
   pinMode(ECHO_PIN, INPUT);
+  attachInterrupt(digitalPinToInterrupt(ECHO_PIN), isrEco, CHANGE);
 
   // Configurar pines de las bombas
   pinMode(IN1, OUTPUT);
@@ -215,6 +664,13 @@ void setup() {
   pinMode(PWM1, OUTPUT);
   pinMode(PWM2, OUTPUT);
 
+  // Identificador por defecto a partir de la MAC
+  if (deviceId[0] == '\0') {
+    snprintf(deviceId, sizeof(deviceId), "ls-%06lX", (unsigned long)(ESP.getEfuseMac() >> 24) & 0xFFFFFF);
+  }
+  Serial.print("Identificador del dispositivo: ");
+  Serial.println(deviceId);
+
   // Conectar a WiFi y WebSocket
   connectToWiFi();
   connectToWebSocket();
@@ -223,31 +679,43 @@ void setup() {
   setpoint = 0.0;
   Serial.print("Setpoint inicial: ");
   Serial.println(setpoint);
+
+  // Tareas periódicas del sensor y del control; loop() queda para la red y el registro
+  colaMuestras = xQueueCreate(MUESTRAS_EN_COLA, sizeof(MuestraControl));
+  xTaskCreatePinnedToCore(tareaSensor, "sensor", 4096, NULL, PRIORIDAD_SENSOR, NULL, NUCLEO_CONTROL);
+  xTaskCreatePinnedToCore(tareaControl, "control", 4096, NULL, PRIORIDAD_CONTROL, NULL, NUCLEO_CONTROL);
 }
 
 void loop() {
+  // Reconectar bloquea solo esta tarea: el sensor y el control siguen corriendo
   if (WiFi.status() != WL_CONNECTED) {
     Serial.println("WiFi desconectado. Reintentando...");
     connectToWiFi();
   }
   webSocket.loop();
 
-  // Leer el sensor ultrasónico
-  readUltrasonicSensor();
-
-  // Controlar las bombas
-  controlMotors();
+  // Enviar las muestras que dejó la tarea de control
+  MuestraControl muestra;
+  while (xQueueReceive(colaMuestras, &muestra, 0) == pdTRUE) {
+#if REGISTRO_SERIAL
+    Serial.print("Altura del líquido (filtrada): ");
+    Serial.print(muestra.nivel);
+    Serial.print(" cm, potencia: ");
+    Serial.print(muestra.potencia);
+    Serial.println(muestra.bomba == 1 ? " % (llenando)" : muestra.bomba == -1 ? " % (vaciando)" : " %");
+#endif
+    if (webSocket.isConnected()) {
+      enviarMuestra(muestra);
+    } else {
+      Serial.println("WebSocket no conectado, no se envía el mensaje.");
+    }
+  }
 
-  // Enviar datos al servidor WebSocket
-  //float mappedOutput = 255 / 255.0 * 100.0; // Mapear output de -255 a 255 a -100 a 100
-  String mensaje = "[" + String(waterLevel, 1) + "," + String(power, 1) + "]";
-  Serial.print("Enviando: ");
-  Serial.println(mensaje);
-  if (webSocket.isConnected()) {
-    webSocket.sendTXT(mensaje);
-  } else {
-    Serial.println("WebSocket no conectado, no se envía el mensaje.");
+  // Reportar atrasos del lazo y ecos perdidos como telemetría
+  if (millis() - ultimoReporte >= PERIODO_REPORTE_MS) {
+    ultimoReporte = millis();
+    if (webSocket.isConnected()) enviarEstadoLazo();
   }
 
-  delay(100);  // Ejecutar el control cada 100 ms
-}
\ No newline at end of file
+  vTaskDelay(1);  // Ceder el núcleo hasta el próximo tick
+}
@@ -1,25 +1,75 @@
-import csv
+import os
 import sys
-import math
-import subprocess
-import atexit
+import time
+
+# Instante de arranque: el tiempo hasta que la interfaz y la gráfica están listas se mide desde aquí
+INICIO = time.perf_counter()
+
+def hay_pantalla():
+    """En Linux sin X11 ni Wayland (PC de panel sin monitor) no se puede abrir la ventana, salvo con QT_QPA_PLATFORM."""
+    variables = ("DISPLAY", "WAYLAND_DISPLAY", "QT_QPA_PLATFORM")
+    return not sys.platform.startswith("linux") or any(os.environ.get(variable) for variable in variables)
+
+# Sin pantalla se pasa al tablero de texto antes de importar numpy y PyQt5 (ver el final del archivo)
+if __name__ == "__main__" and ("--sin-pantalla" in sys.argv or not hay_pantalla()):
+    import panel
+    panel.main([argumento for argumento in sys.argv[1:] if argumento != "--sin-pantalla"], INICIO)
+    sys.exit(0)
+
+from collections import deque
 import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QWidget, QVBoxLayout, QMessageBox, QHBoxLayout,
     QGraphicsDropShadowEffect, QProgressBar, QPushButton, QDialog, QLineEdit, QFormLayout, QComboBox
 )
 from PyQt5.QtGui import QPixmap, QFont, QColor, QDoubleValidator
-from PyQt5.QtCore import Qt, QTimer
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from matplotlib.ticker import MaxNLocator
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
 
-from Backend import enviar_mensaje
+from decimacion import lttb, minmax
+from Backend import enviar_mensaje, registro, suscribir, desuscribir, iniciar_en_hilo, detener
+from unidades import GeometriaTanque, cargar_tabla
 
 # ========================== FRONTEND - INTERFAZ GRÁFICA ==========================
+# matplotlib se importa recién al crear la gráfica (crear_grafica), después de mostrar la ventana
+
+# Cuadros por segundo máximos de la gráfica en vivo
+FPS_GRAFICA = 30
+
+# Ventanas de tiempo de la gráfica: segundos visibles, segundos por unidad del eje X y nombre de la unidad.
+# La primera es la ventana en vivo (buffer reciente); las demás se consultan al historial.
+VENTANAS_GRAFICA = {
+    "100 s": (100, 1, "s"),
+    "10 min": (600, 60, "min"),
+    "1 h": (3600, 60, "min"),
+    "1 día": (86400, 3600, "h"),
+    "7 días": (604800, 3600, "h"),
+}
+VENTANA_EN_VIVO = "100 s"
+
+# Puntos máximos que se piden al historial (además del límite de 2 por píxel) y cada cuánto se vuelve a consultar (s)
+MAX_PUNTOS_GRAFICA = 2000
+CONSULTA_HISTORIAL_CADA = 1.0
+
+def poligono_area(tiempo, valores, base=None):
+    """Vértices del área entre la curva y la base (por defecto y=0, como fill_between) como arreglo Nx2."""
+    if base is None:
+        base = np.zeros(len(tiempo))
+    return np.concatenate((
+        np.column_stack((tiempo, valores)),
+        np.column_stack((tiempo[::-1], base[::-1])),
+    ))
+
+class PuenteTelemetria(QObject):
+    """Pasa las muestras del hilo del servidor WebSocket al hilo de la interfaz mediante una señal."""
+    muestra_recibida = pyqtSignal(str, float, float, float)
+
+    def __call__(self, dispositivo, nivel, potencia, tiempo):
+        # Se ejecuta en el hilo del backend; Qt encola la señal hacia el hilo de la interfaz
+        self.muestra_recibida.emit(dispositivo, float(nivel), float(potencia), float(tiempo))
+
 
 class CustomDialog(QDialog):
-    def __init__(self, altura_maxima, diametro):
+    def __init__(self, altura_maxima, diametro, dispositivo=None):
         super().__init__()
         self.setWindowTitle("Modificar Contenedor")
         self.setFixedSize(400, 280)
@@ -27,6 +77,7 @@ class CustomDialog(QDialog):
         
         self.altura_maxima = altura_maxima
         self.diametro = diametro
+        self.dispositivo = dispositivo
         
         layout = QVBoxLayout()
         form_layout = QFormLayout()
@@ -89,7 +140,7 @@ class CustomDialog(QDialog):
             
             if 0 < altura <= 500 and 0 < diametro <= 200:
                 # Calcular el volumen máximo
-                self.volumen_maximo = math.pi * ((diametro / 2) ** 2) * altura / 1000  # Convertir de cm³ a L
+                self.volumen_maximo = GeometriaTanque(altura, diametro, cargar_tabla()).volumen_maximo  # En L
                 self.altura_maxima = altura
                 self.diametro = diametro
 
@@ -100,7 +151,7 @@ class CustomDialog(QDialog):
 
                 # Generar el mensaje para el ESP
                 mensaje = f"c:{self.altura_maxima},{self.diametro}"
-                enviar_mensaje(mensaje)  # Enviar el mensaje al ESP
+                enviar_mensaje(mensaje, self.dispositivo)  # Enviar el mensaje al ESP
                 
                 # Mostrar mensaje de éxito
                 self.altura_error.setStyleSheet("color: green;")
@@ -118,45 +169,54 @@ class ModernWindow(QMainWindow):
         self.altura_maxima = 0
         self.volumen_maximo = 0
 
-        #Llamamos al backend
-        try:
-            self.backend_process = subprocess.Popen(["python", "Backend.py"])
-        except FileNotFoundError:
-            print("Error: No se encontró el archivo Backend.py.")
-        except Exception as e:
-            print(f"Error al iniciar el backend: {e}") 
+        # Capa de conversión cm/L/% compartida por indicadores, gráfica y validación del setpoint
+        self.tabla_tanque = cargar_tabla()
+        self.geometria = GeometriaTanque(tabla=self.tabla_tanque)
+
+        # Ventana de tiempo de la gráfica
+        self.ventana = VENTANA_EN_VIVO
+
+        # Dispositivo que se muestra y al que se envían los comandos (el primero conocido)
+        conocidos = registro.todos()
+        self.dispositivo = conocidos[0].id if conocidos else None
+
+        # Ventana local de niveles para la gráfica, inicializada con lo que ya hay en el buffer
+        muestras = self.cargar_ventana()
 
         # Configuración de la ventana principal
         self.setWindowTitle("Level Sense IU")
         self.setMinimumSize(1000, 600)
         self.resize(1400, 600)
 
-        # Crear interfaz gráfica
+        # Crear interfaz gráfica (la gráfica se agrega en completar_arranque, con la ventana ya visible)
         self.setup_ui()
 
+        # Mostrar el último estado conocido
+        self.mostrar_ultimo_estado(muestras)
+
+        # Suscribirse al backend: cada muestra llega por señal en cuanto se recibe
+        self.puente = PuenteTelemetria()
+        self.puente.muestra_recibida.connect(self.recibir_muestra)
+        suscribir(self.puente)
+
+    def completar_arranque(self, medir=False):
+        """Se llama con la ventana ya visible: crea la gráfica, informa el tiempo de arranque y abre el diálogo inicial."""
+        visible = (time.perf_counter() - INICIO) * 1000
+        self.crear_grafica()
+        grafica = (time.perf_counter() - INICIO) * 1000
+        mensaje = f"Arranque: interfaz visible en {visible:.0f} ms, gráfica lista en {grafica:.0f} ms"
+        print(mensaje)
+        self.statusBar().setStyleSheet("color: white;")
+        self.statusBar().showMessage(mensaje)
+        if medir:
+            QApplication.instance().quit()
+            return
+
         # Ejecutar diálogo inicial
         self.abrir_dialogo()
 
-        # Configurar el temporizador para leer el archivo CSV
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.leer_csv)  # Conectar el temporizador al método leer_csv
-        self.timer.start(500)  # Leer el archivo CSV cada 500 ms
-
     def closeEvent(self, event):
         """Sobrescribe el evento de cierre de la ventana."""
-        # Detener el proceso del backend si está en ejecución
-        if hasattr(self, "backend_process") and self.backend_process:
-            self.backend_process.terminate()
-            self.backend_process.wait()  # Esperar a que el proceso termine
-            print("Backend detenido.")
-
-        # Intentar cerrar la terminal del servidor backend
-        try:
-            subprocess.run(["taskkill", "/F", "/IM", "python.exe"], check=True)
-            print("Terminal del servidor backend cerrada.")
-        except Exception as e:
-            print(f"Error al cerrar la terminal del servidor backend: {e}")
-
         # Mostrar un mensaje de confirmación antes de cerrar
         respuesta = QMessageBox.question(
             self,
@@ -167,59 +227,105 @@ class ModernWindow(QMainWindow):
         )
 
         if respuesta == QMessageBox.Yes:
+            desuscribir(self.puente)  # Dejar de recibir muestras del backend
             event.accept()  # Permitir el cierre
         else:
             event.ignore()  # Cancelar el cierre
 
-    def leer_csv(self):
-        """Lee el archivo CSV y actualiza la interfaz gráfica con los datos más recientes."""
-        try:
-            with open("data.csv", mode="r") as file:
-                reader = list(csv.DictReader(file))
-                if reader:
-                    last_row = reader[-1]  # Leer la última fila
-                    nivel = float(last_row["Nivel"])
-                    potencia = float(last_row["Potencia"])
-
-                    # Actualizar los valores en la interfaz gráfica
-                    if hasattr(self, "labels"):
-                        self.labels["Altura"].setText(f"{nivel:.1f} cm")
-                        self.labels["Volumen"].setText(f"{(math.pi * (self.diametro / 2) ** 2 * nivel) / 1000:.1f} L")
-                        porcentaje = (nivel / self.altura_maxima) * 100 if self.altura_maxima > 0 else 0
-                        self.labels["Porcentaje"].setText(f"{porcentaje:.1f}%")
-
-                    if hasattr(self, "fill_progress") and hasattr(self, "empty_progress"):
-                        if potencia >= 0:
-                            self.fill_progress.setValue(int(potencia))
-                            self.empty_progress.setValue(0)
-                        else:
-                            self.fill_progress.setValue(0)
-                            self.empty_progress.setValue(abs(int(potencia)))
-                    pass  # No imprimir nada en caso de éxito
-
-        except FileNotFoundError:
-            print("Archivo CSV no encontrado.")
-        except Exception as e:
-            print(f"Error al leer el archivo CSV: {e}")
+    def cargar_ventana(self):
+        """Carga la ventana local de niveles desde el buffer del dispositivo seleccionado."""
+        dispositivo = registro.buscar(self.dispositivo) if self.dispositivo else None
+        muestras = dispositivo.telemetria.ultimas() if dispositivo else []
+        capacidad = dispositivo.telemetria.capacidad if dispositivo else None
+        self.niveles = deque((muestra[0] for muestra in muestras), maxlen=capacidad)
+        self.tiempos = deque((muestra[2] for muestra in muestras), maxlen=capacidad)
+        # Las ventanas largas se vuelven a consultar al historial del dispositivo nuevo
+        self.serie_historial = None
+        self.ultima_consulta = float("-inf")
+        # Las muestras publicadas que ya estaban en el buffer se ignoran al llegar por la señal
+        self.ultimo_tiempo = muestras[-1][2] if muestras else float("-inf")
+        return muestras
+
+    def mostrar_ultimo_estado(self, muestras):
+        if muestras:
+            nivel, potencia = muestras[-1][:2]
+            self.actualizar_indicadores(nivel, potencia)
+        self.actualizar_grafica(self.unit_menu.currentText().strip())
+
+    def cambiar_dispositivo(self, dispositivo):
+        """Muestra la telemetría de otro dispositivo y dirige hacia él los comandos."""
+        if not dispositivo or dispositivo == self.dispositivo:
+            return
+        self.dispositivo = dispositivo
+        self.mostrar_ultimo_estado(self.cargar_ventana())
+        self.actualizar_ajustes()
+
+    def recibir_muestra(self, dispositivo, nivel, potencia, tiempo):
+        """Recibe una muestra nueva del backend y actualiza indicadores y gráfica si es del dispositivo seleccionado."""
+        adoptar = self.dispositivo is None
+        if self.device_menu.findText(dispositivo) < 0:
+            self.device_menu.addItem(dispositivo)
+        if adoptar:
+            # Seguir al primer dispositivo que envíe datos
+            self.device_menu.setCurrentText(dispositivo)
+            self.cambiar_dispositivo(dispositivo)
+        if dispositivo != self.dispositivo or tiempo <= self.ultimo_tiempo:
+            return
+        self.ultimo_tiempo = tiempo
+
+        self.niveles.append(nivel)
+        self.tiempos.append(tiempo)
+        self.actualizar_indicadores(nivel, potencia)
+        self.actualizar_ajustes()
+        self.programar_redibujo()
+
+    def actualizar_indicadores(self, nivel, potencia):
+        """Actualiza las etiquetas de nivel y las barras de potencia con la muestra más reciente."""
+        # Actualizar los valores en la interfaz gráfica
+        if hasattr(self, "labels"):
+            self.labels["Altura"].setText(f"{nivel:.1f} cm")
+            self.labels["Volumen"].setText(f"{self.geometria.convertir(nivel, 'L'):.1f} L")
+            self.labels["Porcentaje"].setText(f"{self.geometria.convertir(nivel, '%'):.1f}%")
+
+        if hasattr(self, "fill_progress") and hasattr(self, "empty_progress"):
+            if potencia >= 0:
+                self.fill_progress.setValue(int(potencia))
+                self.empty_progress.setValue(0)
+            else:
+                self.fill_progress.setValue(0)
+                self.empty_progress.setValue(abs(int(potencia)))
+
+    def actualizar_ajustes(self):
+        """Muestra las ganancias, histéresis, PWM mínimo y periodo en uso en el dispositivo seleccionado."""
+        dispositivo = registro.buscar(self.dispositivo) if self.dispositivo else None
+        ajustes = dispositivo.ajustes if dispositivo else None
+        if ajustes is self.ajustes_mostrados:
+            return
+        self.ajustes_mostrados = ajustes
+        self.label_ajustes.setText(f"Lazo: {dispositivo.texto_ajustes() if dispositivo else 'sin reporte del dispositivo'}")
 
     def abrir_dialogo(self):
         """Abre el diálogo para configurar el contenedor."""
-        dialogo = CustomDialog(self.altura_maxima or 0, self.diametro or 0)
+        dialogo = CustomDialog(self.altura_maxima or 0, self.diametro or 0, self.dispositivo)
         if dialogo.exec_():  # Espera a que se cierre el diálogo
-            self.diametro = dialogo.diametro
-            self.altura_maxima = dialogo.altura_maxima
-            self.volumen_maximo = dialogo.volumen_maximo
+            self.actualizar_geometria(dialogo.altura_maxima, dialogo.diametro)
             print(f"Nuevos valores en ModernWindow: Altura={self.altura_maxima}, Diámetro={self.diametro}, Volumen={self.volumen_maximo}")
 
+    def actualizar_geometria(self, altura_maxima, diametro):
+        """Actualiza las dimensiones del contenedor y los factores de conversión precalculados."""
+        self.altura_maxima = altura_maxima
+        self.diametro = diametro
+        self.geometria = GeometriaTanque(altura_maxima, diametro, self.tabla_tanque)
+        self.volumen_maximo = self.geometria.volumen_maximo
+
     def show_dialog(self):
         """Muestra el diálogo para editar los valores del contenedor."""
-        dialog = CustomDialog(self.altura_maxima, self.diametro)
+        dialog = CustomDialog(self.altura_maxima, self.diametro, self.dispositivo)
         if dialog.exec_() == QDialog.Accepted:
             # Actualizar los valores máximos desde el diálogo
-            self.altura_maxima = dialog.altura_maxima
-            self.diametro = dialog.diametro
-            self.volumen_maximo = (math.pi * ((self.diametro / 2) ** 2) * self.altura_maxima) / 1000  # Convertir de cm³ a L
+            self.actualizar_geometria(dialog.altura_maxima, dialog.diametro)
             print(f"Nuevos valores recibidos: Altura={self.altura_maxima} cm, Diámetro={self.diametro} cm, Volumen Máximo={self.volumen_maximo:.2f} L")
+            self.programar_redibujo()  # Reajustar los ejes a las nuevas dimensiones
 
             # Generar el mensaje para el ESP
             mensaje = f"c:{self.altura_maxima},{self.diametro}"
@@ -274,11 +380,31 @@ class ModernWindow(QMainWindow):
             border-radius: 10px;
         """)
         self.open_dialog_button.clicked.connect(self.show_dialog)
+
+        # Selector del dispositivo (tanque) que se muestra y controla
+        self.device_menu = QComboBox()
+        self.device_menu.setFont(QFont("roboto", 14))
+        self.device_menu.setMinimumWidth(180)
+        self.device_menu.setStyleSheet("""
+            QComboBox {
+            background-color: white;
+            border: 2px solid #000;
+            border-radius: 10px;
+            padding: 5px;
+            }
+        """)
+        self.device_menu.addItems([dispositivo.id for dispositivo in registro.todos()])
+        if self.dispositivo:
+            self.device_menu.setCurrentText(self.dispositivo)
+        self.device_menu.currentTextChanged.connect(self.cambiar_dispositivo)
+
         # Agregar elementos al header
         header_layout.addWidget(self.logo)
         header_layout.addSpacing(10)
         header_layout.addWidget(self.title)
         header_layout.addStretch()
+        header_layout.addWidget(self.device_menu)
+        header_layout.addSpacing(10)
         header_layout.addWidget(self.open_dialog_button)
 
         # Agregar header al layout principal
@@ -389,6 +515,13 @@ class ModernWindow(QMainWindow):
                 progress_container.addLayout(empty_layout)
                 
                 block_layout.addLayout(progress_container)
+
+                # Parámetros del lazo que reporta el firmware (g:); cambian con k:, h:, m: y r:
+                self.ajustes_mostrados = None
+                self.label_ajustes = QLabel("Lazo: sin reporte del dispositivo")
+                self.label_ajustes.setFont(QFont("Roboto", 10))
+                self.label_ajustes.setStyleSheet("color: black;")
+                block_layout.addWidget(self.label_ajustes, alignment=Qt.AlignCenter)
             elif i == 2:  # Bloque vacío
                 # Crear un QLabel para el bloque vacío
                 empty_label = QLabel("Ingrese un nuevo nivel de llenado")
@@ -498,7 +631,7 @@ class ModernWindow(QMainWindow):
         self.dynamic_title_label.setAlignment(Qt.AlignLeft)
 
         # Crear un menú de selección (QComboBox)
-        unit_menu = QComboBox()
+        self.unit_menu = unit_menu = QComboBox()
         unit_menu.addItems(["cm", "L", "%"])
         unit_menu.setStyleSheet("""
             QComboBox {
@@ -527,15 +660,50 @@ class ModernWindow(QMainWindow):
 
         unit_menu.currentIndexChanged.connect(actualizar_titulo)
 
-        # Agregar el título y el menú al layout horizontal
+        # Selector de la ventana de tiempo (las ventanas largas usan el historial)
+        self.window_menu = QComboBox()
+        self.window_menu.addItems(list(VENTANAS_GRAFICA))
+        self.window_menu.setStyleSheet(unit_menu.styleSheet())
+        self.window_menu.currentTextChanged.connect(self.cambiar_ventana)
+
+        # Agregar el título y los menús al layout horizontal
         title_menu_layout.addWidget(self.dynamic_title_label, alignment=Qt.AlignLeft)
         title_menu_layout.addStretch()  # Agregar espacio flexible entre el título y el menú
+        title_menu_layout.addWidget(self.window_menu, alignment=Qt.AlignRight)
         title_menu_layout.addWidget(unit_menu, alignment=Qt.AlignRight)
 
         # Agregar el layout horizontal al bloque de la gráfica
         graph_block_layout.addLayout(title_menu_layout)
 
-        # Crear la gráfica
+        # Lugar de la gráfica: la crea crear_grafica() una vez que la ventana está visible
+        self.canvas = None
+        self.redibujo_pendiente = False
+        self.cargando_grafica = QLabel("Cargando gráfica...")
+        self.cargando_grafica.setAlignment(Qt.AlignCenter)
+        self.graph_layout = QVBoxLayout()
+        self.graph_layout.setContentsMargins(0, 0, 0, 0)  # Eliminar márgenes
+        self.graph_layout.addWidget(self.cargando_grafica)
+        graph_block_layout.addLayout(self.graph_layout)
+
+        # Establecer el layout del bloque de la gráfica
+        graph_block.setLayout(graph_block_layout)
+
+        # Agregar el bloque de la gráfica a la sección derecha
+        self.right_section.addWidget(graph_block)
+
+        # Conectar el cambio de selección del menú al cambio de gráfica
+        unit_menu.currentTextChanged.connect(lambda texto: self.actualizar_grafica(texto.strip()))
+
+        # Agregar las secciones izquierda y derecha al layout de contenido
+        content_layout.addWidget(left_widget, 30)
+        content_layout.addLayout(self.right_section, 70)
+        main_layout.addStretch()
+
+    def crear_grafica(self):
+        """Importa matplotlib y crea la gráfica en el lugar reservado por setup_ui."""
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+
         self.figure = Figure()
         self.canvas = FigureCanvas(self.figure)
         self.ax = self.figure.add_subplot(111)
@@ -543,8 +711,6 @@ class ModernWindow(QMainWindow):
         self.ax.set_ylim(0, self.altura_maxima if self.altura_maxima > 0 else 1)  # Altura predeterminada
         self.ax.set_xlabel("Tiempo (s)")
         self.ax.set_ylabel("Altura (cm)")
-        self.line, = self.ax.plot([], [], color="blue", alpha=0.6)
-        self.fill = self.ax.fill_between([], [], color="cyan", alpha=0.3)
 
         # Configurar la cuadrícula
         self.ax.grid(
@@ -554,9 +720,15 @@ class ModernWindow(QMainWindow):
             alpha=0.5           # Transparencia (0.0 = completamente transparente, 1.0 = completamente opaco)
         )
 
-        # Crear la línea y el área sombreada
-        self.line, = self.ax.plot([], [], color="blue", alpha=0.6)
-        self.fill = self.ax.fill_between([], [], color="cyan", alpha=0.3)
+        # Crear la línea y el área sombreada como artistas animados: no forman parte del
+        # fondo estático y se redibujan solos sobre él mediante blitting
+        self.line, = self.ax.plot([], [], color="blue", alpha=0.6, animated=True)
+        self.fill = self.ax.fill_between([], [], color="cyan", alpha=0.3, animated=True)
+
+        # Fondo estático (ejes, cuadrícula, etiquetas) capturado tras cada redibujo completo
+        self.fondo = None
+        self.config_ejes = None  # (unidad, altura, volumen) con la que se configuraron los ejes
+        self.canvas.mpl_connect("draw_event", self.guardar_fondo)
 
         # Inicializar datos para la gráfica
         self.data = {
@@ -564,93 +736,128 @@ class ModernWindow(QMainWindow):
             "values": np.zeros(100)
         }
 
-        # Agregar la gráfica al bloque
-        graph_layout = QVBoxLayout()
-        graph_layout.setContentsMargins(0, 0, 0, 0)  # Eliminar márgenes
-        graph_layout.addWidget(self.canvas)
-        graph_block_layout.addLayout(graph_layout)
-
-        # Establecer el layout del bloque de la gráfica
-        graph_block.setLayout(graph_block_layout)
-
-        # Agregar el bloque de la gráfica a la sección derecha
-        self.right_section.addWidget(graph_block)
-
-        # Conectar el cambio de selección del menú al cambio de gráfica
-        unit_menu.currentIndexChanged.connect(self.actualizar_grafica)
+        # Reemplazar el aviso de carga por la gráfica
+        self.graph_layout.replaceWidget(self.cargando_grafica, self.canvas)
+        self.cargando_grafica.deleteLater()
+        self.actualizar_grafica(self.unit_menu.currentText().strip())
+
+    def cambiar_ventana(self, ventana):
+        """Cambia el intervalo de tiempo visible; las ventanas largas se consultan al historial."""
+        self.ventana = ventana
+        self.ultima_consulta = float("-inf")
+        self.programar_redibujo()
+
+    def programar_redibujo(self):
+        """Agrupa las muestras que llegan muy seguidas en un solo cuadro (máximo FPS_GRAFICA)."""
+        if not self.redibujo_pendiente:
+            self.redibujo_pendiente = True
+            QTimer.singleShot(int(1000 / FPS_GRAFICA), self.redibujar)
+
+    def redibujar(self):
+        self.redibujo_pendiente = False
+        self.actualizar_grafica(self.unit_menu.currentText().strip())
+
+    def guardar_fondo(self, event):
+        """Guarda el fondo estático tras un redibujo completo y pinta encima los artistas animados."""
+        self.fondo = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.fill)
+        self.ax.draw_artist(self.line)
+
+    def configurar_ejes(self, unidad):
+        """Ajusta límites, etiquetas y divisiones de los ejes; solo se llama si cambian la unidad o el contenedor."""
+        from matplotlib.ticker import MaxNLocator
 
-        # Iniciar un temporizador para actualizar la gráfica cada 500ms
-        self.graph_timer = QTimer()
-        self.graph_timer.timeout.connect(lambda: self.actualizar_grafica(unit_menu.currentText().strip()))
-        self.graph_timer.start(500)  # Actualizar cada 500ms
-
-        # Agregar las secciones izquierda y derecha al layout de contenido
-        content_layout.addWidget(left_widget, 30)
-        content_layout.addLayout(self.right_section, 70)
-        main_layout.addStretch()
-
-    def actualizar_grafica(self, unidad):
-        """Actualiza la gráfica y los valores según la unidad seleccionada leyendo datos del archivo CSV"""
         # Ajustar el eje Y según la unidad seleccionada
+        maximo = self.geometria.maximo(unidad) if unidad in ("cm", "L") else 100
+        self.ax.set_ylim(0, maximo if maximo > 0 else 1)
         if unidad == "cm":  # Altura
-            self.ax.set_ylim(0, self.altura_maxima if self.altura_maxima > 0 else 1)
             self.ax.set_ylabel("Altura (cm)")
-            self.ax.yaxis.set_major_locator(MaxNLocator(nbins=10))  # Mostrar 10 divisiones en el eje Y
         elif unidad == "L":  # Volumen
-            self.ax.set_ylim(0, self.volumen_maximo if self.volumen_maximo > 0 else 1)
             self.ax.set_ylabel("Volumen (L)")
-            self.ax.yaxis.set_major_locator(MaxNLocator(nbins=10))  # Mostrar 10 divisiones en el eje Y
         elif unidad == "%":  # Porcentaje
-            self.ax.set_ylim(0, 100)
             self.ax.set_ylabel("Porcentaje (%)")
-            self.ax.yaxis.set_major_locator(MaxNLocator(nbins=10))  # Mostrar 10 divisiones en el eje Y
+        self.ax.yaxis.set_major_locator(MaxNLocator(nbins=10))  # Mostrar 10 divisiones en el eje Y
 
-        # Configurar el eje X
-        self.ax.set_xlim(-100, 0)  # Tiempo en el eje X (de -100 segundos a 0 segundos)
-        self.ax.set_xlabel("Tiempo (s)")
+        # Configurar el eje X según la ventana de tiempo (por ejemplo de -100 segundos a 0 segundos)
+        segundos, escala, nombre = VENTANAS_GRAFICA[self.ventana]
+        self.ax.set_xlim(-segundos / escala, 0)
+        self.ax.set_xlabel(f"Tiempo ({nombre})")
         self.ax.xaxis.set_major_locator(MaxNLocator(nbins=10))  # Mostrar 10 divisiones en el eje X
 
+        self.config_ejes = (unidad, self.altura_maxima, self.volumen_maximo, self.ventana)
+
+        # Redibujo completo: el evento draw_event vuelve a capturar el fondo
+        self.canvas.draw()
+
+    def actualizar_grafica(self, unidad):
+        """Actualiza la gráfica según la unidad seleccionada redibujando solo la línea y el área (blitting)"""
+        if self.canvas is None:
+            return  # La gráfica todavía no se creó
         try:
-            # Leer el archivo CSV
-            with open("data.csv", mode="r") as file:
-                reader = list(csv.DictReader(file))
-                if reader:
-                    # Leer todos los datos
-                    niveles = [float(row["Nivel"]) for row in reader]
-
-                    # Generar un rango de tiempo continuo para los últimos 100 segundos
-                    tiempo = np.linspace(-100, 0, len(niveles))  # Distribuir todos los valores en 100 segundos
-
-                    # Convertir los niveles según la unidad seleccionada
-                    if unidad == "L":  # Convertir altura a volumen
-                        valores = [
-                            (math.pi * ((self.diametro / 2) ** 2) * nivel) / 1000
-                            for nivel in niveles
-                        ]
-                    elif unidad == "%":  # Convertir altura a porcentaje
-                        valores = [
-                            (nivel / self.altura_maxima) * 100 if self.altura_maxima > 0 else 0
-                            for nivel in niveles
-                        ]
-                    else:  # Altura directamente
-                        valores = niveles
-
-                    # Actualizar los datos de la gráfica
-                    self.data["time"] = tiempo  # Tiempo en segundos
-                    self.data["values"] = valores  # Valores correspondientes
-
-                    # Actualizar los datos de la gráfica
-                    self.line.set_data(self.data["time"], self.data["values"])
-                    if self.fill:
-                        self.fill.remove()  # Eliminar el área anterior si existe
-                    self.fill = self.ax.fill_between(self.data["time"], self.data["values"], color="cyan", alpha=0.3)
-
-                    # Redibujar la gráfica
-                    self.canvas.draw()
-        except FileNotFoundError:
-            print("Archivo CSV no encontrado.")
+            # Los ejes solo se recalculan cuando cambia la unidad o las dimensiones del contenedor
+            if self.config_ejes != (unidad, self.altura_maxima, self.volumen_maximo, self.ventana):
+                self.configurar_ejes(unidad)
+
+            if self.ventana != VENTANA_EN_VIVO:
+                self.actualizar_historial(unidad)
+            elif self.niveles:
+                # Cargar la ventana de niveles y sus tiempos reales directamente en arreglos de NumPy
+                niveles = np.fromiter(self.niveles, dtype=float, count=len(self.niveles))
+                tiempo = np.fromiter(self.tiempos, dtype=float, count=len(self.tiempos)) - time.time()
+
+                # Reducir a lo sumo a dos puntos (mínimo y máximo) por columna de píxeles de la gráfica
+                tiempo, niveles = minmax(tiempo, niveles, self.columnas_grafica())
+
+                # Actualizar los datos de la gráfica, convertidos a la unidad seleccionada en una sola operación
+                self.data["time"] = tiempo  # Segundos respecto al instante actual
+                self.data["values"] = self.geometria.convertir(niveles, unidad)  # Valores correspondientes
+
+                # Actualizar la línea y el polígono del área sin crear artistas nuevos
+                self.line.set_data(self.data["time"], self.data["values"])
+                self.fill.set_verts([poligono_area(self.data["time"], self.data["values"])])
+
+            self.pintar_artistas()
         except Exception as e:
-            print(f"Error al leer el archivo CSV: {e}")
+            print(f"Error al actualizar la gráfica: {e}")
+
+    def actualizar_historial(self, unidad):
+        """Dibuja una ventana larga con los resúmenes del historial: la media como línea y la banda mínimo-máximo como área."""
+        segundos, escala, _ = VENTANAS_GRAFICA[self.ventana]
+        ahora = time.time()
+        if time.monotonic() - self.ultima_consulta >= CONSULTA_HISTORIAL_CADA:
+            self.ultima_consulta = time.monotonic()
+            dispositivo = registro.buscar(self.dispositivo) if self.dispositivo else None
+            if dispositivo is not None:
+                puntos = min(MAX_PUNTOS_GRAFICA, 2 * self.columnas_grafica())
+                self.serie_historial = dispositivo.historial.consultar(ahora - segundos, ahora, puntos)
+
+        serie = self.serie_historial
+        if serie is None or not len(serie.tiempo):
+            self.line.set_data([], [])
+            self.fill.set_verts([np.empty((0, 2))])
+            return
+        tiempo = (serie.tiempo - ahora) / escala
+        # La media se reduce con LTTB al ancho en píxeles; la banda ya resume mínimo y máximo
+        self.line.set_data(*lttb(tiempo, self.geometria.convertir(serie.media, unidad), self.columnas_grafica()))
+        self.fill.set_verts([poligono_area(tiempo, self.geometria.convertir(serie.maximo, unidad),
+                                           self.geometria.convertir(serie.minimo, unidad))])
+
+    def columnas_grafica(self):
+        """Ancho de los ejes en píxeles: no tiene sentido dibujar más puntos que columnas."""
+        return max(int(self.ax.bbox.width), 2)
+
+    def pintar_artistas(self):
+        """Pinta la línea y el área sobre el fondo guardado (blitting)."""
+        # Sin fondo capturado (primer dibujo o cambio de tamaño) se hace un redibujo completo
+        if self.fondo is None:
+            self.canvas.draw()
+            return
+
+        # Restaurar el fondo y pintar solo los artistas que cambian
+        self.canvas.restore_region(self.fondo)
+        self.ax.draw_artist(self.fill)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
     
     # Función para manejar el evento del botón
     def enviar_datos(self):
@@ -682,7 +889,6 @@ class ModernWindow(QMainWindow):
                         f"El volumen no puede exceder el nivel seguro del máximo permitido ({self.volumen_maximo - 2:.1f} L)."
                     )
                     return
-                altura_calculada = (nivel * 1000) / (math.pi * ((self.diametro / 2) ** 2))
 
             elif unidad == "cm":  # Altura
                 if nivel > (self.altura_maxima - 2):
@@ -692,7 +898,6 @@ class ModernWindow(QMainWindow):
                         f"La altura no puede exceder el nivel seguro de la altura máxima del contenedor ({self.altura_maxima:.1f} cm)."
                     )
                     return
-                altura_calculada = nivel
             elif unidad == "%":  # Porcentaje
                 if nivel > 96:
                     QMessageBox.warning(
@@ -701,13 +906,15 @@ class ModernWindow(QMainWindow):
                         "El porcentaje no puede exceder el 100%."
                     )
                     return
-                altura_calculada = (nivel / 100) * self.altura_maxima
             else:
                 QMessageBox.warning(self, "Error", "Por favor, seleccione una unidad válida.")
                 return
+
+            # Convertir el valor ingresado a altura con la misma capa de conversión que la gráfica
+            altura_calculada = self.geometria.a_altura(nivel, unidad)
             # Generar el mensaje para el ESP
             mensaje = f"s:{altura_calculada:.2f}"
-            enviar_mensaje(mensaje)  # Enviar el mensaje al ESP
+            enviar_mensaje(mensaje, self.dispositivo)  # Enviar el mensaje al ESP seleccionado
             # Imprimir la altura calculada en la consola
             print(f"Altura calculada enviada: {altura_calculada:.2f} cm")
 
@@ -720,7 +927,15 @@ class ModernWindow(QMainWindow):
         print(f"Altura calculada enviada: {altura_calculada:.2f} cm")
 
 if __name__ == "__main__":
+    # python LevelSenseUI.py                  -> interfaz gráfica
+    # python LevelSenseUI.py --sin-pantalla   -> tablero de texto (igual que python panel.py, que no carga Qt)
+    # python LevelSenseUI.py --medir-arranque -> mostrar la ventana, informar el tiempo de arranque y salir
+    # El backend corre en este mismo proceso, en un hilo con su propio bucle de eventos
+    iniciar_en_hilo()
     app = QApplication(sys.argv)
     window = ModernWindow()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    QTimer.singleShot(0, lambda: window.completar_arranque("--medir-arranque" in sys.argv))
+    codigo = app.exec_()
+    detener()
+    sys.exit(codigo)
\ No newline at end of file
@@ -1,6 +1,12 @@
+import argparse
+import os
+
 import numpy as np
 import matplotlib.pyplot as plt
 
+import modelo_planta
+from modelo_planta import ModeloPlanta
+
 # Parámetros físicos
 radio_cm = 4.5
 A_cm2 = np.pi * radio_cm**2  # Área transversal del recipiente (cm²)
@@ -18,40 +24,35 @@ t_total = 60
 dt = 0.1
 T = np.arange(0, t_total + dt, dt)
 
-# Inicializar vector de nivel
-nivel = np.zeros_like(T)
-
-# Simulación paso a paso
-for i in range(1, len(T)):
-    t = T[i]
-
-    if t <= 30:
-        # Etapa de llenado
-        dV = Q_llenado * dt
-    else:
-        # Etapa de vaciado
-        dV = -Q_vaciado * dt
-
-    # Calcular variación de altura
-    dh = dV / A_cm2
-    nivel[i] = nivel[i-1] + dh
+parser = argparse.ArgumentParser(description="Simulación de llenado y vaciado del recipiente")
+parser.add_argument("--modelo-identificado", action="store_true",
+                    help=f"Usar el modelo ajustado por identificacion.py ({modelo_planta.ARCHIVO_MODELO}) "
+                         "en lugar de los caudales medidos a mano")
+args = parser.parse_args()
 
-    # Asegurarse de que el nivel no supere el máximo de 15.5 cm durante el llenado
-    if t <= 30 and nivel[i] > h_max:
-        nivel[i] = h_max
+# Por defecto, el recipiente de arriba con los caudales medidos a mano
+if args.modelo_identificado and os.path.exists(modelo_planta.ARCHIVO_MODELO):
+    modelo = modelo_planta.cargar()
+    print(f"Modelo identificado ({modelo_planta.ARCHIVO_MODELO}): llenado {float(modelo.v_llenado):.3f} cm/s, "
+          f"vaciado {float(modelo.v_vaciado):.3f} cm/s, altura {float(modelo.h_max):.1f} cm")
+else:
+    if args.modelo_identificado:
+        print(f"No existe {modelo_planta.ARCHIVO_MODELO}; se usan los caudales medidos a mano.")
+    modelo = ModeloPlanta.desde_caudales(Q_llenado, Q_vaciado, A_cm2, h_max)
+    print(f"Modelo de caudales medidos: llenado {Q_llenado} cm³/s, vaciado {Q_vaciado} cm³/s, "
+          f"radio {radio_cm} cm, altura {h_max} cm")
 
-    # Evitar que el nivel sea negativo durante el vaciado
-    if nivel[i] < 0:
-        nivel[i] = 0
+# Llenado al 100% hasta t_llenado y luego vaciado al 100% (solución cerrada por tramos)
+nivel = modelo.perfil(T, [0, t_llenado], [1, -1])
 
 # Graficar resultados
 plt.figure(figsize=(10, 5))
 plt.plot(T, nivel, 'b', linewidth=2)
-plt.axvline(30, color='gray', linestyle='--', label='Inicio vaciado')
+plt.axvline(t_llenado, color='gray', linestyle='--', label='Inicio vaciado')
 
 # Personalizar los ejes
 plt.xticks(np.arange(0, t_total + 1, 5))  # Más divisiones en el eje x (cada 5 segundos)
-plt.yticks(np.arange(0, h_max + 1, 1))    # Más divisiones en el eje y (cada 1 cm)
+plt.yticks(np.arange(0, float(modelo.h_max) + 1, 1))    # Más divisiones en el eje y (cada 1 cm)
 
 # Aumentar la precisión de las etiquetas
 plt.tick_params(axis='both', which='major', labelsize=10)
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+import emulador
+import protocolo
+from dispositivos import ruta_telemetria
+from telemetria import BufferTelemetria
+
+# Archivo con los resultados (JSON) para comparar versiones
+SALIDA = "benchmark_backend.json"
+
+# Puerto del backend bajo prueba (distinto del de producción para no chocar con uno en ejecución)
+PUERTO = 8795
+
+# Barrido por defecto: clientes, tasa de cada cliente (Hz) y ventana del buffer de telemetría (muestras)
+CLIENTES = "1,10,100"
+TASAS = "10"
+VENTANAS = "1000"
+DURACION = 10.0  # s por configuración
+
+# Procesos que generan la carga (un solo proceso de Python no alcanza a saturar el backend)
+PROCESOS_CLIENTES = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Dispositivo de prueba que mide la latencia de los comandos y pausa entre comandos (s)
+ID_SONDA = "sonda"
+COMANDOS_CADA = 0.1
+
+# Una configuración se considera sostenida si el backend persiste al menos esta fracción de lo
+# enviado y el p99 de latencia de ingesta no pasa del límite
+FRACCION_SOSTENIDA = 0.98
+LATENCIA_SOSTENIDA_MS = 250.0
+
+_DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Proceso del backend: fija la ventana antes de abrir los buffers y sirve hasta recibir SIGINT
+_BACKEND = """
+import asyncio, sys, telemetria
+telemetria.CAPACIDAD = int(sys.argv[1])
+import Backend
+try:
+    asyncio.run(Backend.servir("127.0.0.1", int(sys.argv[2])))
+except KeyboardInterrupt:
+    pass
+"""
+
+
+def _uso_proceso(pid):
+    """(CPU en s, bytes escritos a disco) del proceso según /proc; None donde no está disponible."""
+    cpu = escritos = None
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            campos = file.read().rsplit(")", 1)[1].split()
+        cpu = (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f"/proc/{pid}/io") as file:
+            io = dict(linea.split(": ") for linea in file.read().splitlines())
+        escritos = int(io["write_bytes"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return cpu, escritos
+
+
+async def _esperar_backend(puerto, limite=15.0):
+    fin = time.monotonic() + limite
+    while True:
+        try:
+            async with connect(f"ws://127.0.0.1:{puerto}/control") as websocket:
+                await websocket.send("LISTA")
+                await websocket.recv()
+                return
+        except OSError:
+            if time.monotonic() > fin:
+                raise RuntimeError(f"El backend no respondió en el puerto {puerto}")
+            await asyncio.sleep(0.1)
+
+
+def _clientes(parametros):
+    """Proceso de carga: corre dispositivos del emulador y devuelve su inicio (época, s) y estadísticas."""
+    cantidad, puerto, periodo, lote, duracion, prefijo = parametros
+    desfase = time.time() - time.monotonic()
+    dispositivos = asyncio.run(emulador.emular(cantidad, "127.0.0.1", puerto, periodo, lote, duracion=duracion,
+                                               prefijo=prefijo, informar=False))
+    inicios = {dispositivo.id: dispositivo.inicio + desfase for dispositivo in dispositivos}
+    totales = {campo: sum(getattr(dispositivo, campo) for dispositivo in dispositivos)
+               for campo in ("enviadas", "descartadas", "atrasos", "ciclos")}
+    return inicios, totales
+
+
+async def _sonda(puerto, duracion):
+    """Mide la latencia de los comandos: desde que se envían a /control hasta que el dispositivo los recibe."""
+    latencias = []
+    perdidos = 0
+    async with connect(f"ws://127.0.0.1:{puerto}/") as dispositivo, \
+            connect(f"ws://127.0.0.1:{puerto}/control") as control:
+        await dispositivo.send(f"{protocolo.PREFIJO_SALUDO}id={ID_SONDA};v={protocolo.VERSION};f=txt")
+        await dispositivo.recv()  # f:txt
+        fin = time.monotonic() + duracion
+        n = 0
+        while time.monotonic() < fin:
+            n += 1
+            inicio = time.perf_counter()
+            await control.send(f"{ID_SONDA} s:{n}")
+            try:
+                while await asyncio.wait_for(dispositivo.recv(), 5.0) != f"s:{n}":
+                    pass
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            except asyncio.TimeoutError:
+                perdidos += 1
+            await control.recv()  # "ok"
+            await asyncio.sleep(COMANDOS_CADA)
+    return latencias, perdidos
+
+
+def _percentiles(valores):
+    if not len(valores):
+        return {"p50": None, "p99": None, "max": None}
+    p50, p99 = np.percentile(valores, [50, 99])
+    return {"p50": round(float(p50), 3), "p99": round(float(p99), 3), "max": round(float(np.max(valores)), 3)}
+
+
+def medir(clientes, tasa, ventana, lote=1, duracion=DURACION, puerto=PUERTO, procesos=PROCESOS_CLIENTES):
+    """Ejecuta una configuración contra un backend nuevo en un directorio temporal y devuelve sus métricas.
+
+    La latencia de ingesta es recepción en el backend - envío en el cliente, calculada sobre las
+    muestras persistidas (las de la ventana final de cada dispositivo) con resolución de 1 ms.
+    CPU y bytes escritos son los del proceso del backend durante la carga (Linux, /proc).
+    """
+    with tempfile.TemporaryDirectory() as directorio:
+        entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_DIRECTORIO, os.environ.get("PYTHONPATH")])))
+        with open(os.path.join(directorio, "backend.log"), "w") as registro:
+            backend = subprocess.Popen([sys.executable, "-c", _BACKEND, str(ventana), str(puerto)], cwd=directorio,
+                                       env=entorno, stdout=registro, stderr=subprocess.STDOUT)
+            try:
+                asyncio.run(_esperar_backend(puerto))
+                cpu_inicio, escritos_inicio = _uso_proceso(backend.pid)
+                inicio = time.monotonic()
+
+                procesos = max(1, min(procesos, clientes))
+                reparto = [clientes // procesos + (k < clientes % procesos) for k in range(procesos)]
+                with multiprocessing.Pool(procesos) as pool:
+                    pendiente = pool.map_async(_clientes, [(cantidad, puerto, 1 / tasa, lote, duracion, f"b{k}")
+                                                           for k, cantidad in enumerate(reparto)])
+                    comandos, comandos_perdidos = asyncio.run(_sonda(puerto, duracion))
+                    partes = pendiente.get()
+
+                transcurrido = time.monotonic() - inicio
+                cpu_fin, escritos_fin = _uso_proceso(backend.pid)
+            finally:
+                if os.name == "posix":
+                    backend.send_signal(signal.SIGINT)  # Cierre ordenado: vacía la cola de escritura
+                else:
+                    backend.terminate()
+                backend.wait(timeout=60)
+
+        # Muestras persistidas y latencia de ingesta, leídas de los buffers que dejó el backend
+        inicios = {}
+        totales = dict.fromkeys(("enviadas", "descartadas", "atrasos", "ciclos"), 0)
+        for parte_inicios, parte_totales in partes:
+            inicios.update(parte_inicios)
+            for campo, valor in parte_totales.items():
+                totales[campo] += valor
+        persistidas = 0
+        latencias = []
+        for id_dispositivo, inicio_cliente in inicios.items():
+            ruta = os.path.join(directorio, ruta_telemetria(id_dispositivo))
+            if not os.path.exists(ruta):
+                continue
+            buffer = BufferTelemetria(ruta, solo_lectura=True)
+            persistidas += buffer.total
+            datos = buffer.arreglo()
+            buffer.cerrar()
+            latencias.append((datos[:, 4] - (inicio_cliente + datos[:, 3] / 1000)) * 1000)
+        latencias = np.concatenate(latencias) if latencias else np.empty(0)
+
+    latencia = _percentiles(latencias)
+    resultado = {
+        "clientes": clientes,
+        "tasa_hz": tasa,
+        "ventana": ventana,
+        "lote": lote,
+        "duracion_s": round(transcurrido, 2),
+        "tasa_ofrecida": clientes * tasa,
+        "tasa_enviada": round(totales["enviadas"] / duracion, 1),
+        "tasa_persistida": round(persistidas / duracion, 1),
+        "perdidas": totales["enviadas"] - persistidas,
+        "latencia_ingesta_p50_ms": latencia["p50"],
+        "latencia_ingesta_p99_ms": latencia["p99"],
+        "latencia_ingesta_max_ms": latencia["max"],
+        "latencia_comando_p50_ms": _percentiles(comandos)["p50"],
+        "latencia_comando_p99_ms": _percentiles(comandos)["p99"],
+        "comandos_perdidos": comandos_perdidos,
+        "cpu_pct": None,
+        "cpu_us_por_muestra": None,
+        "bytes_por_muestra": None,
+        "atrasos_clientes_pct": round(100 * totales["atrasos"] / max(totales["ciclos"], 1), 2),
+    }
+    if cpu_inicio is not None and cpu_fin is not None:
+        resultado["cpu_pct"] = round(100 * (cpu_fin - cpu_inicio) / transcurrido, 1)
+        resultado["cpu_us_por_muestra"] = round(1e6 * (cpu_fin - cpu_inicio) / max(persistidas, 1), 1)
+    if escritos_inicio is not None and escritos_fin is not None:
+        resultado["bytes_por_muestra"] = round((escritos_fin - escritos_inicio) / max(persistidas, 1), 1)
+    resultado["sostenida"] = bool(persistidas >= FRACCION_SOSTENIDA * totales["enviadas"] and latencia["p99"] is not None
+                                  and latencia["p99"] <= LATENCIA_SOSTENIDA_MS)
+    return resultado
+
+
+def _version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=_DIRECTORIO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _clave(resultado):
+    return tuple(resultado[campo] for campo in ("clientes", "tasa_hz", "ventana", "lote"))
+
+
+def comparar(actual, anterior):
+    """Imprime la variación de las métricas principales entre dos archivos de resultados, por configuración."""
+    previos = {_clave(resultado): resultado for resultado in anterior["resultados"]}
+    print(f"Comparación con {anterior.get('version')} ({anterior.get('fecha')}):")
+    for resultado in actual["resultados"]:
+        previo = previos.get(_clave(resultado))
+        if previo is None:
+            continue
+        cambios = []
+        for campo in ("tasa_persistida", "latencia_ingesta_p99_ms", "latencia_comando_p99_ms", "cpu_us_por_muestra", "bytes_por_muestra"):
+            if resultado[campo] is not None and previo[campo]:
+                cambios.append(f"{campo} {100 * (resultado[campo] - previo[campo]) / previo[campo]:+.0f}%")
+        print(f"  {resultado['clientes']} clientes a {resultado['tasa_hz']} Hz, ventana {resultado['ventana']}: " + ", ".join(cambios))
+
+
+def _lista(texto, tipo=int):
+    return [tipo(valor) for valor in texto.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendimiento del backend: ingesta, latencia, CPU y disco con clientes sintéticos")
+    parser.add_argument("--clientes", default=CLIENTES, help="Cantidades de clientes a barrer, separadas por comas")
+    parser.add_argument("--tasas", default=TASAS, help="Muestras por segundo de cada cliente (Hz), separadas por comas")
+    parser.add_argument("--ventanas", default=VENTANAS, help="Capacidad del buffer de telemetría (muestras), separadas por comas")
+    parser.add_argument("--lote", type=int, default=1, help="Muestras por trama")
+    parser.add_argument("--duracion", type=float, default=DURACION, help="Segundos de carga por configuración")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--procesos", type=int, default=PROCESOS_CLIENTES, help="Procesos que generan la carga")
+    parser.add_argument("--salida", default=SALIDA)
+    parser.add_argument("--comparar", default=None, help="Resultados anteriores (JSON) contra los que comparar")
+    args = parser.parse_args()
+
+    resultados = []
+    for clientes, tasa, ventana in itertools.product(_lista(args.clientes), _lista(args.tasas, float), _lista(args.ventanas)):
+        resultado = medir(clientes, tasa, ventana, args.lote, args.duracion, args.puerto, args.procesos)
+        resultados.append(resultado)
+        print(f"{clientes} clientes a {tasa:g} Hz, ventana {ventana}: {resultado['tasa_persistida']:.0f} muestras/s persistidas "
+              f"de {resultado['tasa_ofrecida']:.0f} ofrecidas, ingesta p50 {resultado['latencia_ingesta_p50_ms']} ms "
+              f"p99 {resultado['latencia_ingesta_p99_ms']} ms, comando p99 {resultado['latencia_comando_p99_ms']} ms, "
+              f"CPU {resultado['cpu_pct']}%, {resultado['bytes_por_muestra']} B/muestra"
+              + ("" if resultado["sostenida"] else " (no sostenida)"))
+
+    sostenidas = [resultado["tasa_persistida"] for resultado in resultados if resultado["sostenida"]]
+    informe = {
+        "version": _version(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "tasa_max_sostenida": max(sostenidas) if sostenidas else None,
+        "resultados": resultados,
+    }
+    with open(args.salida, "w") as file:
+        json.dump(informe, file, indent=2)
+    print(f"Tasa máxima sostenida: {informe['tasa_max_sostenida']} muestras/s; resultados en '{args.salida}'")
+
+    if args.comparar:
+        with open(args.comparar) as file:
+            comparar(informe, json.load(file))
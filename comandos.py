@@ -0,0 +1,135 @@
+import random
+from collections import deque
+
+import numpy as np
+
+import protocolo
+
+# Comandos en los que solo importa el último: uno nuevo reemplaza al pendiente del mismo tipo
+# (q: y p:off no se agrupan: cada uno pide algo aunque haya otro igual en la cola)
+COALESCER = ("s:", "c:") + protocolo.COMANDOS_AJUSTE
+
+# Reintentos: espera inicial por el acuse, que se duplica en cada intento hasta el máximo (s)
+RETARDO_INICIAL = 0.5
+RETARDO_MAXIMO = 8.0
+
+# Comandos pendientes por dispositivo; si se supera se descarta el más antiguo
+MAX_PENDIENTES = 32
+
+# Latencias recientes con las que se calculan los percentiles
+VENTANA_LATENCIAS = 200
+
+
+class Comando:
+    __slots__ = ("seq", "texto", "creado", "enviado", "intentos", "proximo")
+
+    def __init__(self, seq, texto, creado):
+        self.seq = seq
+        self.texto = texto
+        self.creado = creado    # Instante en que se encoló (monotónico)
+        self.enviado = None     # Primer envío
+        self.intentos = 0
+        self.proximo = 0.0      # Próximo envío o reintento
+
+
+class ColaComandos:
+    """Cola de salida de un dispositivo: orden de llegada, un comando en vuelo y reintentos con espera exponencial.
+
+    Cada comando lleva un número de secuencia (<comando>#<seq>) y se reenvía hasta que el
+    firmware responde a:<seq>. Un s: o c: nuevo reemplaza al pendiente del mismo tipo, aunque
+    ya esté en vuelo, así que tras una reconexión solo se envía el último setpoint. Con un
+    firmware sin acuses (no anuncia a=1 en el saludo) el comando se da por entregado al enviarlo.
+    No usa asyncio: el backend decide cuándo llamar a siguiente() y confirmar().
+    """
+
+    def __init__(self):
+        self.pendientes = deque()
+        self.con_ack = False
+        self._seq = random.randrange(1, 2 ** 31)  # Distinta en cada arranque para que el firmware no la tome por repetida
+        self.latencias_ack = deque(maxlen=VENTANA_LATENCIAS)    # Primer envío → acuse (ms)
+        self.latencias_total = deque(maxlen=VENTANA_LATENCIAS)  # Encolado → acuse (ms)
+        self.enviados = 0
+        self.confirmados = 0
+        self.reintentos = 0
+        self.reemplazados = 0
+        self.descartados = 0
+
+    def __len__(self):
+        return len(self.pendientes)
+
+    def agregar(self, texto, ahora):
+        """Encola un comando; devuelve el comando creado."""
+        for prefijo in COALESCER:
+            if texto.startswith(prefijo):
+                anteriores = [comando for comando in self.pendientes if comando.texto.startswith(prefijo)]
+                for comando in anteriores:
+                    self.pendientes.remove(comando)
+                self.reemplazados += len(anteriores)
+                break
+        if len(self.pendientes) >= MAX_PENDIENTES:
+            descartado = self.pendientes.popleft()
+            self.descartados += 1
+            print(f"Cola de comandos llena: se descarta '{descartado.texto}'")
+        self._seq = self._seq % 0x7FFFFFFF + 1
+        comando = Comando(self._seq, texto, ahora)
+        self.pendientes.append(comando)
+        return comando
+
+    def siguiente(self, ahora):
+        """Devuelve (mensaje a enviar o None, segundos hasta la próxima acción o None si no hay nada pendiente)."""
+        if not self.pendientes:
+            return None, None
+        comando = self.pendientes[0]
+        if not self.con_ack:
+            self.pendientes.popleft()
+            self.enviados += 1
+            return comando.texto, 0.0
+        if comando.proximo > ahora:
+            return None, comando.proximo - ahora
+
+        comando.intentos += 1
+        if comando.enviado is None:
+            comando.enviado = ahora
+            self.enviados += 1
+        else:
+            self.reintentos += 1
+        comando.proximo = ahora + min(RETARDO_INICIAL * 2 ** (comando.intentos - 1), RETARDO_MAXIMO)
+        return f"{comando.texto}{protocolo.SEPARADOR_SEQ}{comando.seq}", comando.proximo - ahora
+
+    def confirmar(self, seq, ahora):
+        """Registra el acuse a:<seq>; devuelve False si no corresponde a ningún comando pendiente (tardío o reemplazado)."""
+        for comando in self.pendientes:
+            if comando.seq == seq:
+                self.pendientes.remove(comando)
+                self.confirmados += 1
+                self.latencias_ack.append((ahora - comando.enviado) * 1000)
+                self.latencias_total.append((ahora - comando.creado) * 1000)
+                return True
+        return False
+
+    def reconectado(self, con_ack):
+        """Tras un saludo: adopta la capacidad de acuses y reenvía de inmediato el comando en vuelo."""
+        self.con_ack = con_ack
+        if self.pendientes:
+            self.pendientes[0].proximo = 0.0
+
+    def resumen(self):
+        resultado = {"pendientes": len(self.pendientes), "enviados": self.enviados, "confirmados": self.confirmados,
+                     "reintentos": self.reintentos, "reemplazados": self.reemplazados, "descartados": self.descartados}
+        for nombre, latencias in (("ack", self.latencias_ack), ("total", self.latencias_total)):
+            if latencias:
+                p50, p99 = np.percentile(np.array(latencias), [50, 99])
+                resultado[f"latencia_{nombre}_p50_ms"] = float(p50)
+                resultado[f"latencia_{nombre}_p99_ms"] = float(p99)
+        return resultado
+
+    def texto(self):
+        resumen = self.resumen()
+        texto = (f"{resumen['pendientes']} pendientes, {resumen['confirmados']}/{resumen['enviados']} confirmados, "
+                 f"{resumen['reintentos']} reintentos, {resumen['reemplazados']} reemplazados")
+        if "latencia_ack_p50_ms" in resumen:
+            texto += (f", comando→acuse p50 {resumen['latencia_ack_p50_ms']:.1f} ms, p99 {resumen['latencia_ack_p99_ms']:.1f} ms"
+                      f" (desde que se encoló p99 {resumen['latencia_total_p99_ms']:.1f} ms)")
+        elif not self.con_ack and resumen["enviados"]:
+            texto += ", sin acuses (firmware anterior)"
+        return texto
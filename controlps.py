@@ -1,15 +1,22 @@
+import sys
+import time
 import numpy as np
-import matplotlib.pyplot as plt
+
+import modelo_planta
+from modelo_planta import ModeloPlanta
+
+# Modelo de la planta: el ajustado por identificacion.py (modelo_planta.json) o los valores por defecto
+modelo = modelo_planta.cargar()
 
 # Parámetros físicos del sistema
-h_max = 20.0
+h_max = float(modelo.h_max)
 dt = 0.01
 t_total = 100
 t = np.arange(0, t_total, dt)
 
 # Velocidades
-v_llenado = 0.726
-v_vaciado = 0.5262
+v_llenado = float(modelo.v_llenado)
+v_vaciado = float(modelo.v_vaciado)
 
 # Setpoint dinámico personalizado
 setpoint = np.zeros_like(t)
@@ -51,41 +58,172 @@ def simulate_pid(Kp, Ki, Kd, use_derivative=True, label=""):
             integral += error * dt
 
         # Dinámica del sistema
-        if u_sat > 0:
-         dh = v_llenado * u_sat * dt
-        elif u_sat < 0:
-            dh = v_vaciado * abs(u_sat) * (-dt)
-        else:
-            dh = 0
-
-        h[i] = h[i - 1] + dh
-        h[i] = np.clip(h[i], 0, h_max)
+        h[i] = modelo.paso(h[i - 1], u_sat, dt)
 
     return h, label
 
 
-# Simulaciones
-controllers = [
-    (1.5, 0.2, 0.05, True, "PID Kp=1.50 Ki=0.20 Kd=0.05"),
-]
-
-results = []
-for Kp, Ki, Kd, use_derivative, label in controllers:
-    h, lbl = simulate_pid(Kp, Ki, Kd, use_derivative, label)
-    results.append((t, h, lbl))
-
-# Gráfica
-plt.figure(figsize=(12, 6))
-for t_vals, h_vals, label in results:
-    plt.plot(t_vals, h_vals, label=label)
-
-plt.plot(t, setpoint, "k--", label="Setpoint", linewidth=2)
-plt.xlabel("Tiempo (s)")
-plt.ylabel("Altura del agua (cm)")
-plt.title(
-    "Controladores PID/PI"
-)
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
+# Simulador por lotes: avanza todos los candidatos (Kp, Ki, Kd) a la vez en cada paso de tiempo
+def simulate_pid_batch(Kp, Ki, Kd, use_derivative=True, sp=None, tolerance=0.02, keep_history=False,
+                       time_step=None, level_max=None, v_fill=None, v_drain=None, initial_level=0.0):
+    """Simula muchos juegos de ganancias en paralelo con la misma dinámica que simulate_pid.
+
+    Kp, Ki y Kd son escalares o arreglos (se combinan con broadcasting). Se conservan la
+    saturación a [-1, 1], el anti-windup y las velocidades asimétricas v_llenado/v_vaciado.
+    Devuelve un diccionario de arreglos, uno por candidato:
+      iae, ise            integral del error absoluto y cuadrático (cm·s, cm²·s)
+      overshoot           sobrepaso máximo en % del tamaño del escalón de setpoint
+      settling_time       peor tiempo de asentamiento (s) al tolerance·escalón; inf si no se asienta
+      h                   (solo con keep_history) niveles simulados, forma (candidatos, len(t))
+    time_step, level_max, v_fill y v_drain reemplazan a dt, h_max, v_llenado y v_vaciado del
+    módulo para simular otra planta o periodo de muestreo (sp debe estar en esa misma malla);
+    initial_level es el nivel del tanque al empezar (cm).
+    """
+    paso = dt if time_step is None else time_step
+    nivel_max = h_max if level_max is None else level_max
+    planta = ModeloPlanta(v_llenado if v_fill is None else v_fill,
+                          v_vaciado if v_drain is None else v_drain, nivel_max,
+                          modelo.zona_llenado, modelo.zona_vaciado)
+
+    sp = setpoint if sp is None else np.asarray(sp, dtype=float)
+    Kp, Ki, Kd = np.broadcast_arrays(*(np.atleast_1d(np.asarray(k, dtype=float)) for k in (Kp, Ki, Kd)))
+    Kp, Ki, Kd = Kp.ravel().copy(), Ki.ravel().copy(), Kd.ravel().copy()
+    if not use_derivative:
+        Kd[:] = 0.0
+    m = Kp.size
+    n = len(sp)
+
+    h = np.full(m, float(initial_level))
+    integral = np.zeros(m)
+    prev_error = np.zeros(m)
+    e = np.empty(m)
+    u = np.empty(m)
+    u_sat = np.empty(m)
+    aux = np.empty(m)
+    mask = np.empty(m, dtype=bool)
+
+    iae = np.zeros(m)
+    ise = np.zeros(m)
+    overshoot = np.zeros(m)
+    settling = np.zeros(m)
+    history = np.full((m, n), float(initial_level)) if keep_history else None
+
+    # Estado del tramo de setpoint actual (para sobrepaso y asentamiento)
+    seg_start = 1
+    step = sp[1] if n > 1 else 0.0
+    direction = np.sign(step)
+    band = tolerance * abs(step) if step != 0 else tolerance * nivel_max
+    last_out = np.zeros(m)     # Último instante fuera de la banda en el tramo
+    seg_peak = np.zeros(m)     # Mayor sobrepaso del tramo en cm
+
+    def cerrar_tramo(fin):
+        # Asentamiento: tiempo desde el inicio del tramo hasta la última salida de la banda
+        settled = np.where(last_out >= fin - paso / 2, np.inf, np.maximum(last_out - (seg_start - 1) * paso, 0.0))
+        np.maximum(settling, settled, out=settling)
+        if step != 0:
+            np.maximum(overshoot, seg_peak / abs(step) * 100, out=overshoot)
+
+    for i in range(1, n):
+        if i > 1 and sp[i] != sp[i - 1]:
+            cerrar_tramo((i - 1) * paso)
+            seg_start = i
+            step = sp[i] - sp[i - 1]
+            direction = np.sign(step)
+            band = tolerance * abs(step)
+            last_out[:] = (i - 1) * paso
+            seg_peak[:] = 0.0
+
+        # Error y derivada
+        np.subtract(sp[i], h, out=e)
+        np.subtract(e, prev_error, out=aux)
+        aux /= paso
+        prev_error[:] = e
+
+        # Ley de control
+        np.multiply(Kp, e, out=u)
+        u += Ki * integral
+        aux *= Kd
+        u += aux
+
+        # Saturación y anti-windup: solo acumula integral si no está saturado
+        np.clip(u, -1, 1, out=u_sat)
+        np.equal(u, u_sat, out=mask)
+        np.add(integral, e * paso, out=integral, where=mask)
+
+        # Dinámica del sistema con velocidades distintas de llenado y vaciado
+        planta.paso(h, u_sat, paso, out=h)
+        if keep_history:
+            history[:, i] = h
+
+        # Métricas acumuladas
+        iae += np.abs(e) * paso
+        ise += e * e * paso
+        np.subtract(h, sp[i], out=aux)
+        if step != 0:
+            np.maximum(seg_peak, aux * direction, out=seg_peak)
+        np.abs(aux, out=aux)
+        np.greater(aux, band, out=mask)
+        last_out[mask] = i * paso
+
+    cerrar_tramo((n - 1) * paso)
+
+    result = {"iae": iae, "ise": ise, "overshoot": overshoot, "settling_time": settling}
+    if keep_history:
+        result["h"] = history
+    return result
+
+
+def benchmark(n_candidates=1000, n_reference=5):
+    """Compara el simulador por lotes con llamar simulate_pid en un bucle."""
+    rng = np.random.default_rng(0)
+    Kp = rng.uniform(0.1, 3.0, n_candidates)
+    Ki = rng.uniform(0.0, 0.5, n_candidates)
+    Kd = rng.uniform(0.0, 0.2, n_candidates)
+
+    inicio = time.perf_counter()
+    for k in range(n_reference):
+        simulate_pid(Kp[k], Ki[k], Kd[k])
+    por_candidato = (time.perf_counter() - inicio) / n_reference
+
+    inicio = time.perf_counter()
+    simulate_pid_batch(Kp, Ki, Kd)
+    lote = time.perf_counter() - inicio
+
+    print(f"simulate_pid: {por_candidato * 1000:.1f} ms por candidato "
+          f"(~{por_candidato * n_candidates:.1f} s para {n_candidates})")
+    print(f"simulate_pid_batch: {lote:.2f} s para {n_candidates} candidatos "
+          f"({por_candidato * n_candidates / lote:.0f}x más rápido)")
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        benchmark()
+        sys.exit(0)
+
+    # Simulaciones
+    controllers = [
+        (1.5, 0.2, 0.05, True, "PID Kp=1.50 Ki=0.20 Kd=0.05"),
+    ]
+
+    results = []
+    for Kp, Ki, Kd, use_derivative, label in controllers:
+        h, lbl = simulate_pid(Kp, Ki, Kd, use_derivative, label)
+        results.append((t, h, lbl))
+
+    # Gráfica (matplotlib solo se carga al ejecutar el script; los módulos que importan controlps no lo necesitan)
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 6))
+    for t_vals, h_vals, label in results:
+        plt.plot(t_vals, h_vals, label=label)
+
+    plt.plot(t, setpoint, "k--", label="Setpoint", linewidth=2)
+    plt.xlabel("Tiempo (s)")
+    plt.ylabel("Altura del agua (cm)")
+    plt.title(
+        "Controladores PID/PI"
+    )
+    plt.legend()
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
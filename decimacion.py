@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def minmax(tiempo, valores, columnas):
+    """Envolvente mínimo/máximo: para cada columna de píxeles conserva la muestra mínima y la máxima.
+
+    Dibujar el resultado da la misma imagen que dibujar todas las muestras (ningún pico se
+    pierde) con a lo sumo 2·columnas puntos, en orden cronológico. tiempo debe estar ordenado.
+    """
+    tiempo = np.asarray(tiempo, dtype=float)
+    valores = np.asarray(valores, dtype=float)
+    if len(tiempo) <= 2 * columnas or columnas < 1 or tiempo[-1] <= tiempo[0]:
+        return tiempo, valores
+
+    # Columna de cada muestra según su tiempo
+    columna = ((tiempo - tiempo[0]) * (columnas / (tiempo[-1] - tiempo[0]))).astype(np.int64)
+    np.minimum(columna, columnas - 1, out=columna)
+
+    # El tiempo está ordenado, así que cada columna es un tramo contiguo de muestras
+    inicios = np.flatnonzero(np.diff(columna, prepend=-1))
+    cantidades = np.diff(inicios, append=len(columna))
+    minimos = _posicion_por_tramo(valores == np.repeat(np.minimum.reduceat(valores, inicios), cantidades), columna)
+    maximos = _posicion_por_tramo(valores == np.repeat(np.maximum.reduceat(valores, inicios), cantidades), columna)
+
+    indices = np.sort(np.column_stack((minimos, maximos)), axis=1).ravel()
+    indices = indices[np.concatenate(([True], np.diff(indices) != 0))]  # Columnas con una sola muestra
+    return tiempo[indices], valores[indices]
+
+
+def _posicion_por_tramo(coincide, columna):
+    """Primera posición de cada columna en la que `coincide` es verdadero."""
+    posiciones = np.flatnonzero(coincide)
+    _, primera = np.unique(columna[posiciones], return_index=True)
+    return posiciones[primera]
+
+
+def lttb(tiempo, valores, puntos):
+    """Largest-Triangle-Three-Buckets: reduce la serie a `puntos` muestras que conservan su forma.
+
+    Se mantienen la primera y la última muestra; de cada cubeta intermedia se elige la que forma
+    el triángulo de mayor área con la elegida en la cubeta anterior y el promedio de la siguiente.
+    """
+    tiempo = np.asarray(tiempo, dtype=float)
+    valores = np.asarray(valores, dtype=float)
+    n = len(tiempo)
+    if n <= puntos or puntos < 3:
+        return tiempo, valores
+
+    bordes = (np.arange(puntos - 1) * (n - 2) / (puntos - 2)).astype(np.int64) + 1
+    bordes[-1] = n - 1
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+
+    # Promedio de cada cubeta (el de la siguiente se usa como tercer vértice)
+    suma_t = np.add.reduceat(tiempo[1:n - 1], bordes[:-1] - 1)
+    suma_v = np.add.reduceat(valores[1:n - 1], bordes[:-1] - 1)
+    cantidad = np.diff(bordes)
+    medio_t = np.append(suma_t / cantidad, tiempo[-1])
+    medio_v = np.append(suma_v / cantidad, valores[-1])
+
+    anterior = 0
+    for k in range(puntos - 2):
+        inicio, fin = bordes[k], bordes[k + 1]
+        t_a, v_a = tiempo[anterior], valores[anterior]
+        t_c, v_c = medio_t[k + 1], medio_v[k + 1]
+        areas = np.abs((t_a - t_c) * (valores[inicio:fin] - v_a) - (t_a - tiempo[inicio:fin]) * (v_c - v_a))
+        anterior = inicio + int(areas.argmax())
+        elegidos[k + 1] = anterior
+    return tiempo[elegidos], valores[elegidos]
@@ -0,0 +1,226 @@
+import os
+import re
+import threading
+from collections import deque
+
+import numpy as np
+
+from comandos import ColaComandos
+from historial import Historial
+from telemetria import BIN_FILE, CSV_FILE, BufferTelemetria
+
+# Dispositivo al que se asignan los clientes que no envían identificador (firmware anterior)
+DISPOSITIVO_PREDETERMINADO = "principal"
+
+# Carpeta con un buffer de telemetría por dispositivo (<id>.bin) y sus exportaciones (<id>.csv)
+DIRECTORIO_DISPOSITIVOS = "dispositivos"
+
+# Muestras recientes con las que se calculan las métricas de jitter y latencia
+VENTANA_METRICAS = 1000
+
+# Separación mínima entre los tiempos de dos muestras seguidas de un dispositivo (s, la resolución de t_ms)
+PASO_MINIMO = 0.001
+
+# Identificadores válidos: letras, números, guiones y guiones bajos (se usan como nombre de archivo)
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def id_valido(dispositivo):
+    return bool(_ID_VALIDO.match(dispositivo or ""))
+
+
+def ruta_telemetria(dispositivo, extension=".bin"):
+    """Archivo de telemetría del dispositivo; el predeterminado conserva data.bin/data.csv."""
+    if dispositivo == DISPOSITIVO_PREDETERMINADO:
+        return BIN_FILE if extension == ".bin" else CSV_FILE
+    return os.path.join(DIRECTORIO_DISPOSITIVOS, dispositivo + extension)
+
+
+class MetricasEnlace:
+    """Jitter del periodo de muestreo del dispositivo y latencia del enlace sobre las últimas muestras.
+
+    El intervalo se mide con el reloj del dispositivo entre muestras de secuencia consecutiva; la
+    latencia es recepción - tiempo del ciclo de control, es decir, lo que tardó la muestra en llegar por
+    encima del mensaje más rápido visto (el que fija el desfase de relojes) más la espera en el lote.
+    También guarda el último estado del lazo de control que reporta el firmware (mensajes o:...).
+    """
+
+    def __init__(self, ventana=VENTANA_METRICAS):
+        self.intervalos = deque(maxlen=ventana)  # ms
+        self.latencias = deque(maxlen=ventana)   # ms
+        self._anterior = None                    # (seq, t_ms) de la última muestra
+        self.lazo = None                         # Último protocolo.EstadoLazo reportado por el firmware
+
+    def agregar(self, seq, t_ms, latencia):
+        if t_ms is not None:
+            if seq is not None and self._anterior is not None and seq == self._anterior[0] + 1 and t_ms >= self._anterior[1]:
+                self.intervalos.append(t_ms - self._anterior[1])
+            self._anterior = (seq, t_ms)
+        self.latencias.append(latencia * 1000)
+
+    def resumen(self):
+        """Diccionario con periodo medio, jitter (desviación estándar), percentiles de latencia (ms) y el último estado del lazo."""
+        resultado = {}
+        if self.intervalos:
+            intervalos = np.array(self.intervalos)
+            resultado.update(periodo_ms=float(intervalos.mean()), jitter_ms=float(intervalos.std()),
+                             periodo_max_ms=float(intervalos.max()))
+        if self.latencias:
+            latencias = np.array(self.latencias)
+            p50, p99 = np.percentile(latencias, [50, 99])
+            resultado.update(latencia_p50_ms=float(p50), latencia_p99_ms=float(p99), latencia_max_ms=float(latencias.max()))
+        if self.lazo is not None:
+            resultado.update(lazo_ciclos=self.lazo.ciclos, lazo_atrasos=self.lazo.atrasos,
+                             lazo_dt_max_ms=self.lazo.dt_max_us / 1000, lazo_ejecucion_max_ms=self.lazo.ejecucion_max_us / 1000,
+                             lazo_ecos_perdidos=self.lazo.ecos_perdidos)
+        return resultado
+
+    def texto(self):
+        resumen = self.resumen()
+        partes = []
+        if "periodo_ms" in resumen:
+            partes.append(f"periodo {resumen['periodo_ms']:.1f} ms, jitter {resumen['jitter_ms']:.1f} ms "
+                          f"(máx {resumen['periodo_max_ms']:.0f} ms)")
+        if "latencia_p50_ms" in resumen:
+            partes.append(f"latencia p50 {resumen['latencia_p50_ms']:.1f} ms, p99 {resumen['latencia_p99_ms']:.1f} ms")
+        if "lazo_ciclos" in resumen:
+            partes.append(f"lazo {resumen['lazo_atrasos']} atrasos en {resumen['lazo_ciclos']} ciclos "
+                          f"(dt máx {resumen['lazo_dt_max_ms']:.1f} ms, ejecución máx {resumen['lazo_ejecucion_max_ms']:.1f} ms), "
+                          f"{resumen['lazo_ecos_perdidos']} ecos perdidos")
+        return ", ".join(partes) or "sin datos"
+
+
+class Dispositivo:
+    """Estado de un ESP32 identificado: su buffer de telemetría acotado, su historial y los datos de su conexión."""
+
+    def __init__(self, id_dispositivo):
+        self.id = id_dispositivo
+        ruta = ruta_telemetria(id_dispositivo)
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.telemetria = BufferTelemetria(ruta)
+        self.historial = Historial(id_dispositivo, self.telemetria)
+        self.cliente = None     # Conexión WebSocket actual (None si está desconectado)
+        self.formato = None     # Formato de telemetría negociado
+        self.seq = None         # Última secuencia recibida
+        self.perdidas = 0       # Muestras perdidas según la secuencia
+        self.desfase = None     # Diferencia entre el reloj del backend y el del dispositivo (s)
+        self.ultimo_tiempo = float("-inf")  # Tiempo de la última muestra procesada (época, s)
+        self.nivel = None       # Nivel de la última muestra procesada (cm); lo usa el control predictivo
+        self.metricas = MetricasEnlace()
+        self.comandos = ColaComandos()  # Comandos pendientes de acuse (los atiende el backend)
+        self.ajustes = None     # Último protocolo.AjustesLazo reportado por el firmware (g:...)
+
+    @property
+    def conectado(self):
+        return self.cliente is not None
+
+    def texto_ajustes(self):
+        """Parámetros del lazo en uso en el firmware, para la interfaz y METRICAS."""
+        if self.ajustes is None:
+            return "sin reporte del dispositivo"
+        a = self.ajustes
+        return (f"Kp={a.kp:g} Ki={a.ki:g} Kd={a.kd:g}, histéresis {a.histeresis:g} cm, "
+                f"PWM mínimo {a.pwm_llenado}/{a.pwm_vaciado}, periodo {a.periodo_ms} ms")
+
+    def actualizar_desfase(self, t_ms, t_recepcion):
+        """Estima el desfase entre el reloj del backend (época, s) y el del dispositivo (ms desde su arranque).
+
+        Se toma el mínimo de (recepción - tiempo del dispositivo): la muestra que menos tardó
+        en llegar es la mejor referencia. Si el reloj del dispositivo retrocede (reinicio), se vuelve a anclar.
+        """
+        desfase = t_recepcion - t_ms / 1000
+        if self.desfase is None or desfase < self.desfase or desfase - self.desfase > 60:
+            self.desfase = desfase
+
+    def procesar(self, muestras, t_recepcion):
+        """Calcula el tiempo real (época, s) de las muestras de un mensaje.
+
+        Devuelve filas con las columnas de telemetria.CAMPOS: (nivel, potencia, tiempo, t_ms, recepción).
+
+        Con lotes, la última muestra es la más cercana al instante de recepción y ancla el reloj.
+        Cuando el desfase baja (llega una muestra más rápida) los tiempos no retroceden: cada
+        muestra queda al menos PASO_MINIMO después de la anterior del dispositivo.
+        No escribe en disco: las filas se guardan después con guardar().
+        """
+        if muestras[-1].t_ms is not None:
+            self.actualizar_desfase(muestras[-1].t_ms, t_recepcion)
+
+        filas = []
+        for muestra in muestras:
+            # Contar las muestras perdidas según el número de secuencia
+            if muestra.seq is not None:
+                if self.seq is not None and muestra.seq > self.seq + 1:
+                    self.perdidas += muestra.seq - self.seq - 1
+                self.seq = muestra.seq
+
+            # Tiempo real de la muestra según el reloj del dispositivo, no el de llegada del mensaje
+            if muestra.t_ms is None:
+                tiempo = t_recepcion
+            else:
+                tiempo = muestra.t_ms / 1000 + self.desfase
+            self.metricas.agregar(muestra.seq, muestra.t_ms, t_recepcion - tiempo)
+            tiempo = max(tiempo, self.ultimo_tiempo + PASO_MINIMO)
+            self.ultimo_tiempo = tiempo
+            t_ms = float("nan") if muestra.t_ms is None else float(muestra.t_ms)
+            filas.append((muestra.nivel, muestra.potencia, tiempo, t_ms, t_recepcion))
+            self.nivel = muestra.nivel
+        return filas
+
+    def guardar(self, filas):
+        """Agrega las filas al buffer circular y a los resúmenes del historial (O(1) por fila, sin reescribir archivos)."""
+        for fila in filas:
+            self.telemetria.agregar(*fila)
+            self.historial.agregar(*fila[:3])
+
+    def sincronizar(self):
+        self.telemetria.sincronizar()
+        self.historial.sincronizar()
+
+    def registrar(self, muestras, t_recepcion):
+        """Procesa y guarda en un solo paso las muestras de un mensaje; devuelve las filas guardadas."""
+        filas = self.procesar(muestras, t_recepcion)
+        self.guardar(filas)
+        return filas
+
+    def exportar_csv(self):
+        return self.telemetria.exportar_csv(ruta_telemetria(self.id, ".csv"))
+
+
+class RegistroDispositivos:
+    """Dispositivos conocidos por el backend, indexados por su identificador."""
+
+    def __init__(self):
+        self._dispositivos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, id_dispositivo):
+        """Devuelve el dispositivo con ese identificador, creándolo (y abriendo su buffer) si no existe."""
+        with self._lock:
+            if id_dispositivo not in self._dispositivos:
+                self._dispositivos[id_dispositivo] = Dispositivo(id_dispositivo)
+            return self._dispositivos[id_dispositivo]
+
+    def cargar_existentes(self):
+        """Abre los buffers que ya existen en disco para que su historial esté disponible antes de que se conecten."""
+        ids = []
+        if os.path.exists(BIN_FILE):
+            ids.append(DISPOSITIVO_PREDETERMINADO)
+        if os.path.isdir(DIRECTORIO_DISPOSITIVOS):
+            for nombre in sorted(os.listdir(DIRECTORIO_DISPOSITIVOS)):
+                id_dispositivo, extension = os.path.splitext(nombre)
+                if extension == ".bin" and id_valido(id_dispositivo):
+                    ids.append(id_dispositivo)
+        for id_dispositivo in ids:
+            self.obtener(id_dispositivo)
+
+    def buscar(self, id_dispositivo):
+        with self._lock:
+            return self._dispositivos.get(id_dispositivo)
+
+    def todos(self):
+        with self._lock:
+            return list(self._dispositivos.values())
+
+    def conectados(self):
+        return [dispositivo for dispositivo in self.todos() if dispositivo.conectado]
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import random
+import time
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+import modelo_planta
+import protocolo
+from mpc import mando_aplicado
+
+# Servidor al que se conectan los dispositivos virtuales (el de Backend.py)
+HOST = "localhost"
+PUERTO = 8765
+
+# Parámetros del firmware (LevelSense.ino)
+PERIODO_CONTROL = 0.1     # s (PERIODO_CONTROL_MS)
+KP, KI, KD = 0.15, 0.02, 0.05
+HISTERESIS = 1.0          # cm
+ALTURA = 22.0             # Altura del recipiente (cm) que usa el firmware; c:<altura>,<diámetro> la cambia también en la planta
+DIAMETRO = 10.0           # cm
+REINTENTO = 5.0           # Espera entre reconexiones (s), como webSocket.setReconnectInterval(5000)
+PERIODO_REPORTE = 1.0     # Cada cuánto se envía el estado del lazo (o:...)
+TIMEOUT_DIRECTO = 1.0     # s sin un p: nuevo tras los que se vuelve al PID (TIMEOUT_DIRECTO_MS)
+PWM_MINIMO = 65           # PWM mínimo de las bombas (0-255); la planta recibe el mando elevado a este mínimo
+PERIODO_MINIMO, PERIODO_MAXIMO = 0.02, 1.0  # Rango aceptado por r: (s)
+TOLERANCIA_ATRASO = 0.002  # s; un ciclo que empieza más tarde que esto cuenta como atraso
+
+# Ajustes de fábrica del lazo, en el formato del reporte g: (los que usa recetas.py sin un reporte del dispositivo)
+AJUSTES = protocolo.AjustesLazo(KP, KI, KD, HISTERESIS, PWM_MINIMO, PWM_MINIMO, round(PERIODO_CONTROL * 1000))
+
+# Cada cuántos segundos se imprime el resumen de la emulación
+RESUMEN_CADA = 5.0
+
+
+class ControlFirmware:
+    """PID saturado con histéresis de controlMotors() en LevelSense.ino.
+
+    La integral no tiene anti-windup (igual que el firmware) y la bomba solo cambia de
+    sentido cuando el nivel sale de la banda setpoint ± histéresis/2.
+    """
+
+    def __init__(self, kp=KP, ki=KI, kd=KD, histeresis=HISTERESIS):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.histeresis = histeresis
+        self.setpoint = 0.0
+        self.integral = 0.0
+        self.prev_error = 0.0
+        self.bomba = 0  # 0=apagada, 1=llenando, -1=vaciando
+
+    def paso(self, nivel, dt):
+        """Devuelve la potencia (%) del ciclo, la misma que reporta el firmware."""
+        error = self.setpoint - nivel
+        self.integral += error * dt
+        derivada = (error - self.prev_error) / dt
+        self.prev_error = error
+        u = min(max(self.kp * error + self.ki * self.integral + self.kd * derivada, -1.0), 1.0)
+
+        if nivel < self.setpoint - self.histeresis / 2:
+            self.bomba = 1
+        elif nivel > self.setpoint + self.histeresis / 2:
+            self.bomba = -1
+
+        if (self.bomba == 1 and u > 0.01) or (self.bomba == -1 and u < -0.01):
+            return u * 100.0
+        return 0.0
+
+
+class DispositivoVirtual:
+    """ESP32 emulado: planta, control y telemetría con el mismo protocolo que LevelSense.ino.
+
+    El lazo de control corre a periodo fijo aunque no haya conexión (como la tarea de control
+    del firmware); las muestras generadas sin conexión se descartan y el backend ve el hueco
+    en la secuencia. La planta recibe la potencia reportada elevada al PWM mínimo de cada
+    sentido (mpc.mando_aplicado), como las bombas del firmware.
+    """
+
+    def __init__(self, id_dispositivo, modelo, periodo=PERIODO_CONTROL, lote=1, binario=True, ruido=0.0, semilla=None):
+        self.id = id_dispositivo
+        self.modelo = modelo
+        self.periodo = periodo
+        self.lote = lote
+        self.binario_disponible = binario
+        self.ruido = ruido
+        self.rng = random.Random(semilla)
+        self.control = ControlFirmware()
+        self.altura = ALTURA
+        self.diametro = DIAMETRO
+        self.h = 0.0
+        self.potencia = 0.0
+        self.websocket = None
+        self.binario = False  # Hasta recibir "f:bin" se envía texto
+        self.pendientes = []  # (t_ms, nivel, potencia) del lote en curso
+        self.seq_lote = 0
+        self.pwm_llenado = self.pwm_vaciado = PWM_MINIMO
+        self.directo = None  # Potencia (%) del mando directo p: vigente, None con el PID
+        self.t_directo = 0.0
+        self.ultimo_comando = ""  # Secuencia del último comando aplicado, para no repetir un reintento
+        self.inicio = time.monotonic()
+
+        # Estadísticas
+        self.seq = 0
+        self.enviadas = 0
+        self.descartadas = 0
+        self.comandos = 0
+        self.reconexiones = 0
+        self.ciclos = 0
+        self.atrasos = 0
+        self.dt_max = 0.0
+        self.ejecucion_max = 0.0
+
+    @property
+    def conectado(self):
+        return self.websocket is not None
+
+    async def ejecutar(self, url):
+        """Corre el lazo de control y mantiene la conexión con el backend hasta que se cancele la tarea."""
+        lazo = asyncio.create_task(self._lazo())
+        try:
+            while True:
+                try:
+                    async with connect(url, compression=None) as websocket:
+                        await self._sesion(websocket)
+                except (OSError, ConnectionClosed, InvalidHandshake, asyncio.TimeoutError) as e:
+                    if self.reconexiones == 0:
+                        print(f"{self.id}: sin conexión con el backend ({e}); se reintenta cada {REINTENTO:.0f} s")
+                finally:
+                    self.websocket = None
+                self.reconexiones += 1
+                await asyncio.sleep(REINTENTO)
+        finally:
+            lazo.cancel()
+
+    async def _sesion(self, websocket):
+        # Saludo: anunciar versión y formatos soportados, igual que el firmware al conectarse
+        self.binario = False
+        self.pendientes = []
+        formatos = "bin|txt" if self.binario_disponible else "txt"
+        await websocket.send(f"{protocolo.PREFIJO_SALUDO}id={self.id};v={protocolo.VERSION};f={formatos};a=1")
+        await websocket.send(self.ajustes())
+        self.websocket = websocket
+        async for mensaje in websocket:
+            if isinstance(mensaje, str):
+                for respuesta in self.atender(mensaje):
+                    await websocket.send(respuesta)
+
+    def ajustes(self):
+        """Reporte g: con los parámetros del lazo en uso, como enviarAjustes() en el firmware."""
+        c = self.control
+        return (f"{protocolo.PREFIJO_AJUSTES}{c.kp:.4f},{c.ki:.4f},{c.kd:.4f},{c.histeresis:.2f},"
+                f"{self.pwm_llenado},{self.pwm_vaciado},{round(self.periodo * 1000)}")
+
+    def atender(self, mensaje):
+        """Aplica un comando del backend (f:, s:, c:, p:, k:, h:, m:, r:, q:) como lo hace webSocketEvent() en el firmware.
+
+        Devuelve los mensajes de respuesta: el reporte g: tras un ajuste o una consulta y el
+        acuse a:<seq> si el comando venía numerado; un reintento de un comando ya aplicado
+        solo se vuelve a confirmar.
+        """
+        texto, separador, seq = mensaje.rpartition(protocolo.SEPARADOR_SEQ)
+        respuestas = []
+        acuse = []
+        if separador:
+            mensaje = texto
+            acuse = [f"{protocolo.PREFIJO_ACUSE}{seq}"]
+            if seq == self.ultimo_comando:
+                return acuse
+        try:
+            if mensaje.startswith(protocolo.PREFIJO_FORMATO):
+                self.binario = mensaje[len(protocolo.PREFIJO_FORMATO):] == protocolo.FORMATO_BINARIO
+            elif mensaje.startswith(protocolo.PREFIJO_POTENCIA):
+                valor = mensaje[len(protocolo.PREFIJO_POTENCIA):]
+                self.directo = None if valor == "off" else min(max(float(valor), -100.0), 100.0)
+                self.t_directo = time.monotonic()
+            elif mensaje.startswith("s:"):
+                self.control.setpoint = float(mensaje[2:])
+                self.comandos += 1
+            elif mensaje.startswith("c:"):
+                altura, diametro = mensaje[2:].split(",")
+                self.altura, self.diametro = float(altura), float(diametro)
+                # El tanque emulado pasa a tener la altura indicada; los caudales no se tocan
+                m = self.modelo
+                self.modelo = modelo_planta.ModeloPlanta(m.v_llenado, m.v_vaciado, self.altura, m.zona_llenado, m.zona_vaciado)
+                self.h = min(self.h, self.altura)
+                self.comandos += 1
+            elif mensaje.startswith(protocolo.COMANDOS_AJUSTE + (protocolo.CONSULTA_AJUSTES,)):
+                respuestas.append(self._ajustar(mensaje))
+        except ValueError:
+            print(f"{self.id}: comando inválido {mensaje!r}")
+        if separador:
+            self.ultimo_comando = seq
+        return respuestas + acuse
+
+    def _ajustar(self, mensaje):
+        """Aplica k:, h:, m: o r: con los mismos rangos que el firmware y devuelve el reporte g:."""
+        valores = mensaje[2:].split(",") if mensaje[2:] else []
+        if mensaje.startswith("k:") and len(valores) == 3 and all(float(v) >= 0 for v in valores):
+            self.control.kp, self.control.ki, self.control.kd = map(float, valores)
+            self.control.integral = 0.0  # Como el firmware: no arrastra la integral de las ganancias anteriores
+        elif mensaje.startswith("h:") and len(valores) == 1 and 0 <= float(valores[0]) <= self.altura:
+            self.control.histeresis = float(valores[0])
+        elif mensaje.startswith("m:") and len(valores) in (1, 2) and all(0 <= int(v) <= 255 for v in valores):
+            self.pwm_llenado, self.pwm_vaciado = int(valores[0]), int(valores[-1])
+        elif mensaje.startswith("r:") and len(valores) == 1 and PERIODO_MINIMO <= int(valores[0]) / 1000 <= PERIODO_MAXIMO:
+            self.periodo = int(valores[0]) / 1000
+        elif not mensaje.startswith(protocolo.CONSULTA_AJUSTES):
+            print(f"{self.id}: ajuste fuera de rango {mensaje!r}")
+        return self.ajustes()
+
+    async def _lazo(self):
+        """Ciclo de control a periodo fijo con plazos absolutos: el dt de cada paso es el medido."""
+        siguiente = anterior = time.monotonic()
+        ultimo_reporte = anterior
+        while True:
+            siguiente += self.periodo
+            await asyncio.sleep(max(0.0, siguiente - time.monotonic()))
+            inicio = time.monotonic()
+            dt = inicio - anterior
+            anterior = inicio
+
+            await self._paso(dt)
+
+            ejecucion = time.monotonic() - inicio
+            self.ciclos += 1
+            if dt > self.periodo + TOLERANCIA_ATRASO or ejecucion > self.periodo:
+                self.atrasos += 1
+            self.dt_max = max(self.dt_max, dt)
+            self.ejecucion_max = max(self.ejecucion_max, ejecucion)
+            if inicio - siguiente > self.periodo:
+                siguiente = inicio  # Muy atrasado: no encadenar ciclos
+
+            if inicio - ultimo_reporte >= PERIODO_REPORTE:
+                ultimo_reporte = inicio
+                await self._reportar_lazo()
+
+    async def _paso(self, dt):
+        # Planta con el mando del ciclo anterior (con el PWM mínimo de las bombas), lectura del sensor y control
+        u = mando_aplicado(self.potencia / 100.0, self.pwm_llenado / 255, self.pwm_vaciado / 255)
+        self.h = float(self.modelo.paso(self.h, u, dt))
+        nivel = self.h + (self.rng.gauss(0.0, self.ruido) if self.ruido else 0.0)
+        nivel = min(max(nivel, 0.0), self.altura)
+        if self.directo is not None and time.monotonic() - self.t_directo > TIMEOUT_DIRECTO:
+            self.directo = None
+        if self.directo is not None:
+            # Mando directo: el PID queda listo para retomar sin integral ni derivada acumuladas
+            self.potencia = self.directo
+            self.control.bomba = 1 if self.directo > 1 else -1 if self.directo < -1 else 0
+            self.control.integral = 0.0
+            self.control.prev_error = self.control.setpoint - nivel
+        else:
+            self.potencia = self.control.paso(nivel, dt)
+
+        self.seq += 1
+        t_ms = int((time.monotonic() - self.inicio) * 1000)
+        if not self.conectado:
+            self.descartadas += 1
+            return
+        if self.lote > 1:
+            if not self.pendientes:
+                self.seq_lote = self.seq
+            self.pendientes.append((t_ms, nivel, self.potencia))
+            if len(self.pendientes) == self.lote:
+                await self._enviar(self._trama_lote(), len(self.pendientes))
+                self.pendientes = []
+        elif self.binario:
+            await self._enviar(protocolo.empaquetar_muestra(self.seq, t_ms, nivel, self.potencia), 1)
+        else:
+            await self._enviar(f"{protocolo.PREFIJO_MUESTRA}{self.seq},{t_ms},{nivel:.1f},{self.potencia:.1f}", 1)
+
+    def _trama_lote(self):
+        if self.binario:
+            return protocolo.empaquetar_lote(self.seq_lote, self.pendientes)
+        registros = "".join(f";{t_ms},{nivel:.1f},{potencia:.1f}" for t_ms, nivel, potencia in self.pendientes)
+        return f"{protocolo.PREFIJO_LOTE}{self.seq_lote}{registros}"
+
+    async def _enviar(self, mensaje, muestras):
+        try:
+            await self.websocket.send(mensaje)
+            self.enviadas += muestras
+        except ConnectionClosed:
+            self.descartadas += muestras
+            self.websocket = None
+
+    async def _reportar_lazo(self):
+        if not self.conectado:
+            return
+        mensaje = (f"{protocolo.PREFIJO_LAZO}{self.ciclos},{self.atrasos},{int(self.dt_max * 1e6)},"
+                   f"{int(self.ejecucion_max * 1e6)},0")
+        self.dt_max = self.ejecucion_max = 0.0
+        try:
+            await self.websocket.send(mensaje)
+        except ConnectionClosed:
+            self.websocket = None
+
+
+def resumen(dispositivos, segundos):
+    conectados = sum(dispositivo.conectado for dispositivo in dispositivos)
+    enviadas = sum(dispositivo.enviadas for dispositivo in dispositivos)
+    descartadas = sum(dispositivo.descartadas for dispositivo in dispositivos)
+    atrasos = sum(dispositivo.atrasos for dispositivo in dispositivos)
+    ciclos = sum(dispositivo.ciclos for dispositivo in dispositivos)
+    return (f"{conectados}/{len(dispositivos)} conectados, {enviadas} muestras enviadas "
+            f"({enviadas / max(segundos, 1e-9):.0f}/s), {descartadas} descartadas, {atrasos} atrasos en {ciclos} ciclos")
+
+
+async def emular(cantidad, host=HOST, puerto=PUERTO, periodo=PERIODO_CONTROL, lote=1, binario=True, ruido=0.0,
+                 duracion=None, prefijo="emu", modelo=None, semilla=0, informar=True):
+    """Arranca `cantidad` dispositivos virtuales en este bucle de eventos y devuelve la lista al terminar.
+
+    Los arranques se reparten en un periodo para que los ciclos de control no coincidan.
+    Con duracion=None corre hasta que se cancele.
+    """
+    modelo = modelo if modelo is not None else modelo_planta.cargar()
+    url = f"ws://{host}:{puerto}/"
+    dispositivos = [DispositivoVirtual(f"{prefijo}-{i:04d}", modelo, periodo, lote, binario, ruido, semilla + i)
+                    for i in range(cantidad)]
+
+    async def arrancar(dispositivo, retardo):
+        await asyncio.sleep(retardo)
+        await dispositivo.ejecutar(url)
+
+    tareas = [asyncio.create_task(arrancar(dispositivo, periodo * i / cantidad)) for i, dispositivo in enumerate(dispositivos)]
+    inicio = time.monotonic()
+    try:
+        while duracion is None or time.monotonic() - inicio < duracion:
+            restante = RESUMEN_CADA if duracion is None else min(RESUMEN_CADA, duracion - (time.monotonic() - inicio))
+            await asyncio.sleep(max(restante, 0.0))
+            if informar:
+                print(resumen(dispositivos, time.monotonic() - inicio))
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+    return dispositivos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulador de ESP32 LevelSense: dispositivos virtuales contra el backend")
+    parser.add_argument("--dispositivos", type=int, default=1, help="Cantidad de dispositivos virtuales")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--periodo", type=float, default=PERIODO_CONTROL * 1000, help="Periodo de control de cada dispositivo (ms)")
+    parser.add_argument("--lote", type=int, default=1, help="Muestras por trama (MUESTRAS_POR_LOTE, máximo 255)")
+    parser.add_argument("--texto", action="store_true", help="Anunciar solo el formato de texto (firmware sin binario)")
+    parser.add_argument("--ruido", type=float, default=0.0, help="Desviación estándar del ruido del sensor (cm)")
+    parser.add_argument("--duracion", type=float, default=None, help="Segundos de emulación (por defecto, hasta Ctrl+C)")
+    parser.add_argument("--prefijo", default="emu", help="Prefijo de los identificadores (<prefijo>-0000, ...)")
+    args = parser.parse_args()
+    if not 1 <= args.lote <= protocolo.MAX_MUESTRAS_LOTE:
+        parser.error(f"--lote debe estar entre 1 y {protocolo.MAX_MUESTRAS_LOTE}")
+
+    inicio = time.monotonic()
+    try:
+        dispositivos = asyncio.run(emular(args.dispositivos, args.host, args.puerto, args.periodo / 1000, args.lote,
+                                          not args.texto, args.ruido, args.duracion, args.prefijo))
+        print("Total: " + resumen(dispositivos, time.monotonic() - inicio))
+    except KeyboardInterrupt:
+        print("\nEmulación detenida manualmente.")
@@ -1,14 +1,6 @@
-import csv
-import os
+import time
 
-# Archivo CSV donde se almacenarán los datos simulados
-CSV_FILE = "data.csv"
-
-# Crear el archivo CSV con encabezados si no existe
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["Nivel", "Potencia"])  # Encabezados
+from telemetria import BufferTelemetria, CSV_FILE
 
 # Simular llenado y vaciado del recipiente
 nivel = 0.0
@@ -16,6 +8,9 @@ potencia = -100
 direction = 1  # 1 = subiendo, -1 = bajando
 
 try:
+    # Buffer de telemetría donde se almacenarán los datos simulados (data.bin); falla si el backend lo está usando
+    telemetria = BufferTelemetria()
+
     data = []
 
     while len(data) < 1000:  # Generar exactamente 1000 datos
@@ -36,11 +31,13 @@ try:
             nivel = 0.0
             direction = 1
 
-    # Escribir los datos generados en el archivo CSV
-    with open(CSV_FILE, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["Nivel", "Potencia"])  # Encabezados
-        writer.writerows(data)  # Escribir los datos generados
+    # Escribir los datos generados en el buffer (uno cada 100 ms, terminando ahora) y exportarlos al archivo CSV
+    inicio = time.time() - len(data) * 0.1
+    for i, (nivel, potencia) in enumerate(data):
+        tiempo = inicio + i * 0.1
+        telemetria.agregar(nivel, potencia, tiempo, i * 100.0, tiempo)  # Tiempo, reloj del dispositivo (ms) y recepción
+    telemetria.exportar_csv(CSV_FILE)
+    telemetria.cerrar()
 
     print(f"Generación completada: {len(data)} datos almacenados en '{CSV_FILE}'")
 
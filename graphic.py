@@ -1,16 +1,25 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
+import modelo_planta
+from modelo_planta import ModeloPlanta
+
+# Pendientes del modelo ajustado por identificacion.py (si no existe, las calculadas a mano en la hoja de mediciones)
+modelo = modelo_planta.cargar(predeterminado=ModeloPlanta(0.6225, 0.7705, 20.0))
+pendiente_llenado = float(modelo.v_llenado)
+pendiente_vaciado = -float(modelo.v_vaciado)
+y_max = float(modelo.h_max)
+
+# Calcular el valor de x donde la primera función alcanza el nivel máximo
+x_interseccion = y_max / pendiente_llenado
+print(f"La primera función alcanza y={y_max:.2f} en x={x_interseccion:.2f}")
+
 # Definir las funciones
 def funcion_1(x):
-    return 0.6225 * x
+    return pendiente_llenado * x
 
 def funcion_2(x):
-    return -0.7705 * x + 44.771  # Ajustada para que pase por (32.129, 20)
-
-# Calcular el valor de x donde y = 20 para la primera función
-x_interseccion = 32.129  # Resolviendo y = 20
-print(f"La primera función alcanza y=20 en x={x_interseccion:.2f}")
+    return pendiente_vaciado * (x - x_interseccion) + y_max  # Desplazada para que pase por (x_interseccion, y_max)
 
 # Rango de valores para la primera función
 x1 = np.linspace(0, x_interseccion, 100)  # Desde x=0 hasta x_interseccion
@@ -22,8 +31,8 @@ y2 = funcion_2(x2)
 
 # Graficar las funciones
 plt.figure(figsize=(10, 6))
-plt.plot(x1, y1, label="y = 0.6225x", color="blue")
-plt.plot(x2, y2, label="y = -0.7705x + 43.115 (desplazada)", color="red")
+plt.plot(x1, y1, label=f"y = {pendiente_llenado:.4f}x", color="blue")
+plt.plot(x2, y2, label=f"y = {pendiente_vaciado:.4f}x + {y_max - pendiente_vaciado * x_interseccion:.3f} (desplazada)", color="red")
 plt.title("Gráfica de las funciones")
 plt.xlabel("x")
 plt.ylabel("y")
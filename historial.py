@@ -0,0 +1,158 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from telemetria import BufferTelemetria
+
+# Carpeta con los niveles de resumen de cada dispositivo (<id>_1s.bin, <id>_1min.bin)
+DIRECTORIO_HISTORIAL = "historial"
+
+# Escalas de resumen: nombre, duración de cada intervalo (s) y registros que se conservan
+ESCALAS = (
+    ("1s", 1.0, 86_400),     # Un día a 1 s
+    ("1min", 60.0, 43_200),  # Treinta días a 1 min
+)
+
+# Columnas de cada intervalo resumido; Tiempo es el inicio del intervalo (época, s)
+CAMPOS_ESCALA = ("Tiempo", "Minimo", "Maximo", "Media", "Potencia", "Muestras")
+
+# Puntos máximos que devuelve una consulta por defecto
+MAX_PUNTOS = 2000
+
+# Resultado de una consulta: arreglos de igual largo y el nombre de la escala usada
+Serie = namedtuple("Serie", ["tiempo", "minimo", "maximo", "media", "potencia", "escala"])
+
+
+def ruta_historial(dispositivo, escala):
+    return os.path.join(DIRECTORIO_HISTORIAL, f"{dispositivo}_{escala}.bin")
+
+
+class Escala:
+    """Un nivel de resumen: acumula el intervalo en curso y guarda cada intervalo cerrado en su buffer circular."""
+
+    def __init__(self, ruta, periodo, capacidad):
+        self.periodo = periodo
+        self.buffer = BufferTelemetria(ruta, capacidad, CAMPOS_ESCALA)
+        self._intervalo = None  # Índice del intervalo en curso (floor(tiempo / periodo))
+        self._acumulado = None  # [mínimo, máximo, suma de niveles, suma de potencias, muestras]
+
+    def agregar(self, tiempo, minimo, maximo, suma, suma_potencia, muestras):
+        """Suma datos al intervalo en curso; si empiezan un intervalo nuevo, guarda y devuelve el anterior."""
+        intervalo = int(tiempo // self.periodo)
+        cerrado = None
+        if self._intervalo is not None and intervalo > self._intervalo:
+            cerrado = self.cerrar_intervalo()
+        if self._intervalo is None:
+            self._intervalo = intervalo
+            self._acumulado = [minimo, maximo, suma, suma_potencia, muestras]
+        else:
+            # Las muestras atrasadas se suman al intervalo en curso
+            acumulado = self._acumulado
+            acumulado[0] = min(acumulado[0], minimo)
+            acumulado[1] = max(acumulado[1], maximo)
+            acumulado[2] += suma
+            acumulado[3] += suma_potencia
+            acumulado[4] += muestras
+        return cerrado
+
+    def cerrar_intervalo(self):
+        minimo, maximo, suma, suma_potencia, muestras = self._acumulado
+        fila = (self._intervalo * self.periodo, minimo, maximo, suma / muestras, suma_potencia / muestras, muestras)
+        self.buffer.agregar(*fila)
+        self._intervalo = self._acumulado = None
+        return fila
+
+
+def _reagrupar(tiempo, minimo, maximo, media, potencia, pesos, max_puntos):
+    """Junta intervalos consecutivos para no pasar de max_puntos (mínimo de mínimos, máximo de máximos, medias ponderadas)."""
+    grupos = np.arange(0, len(tiempo), int(np.ceil(len(tiempo) / max_puntos)))
+    total = np.add.reduceat(pesos, grupos)
+    return (
+        tiempo[grupos],
+        np.minimum.reduceat(minimo, grupos),
+        np.maximum.reduceat(maximo, grupos),
+        np.add.reduceat(media * pesos, grupos) / total,
+        np.add.reduceat(potencia * pesos, grupos) / total,
+    )
+
+
+class Historial:
+    """Historial de largo plazo de un dispositivo.
+
+    La ventana reciente a resolución completa es el buffer de telemetría del dispositivo; detrás
+    de ella se guardan en disco resúmenes de 1 s y de 1 min (mínimo, máximo y media). consultar()
+    elige la escala más fina que cubre el intervalo pedido y nunca devuelve más de max_puntos.
+    """
+
+    def __init__(self, id_dispositivo, reciente):
+        os.makedirs(DIRECTORIO_HISTORIAL, exist_ok=True)
+        self.reciente = reciente
+        self.escalas = {nombre: Escala(ruta_historial(id_dispositivo, nombre), periodo, capacidad)
+                        for nombre, periodo, capacidad in ESCALAS}
+
+    def agregar(self, nivel, potencia, tiempo):
+        """Pasa una muestra a los resúmenes; cada intervalo cerrado de una escala alimenta a la siguiente."""
+        datos = (tiempo, nivel, nivel, nivel, potencia, 1)
+        for escala in self.escalas.values():
+            cerrado = escala.agregar(*datos)
+            if cerrado is None:
+                break
+            t_intervalo, minimo, maximo, media, media_potencia, muestras = cerrado
+            datos = (t_intervalo, minimo, maximo, media * muestras, media_potencia * muestras, muestras)
+
+    def _candidatos(self):
+        """Fuentes de la más fina a la más gruesa como (nombre, datos, periodo)."""
+        reciente = self.reciente.arreglo()
+        yield "reciente", reciente, None
+        for nombre, escala in self.escalas.items():
+            yield nombre, escala.buffer.arreglo(), escala.periodo
+
+    def consultar(self, t_inicio, t_fin, max_puntos=MAX_PUNTOS):
+        """Devuelve la Serie entre t_inicio y t_fin (época, s) con a lo sumo max_puntos puntos.
+
+        Se usa la escala más fina que ya tiene datos desde t_inicio o, si ninguna llega tan
+        atrás, la que más historia tenga. Si sus intervalos no caben en max_puntos se juntan
+        de a varios (mínimo, máximo y media ponderada), así que la resolución es la mejor posible.
+        """
+        opciones = []  # (nombre, datos en el intervalo, periodo, primer tiempo)
+        elegida = None
+        for nombre, datos, periodo in self._candidatos():
+            if not len(datos):
+                continue
+            tiempo = datos[:, 0] if periodo is not None else datos[:, 2]
+            desde, hasta = np.searchsorted(tiempo, [t_inicio, t_fin], side="right")
+            if periodo is not None:
+                desde = max(desde - 1, 0)  # Incluir el intervalo que contiene a t_inicio
+            opcion = (nombre, datos[desde:hasta], periodo, tiempo[0])
+            if tiempo[0] <= t_inicio:
+                elegida = opcion
+                break
+            opciones.append(opcion)
+
+        if elegida is None:
+            if not opciones:
+                vacio = np.empty(0)
+                return Serie(vacio, vacio, vacio, vacio, vacio, None)
+            elegida = min(opciones, key=lambda opcion: opcion[3])
+
+        nombre, datos, periodo, _ = elegida
+        if periodo is None:
+            # Ventana reciente: columnas Nivel, Potencia, Tiempo
+            nivel, potencia, tiempo = datos[:, 0], datos[:, 1], datos[:, 2]
+            columnas = (tiempo, nivel, nivel, nivel, potencia)
+            pesos = np.ones(len(tiempo))
+        else:
+            columnas = (datos[:, 0], datos[:, 1], datos[:, 2], datos[:, 3], datos[:, 4])
+            pesos = datos[:, 5]
+        if len(columnas[0]) > max_puntos:
+            columnas = _reagrupar(*columnas, pesos, max_puntos)
+        return Serie(*columnas, nombre)
+
+    def sincronizar(self):
+        for escala in self.escalas.values():
+            escala.buffer.sincronizar()
+
+    def cerrar(self):
+        for escala in self.escalas.values():
+            escala.buffer.cerrar()
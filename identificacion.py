@@ -0,0 +1,316 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from itertools import islice
+
+import numpy as np
+
+from modelo_planta import ARCHIVO_MODELO, ModeloPlanta
+
+# Registros que se ajustan por defecto (los que existan)
+FUENTES = ("medicionesreales.csv", "data.csv", "Mediciones planta.xlsx")
+
+# Filas que se leen por bloque: la memoria no depende del largo de los registros
+BLOQUE = 10000
+
+# Periodo de muestreo cuando el registro no tiene columna de tiempo (el firmware muestrea cada 100 ms)
+PERIODO_MUESTREO = 0.1
+
+# Huecos de tiempo mayores a este valor (s) separan corridas y no se usan como derivada
+MAX_HUECO = 1.0
+
+# Se descartan las muestras a menos de este margen (cm) del nivel mínimo o máximo de la serie:
+# ahí el tanque está lleno, vacío o en reposo y el sensor ultrasónico es menos preciso
+MARGEN_SATURACION = 2.0
+
+# Filas del inicio de cada hoja donde se busca el encabezado
+FILAS_ENCABEZADO = 5
+
+# Mínimo de muestras por sentido y máximo error (RMSE de la velocidad, cm/s) para guardar el
+# modelo. Con 0.1 cm de ruido en el sensor la derivada a 100 ms ya tiene ~1.4 cm/s de RMSE;
+# mucho más que eso indica que el ajuste sigue al ruido y no a la planta
+MIN_MUESTRAS = 200
+MAX_RMSE = 2.0
+
+
+class AjusteLineal:
+    """Mínimos cuadrados de velocidad = pendiente·|u| + ordenada acumulando sumas por bloque.
+
+    Solo guarda las sumas (n, Σx, Σy, Σx², Σxy, Σy²), así que se pueden agregar millones de
+    muestras sin tenerlas en memoria.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def agregar(self, x, y):
+        self.n += len(x)
+        self.sx += x.sum()
+        self.sy += y.sum()
+        self.sxx += (x * x).sum()
+        self.sxy += (x * y).sum()
+        self.syy += (y * y).sum()
+
+    def resolver(self):
+        """Devuelve (pendiente, ordenada, rmse) o None si no hay muestras.
+
+        Si todas las muestras tienen la misma potencia (por ejemplo solo ±100%) la curva no se
+        puede separar de la zona muerta y se ajusta una recta por el origen.
+        """
+        if self.n == 0:
+            return None
+        varianza = self.sxx - self.sx * self.sx / self.n
+        if varianza <= 1e-9 * self.n:
+            pendiente, ordenada = self.sy / self.sx, 0.0
+        else:
+            pendiente = (self.sxy - self.sx * self.sy / self.n) / varianza
+            ordenada = (self.sy - pendiente * self.sx) / self.n
+        residuo = (self.syy - 2 * pendiente * self.sxy - 2 * ordenada * self.sy + pendiente ** 2 * self.sxx
+                   + 2 * pendiente * ordenada * self.sx + self.n * ordenada ** 2)
+        return pendiente, ordenada, float(np.sqrt(max(residuo, 0.0) / self.n))
+
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bloques_csv(ruta, bloque):
+    """Lee un CSV con columnas Nivel y, opcionalmente, Potencia (%) y Tiempo (s) por bloques (t, h, u)."""
+    with open(ruta, newline="") as file:
+        reader = csv.reader(file)
+        encabezado = [columna.strip() for columna in next(reader, [])]
+        if "Nivel" not in encabezado:
+            return
+        columnas = [encabezado.index("Nivel")]
+        for nombre in ("Potencia", "Tiempo"):
+            columnas.append(encabezado.index(nombre) if nombre in encabezado else None)
+        i_nivel, i_potencia, i_tiempo = columnas
+        leidas = 0
+        while True:
+            filas = list(islice(reader, bloque))
+            if not filas:
+                return
+            validas = []
+            for k, fila in enumerate(filas):
+                valores = [_numero(fila[i]) if i is not None and i < len(fila) else None for i in columnas]
+                if valores[0] is None:
+                    continue
+                if valores[1] is None:
+                    valores[1] = np.nan
+                if valores[2] is None:
+                    valores[2] = (leidas + k) * PERIODO_MUESTREO
+                validas.append(valores)
+            leidas += len(filas)
+            if validas:
+                datos = np.array(validas, dtype=float)
+                u = datos[:, 1] / 100 if i_potencia is not None else None
+                yield datos[:, 2], datos[:, 0], u
+
+
+def _series_hoja(ws):
+    """Busca en el encabezado de la hoja pares de columnas 'Tiempo...' / 'Nivel...' (con 'Potencia...' opcional)."""
+    for fila in islice(ws.iter_rows(values_only=True), FILAS_ENCABEZADO):
+        nombres = [str(valor).strip().lower() if valor is not None else "" for valor in fila]
+        series = []
+        for j, nombre in enumerate(nombres[:-1]):
+            if nombre.startswith("tiempo") and nombres[j + 1].startswith("nivel"):
+                potencia = j + 2 if j + 2 < len(nombres) and nombres[j + 2].startswith("potencia") else None
+                series.append((j, j + 1, potencia))
+        if series:
+            return series
+    return []
+
+
+def _bloques_hoja(ruta, hoja, columnas, bloque):
+    """Lee una serie de una hoja de Excel en modo solo lectura (fila por fila, sin cargar el libro completo)."""
+    import openpyxl
+
+    j_tiempo, j_nivel, j_potencia = columnas
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        validas = []
+        for fila in libro[hoja].iter_rows(values_only=True):
+            tiempo = _numero(fila[j_tiempo]) if j_tiempo < len(fila) else None
+            nivel = _numero(fila[j_nivel]) if j_nivel < len(fila) else None
+            if tiempo is None or nivel is None:
+                continue
+            potencia = _numero(fila[j_potencia]) if j_potencia is not None and j_potencia < len(fila) else None
+            validas.append((tiempo, nivel, np.nan if potencia is None else potencia))
+            if len(validas) == bloque:
+                yield _a_bloque(validas, j_potencia)
+                validas = []
+        if validas:
+            yield _a_bloque(validas, j_potencia)
+    finally:
+        libro.close()
+
+
+def _a_bloque(validas, j_potencia):
+    datos = np.array(validas, dtype=float)
+    return datos[:, 0], datos[:, 1], datos[:, 2] / 100 if j_potencia is not None else None
+
+
+def series(ruta, bloque=BLOQUE):
+    """Series de medición de un archivo: (nombre, función que devuelve un iterador nuevo de bloques (t, h, u)).
+
+    u es la potencia normalizada a [-1, 1], o None si el registro no la tiene.
+    """
+    if ruta.lower().endswith(".csv"):
+        return [(ruta, lambda: _bloques_csv(ruta, bloque))]
+    if ruta.lower().endswith(".xlsx"):
+        import openpyxl
+
+        libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            encontradas = []
+            for ws in libro.worksheets:
+                for n, columnas in enumerate(_series_hoja(ws), 1):
+                    nombre = f"{ruta} [{ws.title} #{n}]"
+                    encontradas.append((nombre, lambda hoja=ws.title, c=columnas: _bloques_hoja(ruta, hoja, c, bloque)))
+            return encontradas
+        finally:
+            libro.close()
+    print(f"Formato no soportado: {ruta}")
+    return []
+
+
+def _extremos(bloques):
+    """Primera pasada: nivel mínimo, máximo, posición del máximo y número de muestras."""
+    h_min, h_max, i_max, n = np.inf, -np.inf, 0, 0
+    for _, h, _ in bloques:
+        if h.min() < h_min:
+            h_min = h.min()
+        if h.max() > h_max:
+            h_max, i_max = h.max(), n + int(h.argmax())
+        n += len(h)
+    return h_min, h_max, i_max, n
+
+
+def acumular(bloques, extremos, llenado, vaciado):
+    """Segunda pasada: agrega a los ajustes la velocidad de cada intervalo entre muestras.
+
+    El mando de la muestra i actúa sobre el cambio de nivel hasta la muestra i+1. Sin columna
+    de potencia la serie se toma como un ensayo de llenado al 100% hasta el máximo y de
+    vaciado al 100% después (como las hojas de Mediciones planta.xlsx). Devuelve las muestras usadas.
+    """
+    h_min, h_max, i_max, _ = extremos
+    anterior = None
+    inicio = 0
+    usadas = 0
+    for t, h, u in bloques:
+        if u is None:
+            u = np.where(np.arange(inicio, inicio + len(h)) < i_max, 1.0, -1.0)
+        inicio += len(h)
+        if anterior is not None:
+            t, h, u = (np.concatenate(([a], b)) for a, b in zip(anterior, (t, h, u)))
+        anterior = (t[-1], h[-1], u[-1])
+        if len(h) < 2:
+            continue
+
+        dt = np.diff(t)
+        velocidad = np.diff(h) / np.where(dt > 0, dt, 1.0)
+        mando = u[:-1]
+        alto = np.maximum(h[:-1], h[1:])
+        bajo = np.minimum(h[:-1], h[1:])
+        validas = ((dt > 0) & (dt <= MAX_HUECO) & np.isfinite(mando)
+                   & (bajo > h_min + MARGEN_SATURACION) & (alto < h_max - MARGEN_SATURACION))
+
+        subiendo = validas & (mando > 0)
+        bajando = validas & (mando < 0)
+        llenado.agregar(mando[subiendo], velocidad[subiendo])
+        vaciado.agregar(-mando[bajando], -velocidad[bajando])
+        usadas += int(subiendo.sum() + bajando.sum())
+    return usadas
+
+
+def identificar(rutas, bloque=BLOQUE, altura=None):
+    """Ajusta las velocidades, la zona muerta y la curva potencia→velocidad a partir de los registros.
+
+    h_max es el mayor nivel medido salvo que se indique la altura del recipiente.
+    Devuelve un diccionario listo para guardar en modelo_planta.json.
+    """
+    llenado, vaciado = AjusteLineal(), AjusteLineal()
+    h_max = -np.inf
+    fuentes = []
+    for ruta in rutas:
+        for nombre, bloques in series(ruta, bloque):
+            extremos = _extremos(bloques())
+            if extremos[3] < 2:
+                continue
+            usadas = acumular(bloques(), extremos, llenado, vaciado)
+            h_max = max(h_max, extremos[1])
+            fuentes.append({"serie": nombre, "muestras": extremos[3], "usadas": usadas})
+            print(f"{nombre}: {extremos[3]} muestras, {usadas} usadas en el ajuste")
+
+    predeterminado = ModeloPlanta()
+    if altura is not None:
+        h_max = altura
+    modelo = {"h_max": float(h_max) if np.isfinite(h_max) else float(predeterminado.h_max)}
+    curvas = {}
+    for accion, ajuste, v_defecto in (("llenado", llenado, predeterminado.v_llenado),
+                                      ("vaciado", vaciado, predeterminado.v_vaciado)):
+        resultado = ajuste.resolver()
+        if resultado is None:
+            print(f"Sin datos de {accion}; se conserva la velocidad por defecto")
+            modelo[f"v_{accion}"], modelo[f"zona_{accion}"] = float(v_defecto), 0.0
+            continue
+        pendiente, ordenada, rmse = resultado
+        # velocidad = v·(|u| - z)/(1 - z)  ->  v = pendiente + ordenada, z = -ordenada/pendiente
+        modelo[f"v_{accion}"] = float(pendiente + ordenada)
+        # max(0.0, ...) porque con ordenada 0.0 (una sola potencia) el cociente es -0.0 y se guardaría así en el JSON
+        modelo[f"zona_{accion}"] = max(0.0, float(np.clip(-ordenada / pendiente, 0.0, 0.99))) if pendiente > 0 else 0.0
+        curvas[accion] = {"pendiente": float(pendiente), "ordenada": float(ordenada),
+                          "muestras": ajuste.n, "rmse": rmse}
+    modelo["curva"] = curvas
+    modelo["fuentes"] = fuentes
+    return modelo
+
+
+def problemas(modelo, min_muestras=MIN_MUESTRAS, max_rmse=MAX_RMSE):
+    """Motivos por los que el ajuste no es confiable (lista vacía si se puede guardar)."""
+    motivos = []
+    for accion in ("llenado", "vaciado"):
+        curva = modelo["curva"].get(accion)
+        if curva is None:
+            motivos.append(f"sin muestras de {accion}")
+        elif curva["muestras"] < min_muestras:
+            motivos.append(f"{accion}: {curva['muestras']} muestras (mínimo {min_muestras})")
+        elif curva["rmse"] > max_rmse:
+            motivos.append(f"{accion}: RMSE {curva['rmse']:.3f} cm/s (máximo {max_rmse})")
+    return motivos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identificación de los parámetros de la planta a partir de registros de nivel")
+    parser.add_argument("rutas", nargs="*", help="CSV (Nivel, Potencia, Tiempo) o libros de Excel; por defecto los registros del repositorio")
+    parser.add_argument("--salida", default=ARCHIVO_MODELO)
+    parser.add_argument("--h-max", type=float, default=None, help="Altura del recipiente (cm); por defecto el mayor nivel medido")
+    parser.add_argument("--bloque", type=int, default=BLOQUE, help="Filas por bloque de lectura")
+    parser.add_argument("--min-muestras", type=int, default=MIN_MUESTRAS, help="Muestras mínimas por sentido para guardar el modelo")
+    parser.add_argument("--max-rmse", type=float, default=MAX_RMSE, help="RMSE máximo de la velocidad (cm/s) para guardar el modelo")
+    parser.add_argument("--forzar", action="store_true", help="Guardar el modelo aunque no cumpla los mínimos")
+    args = parser.parse_args()
+
+    rutas = args.rutas or [ruta for ruta in FUENTES if os.path.exists(ruta)]
+    modelo = identificar(rutas, args.bloque, args.h_max)
+
+    print(f"\nh_max = {modelo['h_max']:.2f} cm")
+    for accion in ("llenado", "vaciado"):
+        curva = modelo["curva"].get(accion)
+        detalle = f"  (RMSE {curva['rmse']:.3f} cm/s, {curva['muestras']} muestras)" if curva else ""
+        print(f"v_{accion} = {modelo[f'v_{accion}']:.4f} cm/s, zona muerta = {modelo[f'zona_{accion}'] * 100:.1f}%{detalle}")
+
+    motivos = problemas(modelo, args.min_muestras, args.max_rmse)
+    if motivos and not args.forzar:
+        print(f"\nNo se guarda '{args.salida}': " + "; ".join(motivos) + ". Use --forzar para guardarlo igual.")
+        sys.exit(1)
+
+    with open(args.salida, "w") as file:
+        json.dump(modelo, file, indent=2)
+    print(f"Modelo guardado en '{args.salida}'")
@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+
+# Archivo con el modelo ajustado por identificacion.py (lo cargan los simuladores)
+ARCHIVO_MODELO = "modelo_planta.json"
+
+# Parámetros por defecto del tanque (los de controlps.py)
+H_MAX = 20.0          # Altura máxima (cm)
+V_LLENADO = 0.726     # Velocidad de subida con la bomba de llenado al 100% (cm/s)
+V_VACIADO = 0.5262    # Velocidad de bajada con la bomba de vaciado al 100% (cm/s)
+
+
+class ModeloPlanta:
+    """Modelo del tanque: el nivel cambia a una velocidad proporcional al mando u ∈ [-1, 1].
+
+    u > 0 llena a v_llenado·u cm/s, u < 0 vacía a v_vaciado·|u| cm/s y el nivel queda
+    limitado a [0, h_max]. Con zona muerta z, un mando |u| <= z no mueve el agua y por
+    encima la velocidad crece en línea recta hasta v al 100%: v·(|u| - z)/(1 - z).
+    Los parámetros pueden ser arreglos (una geometría por elemento) para evaluar muchos
+    tanques a la vez.
+    """
+
+    def __init__(self, v_llenado=V_LLENADO, v_vaciado=V_VACIADO, h_max=H_MAX, zona_llenado=0.0, zona_vaciado=0.0):
+        self.v_llenado = np.asarray(v_llenado, dtype=float)
+        self.v_vaciado = np.asarray(v_vaciado, dtype=float)
+        self.h_max = np.asarray(h_max, dtype=float)
+        self.zona_llenado = np.asarray(zona_llenado, dtype=float)
+        self.zona_vaciado = np.asarray(zona_vaciado, dtype=float)
+        self._con_zona = bool(np.any(self.zona_llenado) or np.any(self.zona_vaciado))
+
+    @classmethod
+    def desde_caudales(cls, Q_llenado, Q_vaciado, area_cm2, h_max):
+        """Crea el modelo a partir de caudales (cm³/s) y área transversal (cm²), como en Planta.py."""
+        area_cm2 = np.asarray(area_cm2, dtype=float)
+        return cls(np.asarray(Q_llenado) / area_cm2, np.asarray(Q_vaciado) / area_cm2, h_max)
+
+    @property
+    def geometrias(self):
+        """Número de tanques que representa el modelo (1 si los parámetros son escalares)."""
+        return np.broadcast(*self._parametros()).size
+
+    def _parametros(self):
+        return self.v_llenado, self.v_vaciado, self.h_max, self.zona_llenado, self.zona_vaciado
+
+    def velocidad(self, u):
+        """Velocidad de cambio del nivel (cm/s) para el mando u."""
+        u = np.asarray(u, dtype=float)
+        if self._con_zona:
+            zona = np.where(u > 0, self.zona_llenado, self.zona_vaciado)
+            u = np.sign(u) * np.clip((np.abs(u) - zona) / (1 - zona), 0, None)
+        return u * np.where(u > 0, self.v_llenado, self.v_vaciado)
+
+    def paso(self, h, u, dt, out=None):
+        """Avanza el nivel un paso dt con el mando u constante."""
+        return np.clip(h + self.velocidad(u) * dt, 0, self.h_max, out=out)
+
+    def perfil(self, t, inicios, mandos, h0=0.0):
+        """Nivel en los instantes t para un mando constante por tramos (solución cerrada).
+
+        inicios son los instantes en que empieza cada tramo y mandos el u de cada uno. Dentro
+        de un tramo el nivel es una recta recortada a [0, h_max], así que cada tramo se
+        resuelve con unas pocas operaciones sobre todo el arreglo de tiempos en lugar de un
+        paso por muestra. Con parámetros vectoriales devuelve una fila por geometría.
+        """
+        t = np.asarray(t, dtype=float)
+        inicios = np.asarray(inicios, dtype=float)
+        mandos = np.asarray(mandos, dtype=float)
+        g = self.geometrias
+        h_max = np.broadcast_to(self.h_max, (g,))[:, None]
+
+        niveles = np.empty((g, len(t)))
+        h_inicio = np.broadcast_to(np.asarray(h0, dtype=float), (g,))[:, None]
+        niveles[:, t <= inicios[0]] = h_inicio
+        for k in range(len(inicios)):
+            fin = inicios[k + 1] if k + 1 < len(inicios) else np.inf
+            tramo = (t > inicios[k]) & (t <= fin)
+            velocidad = np.broadcast_to(self.velocidad(mandos[k]), (g,))[:, None]
+            niveles[:, tramo] = np.clip(h_inicio + velocidad * (t[tramo] - inicios[k]), 0, h_max)
+            if np.isfinite(fin):
+                h_inicio = np.clip(h_inicio + velocidad * (fin - inicios[k]), 0, h_max)
+
+        return niveles[0] if all(p.ndim == 0 for p in self._parametros()) else niveles
+
+
+def cargar(ruta=ARCHIVO_MODELO, predeterminado=None):
+    """Carga el modelo ajustado por identificacion.py; si el archivo no existe devuelve predeterminado
+    (o el modelo con los parámetros por defecto)."""
+    if not os.path.exists(ruta):
+        return predeterminado if predeterminado is not None else ModeloPlanta()
+    with open(ruta) as file:
+        datos = json.load(file)
+    return ModeloPlanta(datos["v_llenado"], datos["v_vaciado"], datos["h_max"],
+                        datos.get("zona_llenado", 0.0), datos.get("zona_vaciado", 0.0))
@@ -0,0 +1,215 @@
+import argparse
+import time
+
+import numpy as np
+
+import modelo_planta
+
+# Periodo del control (s); el backend recibe una muestra por ciclo del firmware
+PERIODO = 0.1
+
+# Horizonte de predicción en ciclos y ciclos del primer bloque de mando (el resto del horizonte usa el segundo)
+HORIZONTE = 40
+BLOQUE = 5
+
+# Niveles de mando que se prueban en cada sentido, entre MANDO_MINIMO y 100% (además de apagar la bomba)
+NIVELES = 20
+
+# Por debajo de este mando el firmware igual aplica el PWM mínimo (65/255): no se usan mandos menores
+MANDO_MINIMO = 65 / 255
+
+# Pesos del costo: error² (cm²·s) + PESO_MANDO·u²·s + PESO_CAMBIO·Δu² + PESO_INVERSION por cambiar el sentido de la bomba
+PESO_MANDO = 0.5
+PESO_CAMBIO = 2.0
+PESO_INVERSION = 5.0
+
+# Sin un p: nuevo en este tiempo el firmware vuelve a su PID (TIMEOUT_DIRECTO_MS en LevelSense.ino)
+TIMEOUT_DIRECTO = 1.0
+
+# Banda alrededor del setpoint en la que se da por asentado el nivel en la comparación (cm)
+TOLERANCIA = 0.5
+
+
+class ControladorMPC:
+    """Control predictivo sobre el modelo de llenado/vaciado de modelo_planta.
+
+    En cada ciclo se prueban a la vez todos los pares de mandos (u1 durante los primeros
+    BLOQUE ciclos, u2 el resto del horizonte) y se aplica el u1 del par de menor costo. Dentro
+    de un bloque el mando es constante, así que el nivel es una recta recortada a [0, h_max]
+    y toda la predicción sale de un par de operaciones sobre una matriz (pares × horizonte)
+    precalculada, sin simular paso a paso. Como los mandos posibles respetan el PWM mínimo del
+    firmware y cambiar el sentido de la bomba tiene costo, cerca del setpoint el controlador
+    apaga la bomba en lugar de conmutarla.
+    """
+
+    def __init__(self, modelo, periodo=PERIODO, horizonte=HORIZONTE, bloque=BLOQUE, niveles=NIVELES,
+                 peso_mando=PESO_MANDO, peso_cambio=PESO_CAMBIO, peso_inversion=PESO_INVERSION, mando_minimo=MANDO_MINIMO):
+        self.modelo = modelo
+        self.periodo = periodo
+        self.mando_minimo = mando_minimo
+        self.h_max = float(modelo.h_max)
+        self.setpoint = 0.0
+        self.u = 0.0  # Último mando aplicado (-1 a 1)
+        self.sentido = 0.0  # Sentido del último mando con la bomba encendida (1 llenar, -1 vaciar)
+
+        positivos = np.linspace(mando_minimo, 1.0, niveles)
+        mandos = np.concatenate((-positivos[::-1], [0.0], positivos))
+        self.u1, self.u2 = (m.ravel() for m in np.meshgrid(mandos, mandos, indexing="ij"))
+        t = np.arange(1, horizonte + 1) * periodo
+        t1 = np.minimum(t, bloque * periodo)
+        t2 = t - t1
+        self._avance1 = modelo.velocidad(self.u1)[:, None] * t1  # Cambio de nivel sin recortar (pares × horizonte)
+        self._avance2 = modelo.velocidad(self.u2)[:, None] * t2
+        self._costo_mando = (peso_mando * periodo * (self.u1 ** 2 * min(bloque, horizonte) + self.u2 ** 2 * max(horizonte - bloque, 0))
+                             + peso_cambio * (self.u2 - self.u1) ** 2
+                             + peso_inversion * (self.u1 * self.u2 < 0))
+        self.peso_cambio = peso_cambio
+        self.peso_inversion = peso_inversion
+
+        # Estadísticas
+        self.calculos = 0
+        self.tiempo_max = 0.0
+
+    def mando(self, nivel, referencia=None):
+        """Mando óptimo (-1 a 1) para el nivel medido; referencia es el setpoint (escalar o uno por ciclo del horizonte)."""
+        inicio = time.perf_counter()
+        referencia = self.setpoint if referencia is None else referencia
+        h = np.clip(np.clip(nivel + self._avance1, 0, self.h_max) + self._avance2, 0, self.h_max)
+        h -= referencia
+        costo = np.einsum("ij,ij->i", h, h) * self.periodo + self._costo_mando + self.peso_cambio * (self.u1 - self.u) ** 2
+        costo += self.peso_inversion * (self.u1 * self.sentido < 0)
+        self.u = float(self.u1[np.argmin(costo)])
+        if self.u:
+            self.sentido = np.sign(self.u)
+
+        self.calculos += 1
+        self.tiempo_max = max(self.tiempo_max, time.perf_counter() - inicio)
+        return self.u
+
+    def texto(self):
+        return (f"setpoint {self.setpoint:.1f} cm, último mando {self.u * 100:.0f}%, {self.calculos} mandos, "
+                f"cálculo máx {self.tiempo_max * 1000:.2f} ms")
+
+
+def mando_aplicado(u, minimo_llenado=MANDO_MINIMO, minimo_vaciado=MANDO_MINIMO):
+    """Mando que llega a la bomba: el firmware sube al PWM mínimo de cada sentido todo mando de más de 1%."""
+    if u > 0.01:
+        return float(max(u, minimo_llenado))
+    if u < -0.01:
+        return float(-max(-u, minimo_vaciado))
+    return 0.0
+
+
+def simular(controlar, planta, setpoint, periodo=PERIODO, ruido=0.0, semilla=0, inicial=0.0,
+            minimo_llenado=MANDO_MINIMO, minimo_vaciado=MANDO_MINIMO):
+    """Lazo cerrado en simulación: controlar(nivel, dt, setpoint) devuelve la potencia (%) del ciclo.
+
+    La planta parte del nivel inicial y recibe el mando del ciclo anterior con el PWM mínimo
+    del firmware (fracción de 255 en cada sentido). Devuelve el nivel y la potencia de cada ciclo.
+    """
+    rng = np.random.default_rng(semilla)
+    h = np.full(len(setpoint), float(inicial))
+    potencia = np.zeros(len(setpoint))
+    for i in range(1, len(setpoint)):
+        h[i] = planta.paso(h[i - 1], mando_aplicado(potencia[i - 1] / 100.0, minimo_llenado, minimo_vaciado), periodo)
+        medido = h[i] + (rng.normal(0.0, ruido) if ruido else 0.0)
+        potencia[i] = controlar(float(np.clip(medido, 0, planta.h_max)), periodo, setpoint[i])
+    return h, potencia
+
+
+def metricas(h, potencia, setpoint, periodo=PERIODO):
+    """Asentamiento (peor tramo, s; inf si no se asienta), sobrepaso (cm), IAE (cm·s) y cambios de sentido de la bomba."""
+    cambios = np.nonzero(np.diff(setpoint))[0] + 1
+    inicios = np.concatenate(([1], cambios))
+    finales = np.concatenate((cambios, [len(setpoint)]))
+    asentamiento, sobrepaso = 0.0, 0.0
+    for inicio, fin in zip(inicios, finales):
+        objetivo = setpoint[inicio]
+        fuera = np.nonzero(np.abs(h[inicio:fin] - objetivo) > TOLERANCIA)[0]
+        if len(fuera) and fuera[-1] == fin - inicio - 1:
+            asentamiento = np.inf
+        elif len(fuera):
+            asentamiento = max(asentamiento, (fuera[-1] + 1) * periodo)
+        sentido = np.sign(objetivo - h[inicio - 1])
+        if sentido:
+            sobrepaso = max(sobrepaso, float(np.max((h[inicio:fin] - objetivo) * sentido)))
+    signos = np.sign(potencia[np.abs(potencia) > 1.0])
+    return {
+        "asentamiento": asentamiento,
+        "sobrepaso": sobrepaso,
+        "iae": float(np.sum(np.abs(setpoint - h)) * periodo),
+        "cambios_sentido": int(np.count_nonzero(np.diff(signos))),
+        "energia": float(np.sum(np.abs(potencia)) / 100 * periodo),
+    }
+
+
+def benchmark(programa="0:15,60:5,120:18", t_total=180.0, error_modelo=0.0, ruido=0.0, grafica=False):
+    """Compara en simulación el PID con histéresis del firmware con el controlador predictivo.
+
+    La planta es el modelo identificado (modelo_planta.json o el predeterminado); con
+    error_modelo el MPC usa velocidades equivocadas en esa fracción para ver su robustez.
+    """
+    from emulador import ControlFirmware
+    from sintonizador import construir_setpoint
+
+    planta = modelo_planta.cargar()
+    setpoint = construir_setpoint(programa, t_total, PERIODO)
+    t = np.arange(len(setpoint)) * PERIODO
+
+    pid = ControlFirmware()
+
+    def controlar_pid(nivel, dt, sp):
+        pid.setpoint = sp
+        return pid.paso(nivel, dt)
+
+    modelo_mpc = modelo_planta.ModeloPlanta(planta.v_llenado * (1 + error_modelo), planta.v_vaciado * (1 + error_modelo),
+                                            planta.h_max, planta.zona_llenado, planta.zona_vaciado)
+    mpc = ControladorMPC(modelo_mpc)
+
+    def controlar_mpc(nivel, dt, sp):
+        mpc.setpoint = sp
+        return mpc.mando(nivel) * 100.0
+
+    resultados = {}
+    for nombre, controlar in (("PID firmware", controlar_pid), ("MPC backend", controlar_mpc)):
+        inicio = time.perf_counter()
+        h, potencia = simular(controlar, planta, setpoint, ruido=ruido)
+        resultados[nombre] = (h, potencia, metricas(h, potencia, setpoint), (time.perf_counter() - inicio) / len(setpoint))
+
+    print(f"Setpoint '{programa}' durante {t_total:.0f} s, periodo {PERIODO * 1000:.0f} ms, "
+          f"error del modelo {error_modelo * 100:.0f}%, ruido {ruido} cm")
+    print(f"{'Controlador':<14}{'Asentamiento (s)':>18}{'Sobrepaso (cm)':>16}{'IAE (cm·s)':>12}"
+          f"{'Cambios sentido':>17}{'Energía (s)':>13}{'Ciclo (ms)':>12}")
+    for nombre, (_, _, m, por_ciclo) in resultados.items():
+        asentamiento = f"{m['asentamiento']:.1f}" if np.isfinite(m["asentamiento"]) else "no se asienta"
+        print(f"{nombre:<14}{asentamiento:>18}{m['sobrepaso']:>16.2f}{m['iae']:>12.1f}"
+              f"{m['cambios_sentido']:>17}{m['energia']:>13.1f}{por_ciclo * 1000:>12.3f}")
+
+    if grafica:
+        import matplotlib.pyplot as plt
+
+        figura, (ax_nivel, ax_potencia) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+        for nombre, (h, potencia, _, _) in resultados.items():
+            ax_nivel.plot(t, h, label=nombre)
+            ax_potencia.plot(t, potencia, label=nombre)
+        ax_nivel.plot(t, setpoint, "k--", label="Setpoint", linewidth=2)
+        ax_nivel.set_ylabel("Altura del agua (cm)")
+        ax_potencia.set_ylabel("Potencia (%)")
+        ax_potencia.set_xlabel("Tiempo (s)")
+        for ax in (ax_nivel, ax_potencia):
+            ax.legend()
+            ax.grid(True)
+        figura.tight_layout()
+        plt.show()
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara en simulación el control predictivo del backend con el PID del firmware")
+    parser.add_argument("--setpoint", default="0:15,60:5,120:18", help="Programa de setpoint 't0:valor,t1:valor,...' (cm)")
+    parser.add_argument("--t-total", type=float, default=180.0, help="Duración de la simulación (s)")
+    parser.add_argument("--error-modelo", type=float, default=0.0, help="Error relativo de las velocidades que usa el MPC (0.2 = 20%%)")
+    parser.add_argument("--ruido", type=float, default=0.0, help="Desvío estándar del ruido del sensor (cm)")
+    parser.add_argument("--grafica", action="store_true")
+    args = parser.parse_args()
+    benchmark(args.setpoint, args.t_total, args.error_modelo, args.ruido, args.grafica)
@@ -0,0 +1,127 @@
+import argparse
+import sys
+import threading
+import time
+
+# Instante de arranque: el tiempo hasta el primer tablero se mide desde aquí
+INICIO = time.perf_counter()
+
+from Backend import HOST, PUERTO, detener, ejecutar_comando, iniciar_en_hilo, registro, suscribir
+
+# Cada cuántos segundos se redibuja el tablero
+REFRESCO = 1.0
+
+# Una muestra más vieja que esto se marca como atrasada en el tablero (s)
+MUESTRA_VIEJA = 5.0
+
+_LIMPIAR = "\033[H\033[J"  # Cursor al inicio y borrar la pantalla (ANSI)
+
+
+class Panel:
+    """Tablero de texto para PCs de panel sin pantalla gráfica: último estado de cada dispositivo.
+
+    Se suscribe al backend que corre en el mismo proceso (como LevelSenseUI) y no importa
+    Qt ni matplotlib, así que arranca en lo que tarda el backend en abrir sus buffers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.estado = {}        # dispositivo → [nivel, potencia, tiempo, muestras recibidas]
+        self.respuesta = ""     # Resultado del último comando escrito por el operador
+        self.arranque_ms = None
+
+        # Último estado conocido de los dispositivos con buffer en disco
+        for dispositivo in registro.todos():
+            ultimas = dispositivo.telemetria.ultimas(1)
+            if ultimas:
+                nivel, potencia, tiempo = ultimas[0][:3]
+                self.estado[dispositivo.id] = [nivel, potencia, tiempo, 0]
+
+    def __call__(self, dispositivo, nivel, potencia, tiempo):
+        # Suscriptor del backend: se ejecuta en el hilo del servidor, solo guarda los valores
+        with self._lock:
+            recibidas = self.estado.get(dispositivo, [0, 0, 0, 0])[3]
+            self.estado[dispositivo] = [nivel, potencia, tiempo, recibidas + 1]
+
+    def texto(self):
+        ahora = time.time()
+        dispositivos = registro.todos()
+        lineas = [f"LevelSense ({len(dispositivos)} dispositivos, {sum(d.conectado for d in dispositivos)} conectados) "
+                  f"- {time.strftime('%H:%M:%S')}"]
+        if self.arranque_ms is not None:
+            lineas[0] += f" - arranque {self.arranque_ms:.0f} ms"
+        lineas.append(f"{'Dispositivo':<16}{'Estado':<14}{'Nivel (cm)':>11}{'Potencia (%)':>14}{'Edad (s)':>10}"
+                      f"{'Recibidas':>11}{'Perdidas':>10}")
+        with self._lock:
+            estado = {id_dispositivo: list(valores) for id_dispositivo, valores in self.estado.items()}
+        for dispositivo in dispositivos:
+            nivel, potencia, tiempo, recibidas = estado.get(dispositivo.id, [float("nan"), float("nan"), None, 0])
+            edad = ahora - tiempo if tiempo else float("nan")
+            marca = "conectado" if dispositivo.conectado else "desconectado"
+            if dispositivo.conectado and edad > MUESTRA_VIEJA:
+                marca = "sin datos"
+            lineas.append(f"{dispositivo.id:<16}{marca:<14}{nivel:>11.1f}{potencia:>14.1f}{edad:>10.1f}"
+                          f"{recibidas:>11}{dispositivo.perdidas:>10}")
+        lineas.append("")
+        lineas.append("Comandos: '<dispositivo> s:<altura>', '<dispositivo> c:<altura>,<diámetro>', "
+                      "'<dispositivo> k:<Kp>,<Ki>,<Kd>' (también h:, m:, r:, q:), "
+                      "'RECETA <dispositivos> <receta>', RECETAS, 'CANCELAR <receta>', 'MPC <dispositivo> <setpoint|off>', "
+                      "LISTA, METRICAS, CSV, salir")
+        if self.respuesta:
+            lineas.append(self.respuesta)
+        return "\n".join(lineas)
+
+    def mostrar(self, limpiar):
+        salida = self.texto()
+        print((_LIMPIAR if limpiar else "") + salida, flush=True)
+
+
+def _leer_comandos(panel, salir):
+    """Hilo que lee comandos de la entrada estándar y los ejecuta con la misma API que /control."""
+    for linea in sys.stdin:
+        comando = linea.strip()
+        if not comando:
+            continue
+        if comando.lower() in ("salir", "q"):
+            break
+        panel.respuesta = f"> {comando}\n{ejecutar_comando(comando)}"
+    salir.set()
+
+
+def main(argv=None, inicio=None):
+    """Ejecuta el tablero; inicio es el instante de arranque (perf_counter) si el proceso empezó en otro módulo."""
+    parser = argparse.ArgumentParser(description="Tablero de texto de LevelSense (sin Qt ni matplotlib) con el backend integrado")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--refresco", type=float, default=REFRESCO, help="Segundos entre redibujos del tablero")
+    parser.add_argument("--medir-arranque", action="store_true", help="Mostrar el tablero una vez con el tiempo de arranque y salir")
+    args = parser.parse_args(argv)
+
+    # El backend corre en este mismo proceso, en un hilo con su propio bucle de eventos
+    hilo = iniciar_en_hilo(args.host, args.puerto)
+    panel = Panel()
+    suscribir(panel)
+    panel.arranque_ms = (time.perf_counter() - (INICIO if inicio is None else inicio)) * 1000
+
+    limpiar = sys.stdout.isatty() and not args.medir_arranque
+    if args.medir_arranque:
+        panel.mostrar(limpiar)
+        detener()
+        hilo.join(timeout=10)
+        return
+
+    salir = threading.Event()
+    threading.Thread(target=_leer_comandos, args=(panel, salir), daemon=True).start()
+    try:
+        while not salir.is_set():
+            panel.mostrar(limpiar)
+            salir.wait(args.refresco)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        detener()
+        hilo.join(timeout=10)  # El backend vacía la cola de escritura y exporta los CSV al detenerse
+
+
+if __name__ == "__main__":
+    main()
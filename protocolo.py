@@ -0,0 +1,182 @@
+import math
+import struct
+from collections import namedtuple
+
+# Versión del protocolo de telemetría (debe coincidir con PROTOCOLO_VERSION en LevelSense.ino)
+VERSION = 1
+
+# Tipos de trama binaria
+TIPO_MUESTRA = 1
+TIPO_LOTE = 2
+
+# Trama binaria de una muestra (little-endian, empaquetada, 18 bytes):
+# versión, tipo, secuencia, tiempo del dispositivo (ms desde el arranque), nivel (cm), potencia (%)
+TRAMA_MUESTRA = struct.Struct("<BBIIff")
+
+# Trama binaria de un lote: cabecera (versión, tipo, cantidad, secuencia de la primera muestra)
+# seguida de `cantidad` registros (tiempo del dispositivo en ms, nivel, potencia) de 12 bytes
+CABECERA_LOTE = struct.Struct("<BBBI")
+REGISTRO_LOTE = struct.Struct("<Iff")
+MAX_MUESTRAS_LOTE = 255
+
+# Formatos de transporte: "bin" (trama binaria) o "txt" (texto compacto t:<seq>,<t_ms>,<nivel>,<potencia>)
+FORMATO_BINARIO = "bin"
+FORMATO_TEXTO = "txt"
+
+# Prefijos de los mensajes de texto
+PREFIJO_SALUDO = "hola:"     # Dispositivo → backend al conectarse: hola:id=<id>;v=1;f=bin|txt[;a=1]
+PREFIJO_FORMATO = "f:"       # Backend → dispositivo con el formato elegido: f:bin o f:txt
+PREFIJO_POTENCIA = "p:"      # Backend → dispositivo, mando directo del control predictivo: p:<potencia %> en cada ciclo, p:off para volver al PID
+PREFIJO_MUESTRA = "t:"       # Dispositivo → backend, muestra en texto compacto
+PREFIJO_LOTE = "l:"          # Dispositivo → backend, lote en texto: l:<seq>;<t_ms>,<nivel>,<potencia>;...
+PREFIJO_LAZO = "o:"          # Dispositivo → backend, estado del lazo: o:<ciclos>,<atrasos>,<dt_max_us>,<ejecucion_max_us>,<ecos_perdidos>
+PREFIJO_ACUSE = "a:"         # Dispositivo → backend, acuse de un comando numerado (s:25.0#17 → a:17); a=1 en el saludo
+PREFIJO_AJUSTES = "g:"       # Dispositivo → backend, parámetros del lazo en uso (al conectarse, tras cada ajuste y con q:):
+                             # g:<Kp>,<Ki>,<Kd>,<histéresis cm>,<pwm mínimo llenado>,<pwm mínimo vaciado>,<periodo ms>
+SEPARADOR_SEQ = "#"          # Separa el comando de su número de secuencia
+
+# Comandos de ajuste del lazo (backend → dispositivo, numerados y confirmados como s: y c:):
+# k:<Kp>,<Ki>,<Kd> (reinicia la integral), h:<histéresis cm>, m:<pwm llenado>[,<pwm vaciado>] (0 a 255),
+# r:<periodo ms> (20 a 1000); q: pide un reporte g: sin cambiar nada
+COMANDOS_AJUSTE = ("k:", "h:", "m:", "r:")
+CONSULTA_AJUSTES = "q:"
+
+Muestra = namedtuple("Muestra", ["seq", "t_ms", "nivel", "potencia"])
+
+# Estado del lazo de control del firmware: contadores acumulados desde el arranque y máximos
+# (periodo medido y duración del ciclo, en µs) desde el reporte anterior
+EstadoLazo = namedtuple("EstadoLazo", ["ciclos", "atrasos", "dt_max_us", "ejecucion_max_us", "ecos_perdidos"])
+
+# Parámetros del lazo de control que reporta el firmware
+AjustesLazo = namedtuple("AjustesLazo", ["kp", "ki", "kd", "histeresis", "pwm_llenado", "pwm_vaciado", "periodo_ms"])
+
+
+class ErrorProtocolo(ValueError):
+    """Mensaje que no cumple el formato del protocolo de telemetría."""
+
+
+def _validar(seq, t_ms, nivel, potencia):
+    if not (math.isfinite(nivel) and math.isfinite(potencia)):
+        raise ErrorProtocolo("Valores no finitos en la muestra")
+    if not -100.0 <= potencia <= 100.0:
+        raise ErrorProtocolo(f"Potencia fuera de rango: {potencia}")
+    return Muestra(seq, t_ms, nivel, potencia)
+
+
+def empaquetar_muestra(seq, t_ms, nivel, potencia):
+    """Construye la trama binaria de una muestra (la misma que envía el firmware)."""
+    return TRAMA_MUESTRA.pack(VERSION, TIPO_MUESTRA, seq & 0xFFFFFFFF, t_ms & 0xFFFFFFFF, nivel, potencia)
+
+
+def empaquetar_lote(seq, muestras):
+    """Construye la trama binaria de un lote a partir de tuplas (t_ms, nivel, potencia)."""
+    cabecera = CABECERA_LOTE.pack(VERSION, TIPO_LOTE, len(muestras), seq & 0xFFFFFFFF)
+    return cabecera + b"".join(REGISTRO_LOTE.pack(t_ms & 0xFFFFFFFF, nivel, potencia) for t_ms, nivel, potencia in muestras)
+
+
+def parsear_binario(datos):
+    """Decodifica una trama binaria (muestra o lote) y devuelve la lista de muestras que contiene.
+
+    Lanza ErrorProtocolo si el tamaño, la versión o el tipo no coinciden.
+    """
+    if len(datos) < 2:
+        raise ErrorProtocolo(f"Tamaño de trama inválido: {len(datos)} bytes")
+    version, tipo = datos[0], datos[1]
+    if version != VERSION:
+        raise ErrorProtocolo(f"Versión de protocolo no soportada: {version}")
+    if tipo == TIPO_MUESTRA:
+        if len(datos) != TRAMA_MUESTRA.size:
+            raise ErrorProtocolo(f"Tamaño de trama inválido: {len(datos)} bytes")
+        _, _, seq, t_ms, nivel, potencia = TRAMA_MUESTRA.unpack(datos)
+        return [_validar(seq, t_ms, nivel, potencia)]
+    if tipo == TIPO_LOTE:
+        if len(datos) < CABECERA_LOTE.size:
+            raise ErrorProtocolo(f"Tamaño de lote inválido: {len(datos)} bytes")
+        _, _, cantidad, seq = CABECERA_LOTE.unpack_from(datos)
+        if len(datos) != CABECERA_LOTE.size + cantidad * REGISTRO_LOTE.size:
+            raise ErrorProtocolo(f"Tamaño de lote inválido: {len(datos)} bytes para {cantidad} muestras")
+        return [
+            _validar((seq + i) & 0xFFFFFFFF, t_ms, nivel, potencia)
+            for i, (t_ms, nivel, potencia) in enumerate(REGISTRO_LOTE.iter_unpack(datos[CABECERA_LOTE.size:]))
+        ]
+    raise ErrorProtocolo(f"Tipo de trama desconocido: {tipo}")
+
+
+def parsear_texto(mensaje):
+    """Decodifica un mensaje de telemetría en texto y devuelve la lista de muestras que contiene.
+
+    Acepta la muestra compacta (t:<seq>,<t_ms>,<nivel>,<potencia>), el lote
+    (l:<seq>;<t_ms>,<nivel>,<potencia>;...) y el formato heredado ([nivel,potencia]).
+    Solo se aceptan números; nunca se evalúa el contenido del mensaje.
+    """
+    try:
+        if mensaje.startswith(PREFIJO_MUESTRA):
+            seq, t_ms, nivel, potencia = mensaje[len(PREFIJO_MUESTRA):].split(",")
+            return [_validar(int(seq), int(t_ms), float(nivel), float(potencia))]
+        if mensaje.startswith(PREFIJO_LOTE):
+            partes = mensaje[len(PREFIJO_LOTE):].split(";")
+            seq = int(partes[0])
+            if not 1 <= len(partes) - 1 <= MAX_MUESTRAS_LOTE:
+                raise ErrorProtocolo(f"Cantidad de muestras inválida en el lote: {len(partes) - 1}")
+            muestras = []
+            for i, registro in enumerate(partes[1:]):
+                t_ms, nivel, potencia = registro.split(",")
+                muestras.append(_validar(seq + i, int(t_ms), float(nivel), float(potencia)))
+            return muestras
+        if mensaje.startswith("[") and mensaje.endswith("]"):
+            nivel, potencia = mensaje[1:-1].split(",")
+            return [_validar(None, None, float(nivel), float(potencia))]
+    except ErrorProtocolo:
+        raise
+    except ValueError as e:
+        raise ErrorProtocolo(f"Muestra de texto inválida: {mensaje!r}") from e
+    raise ErrorProtocolo(f"Mensaje no reconocido: {mensaje!r}")
+
+
+def parsear_lazo(mensaje):
+    """Decodifica el reporte periódico del lazo de control (o:<ciclos>,<atrasos>,<dt_max_us>,<ejecucion_max_us>,<ecos_perdidos>)."""
+    try:
+        valores = [int(valor) for valor in mensaje[len(PREFIJO_LAZO):].split(",")]
+        return EstadoLazo(*valores)
+    except (ValueError, TypeError) as e:
+        raise ErrorProtocolo(f"Estado del lazo inválido: {mensaje!r}") from e
+
+
+def parsear_ajustes(mensaje):
+    """Decodifica el reporte de parámetros del lazo (g:<Kp>,<Ki>,<Kd>,<histéresis>,<pwm llenado>,<pwm vaciado>,<periodo ms>)."""
+    try:
+        kp, ki, kd, histeresis, pwm_llenado, pwm_vaciado, periodo_ms = mensaje[len(PREFIJO_AJUSTES):].split(",")
+        return AjustesLazo(float(kp), float(ki), float(kd), float(histeresis), int(pwm_llenado), int(pwm_vaciado), int(periodo_ms))
+    except ValueError as e:
+        raise ErrorProtocolo(f"Reporte de ajustes inválido: {mensaje!r}") from e
+
+
+def parsear_acuse(mensaje):
+    """Devuelve el número de secuencia de un acuse a:<seq>."""
+    try:
+        return int(mensaje[len(PREFIJO_ACUSE):])
+    except ValueError as e:
+        raise ErrorProtocolo(f"Acuse inválido: {mensaje!r}") from e
+
+
+def parsear_saludo(mensaje):
+    """Lee el saludo del dispositivo (hola:id=<id>;v=1;f=bin|txt) y devuelve un diccionario clave → valor."""
+    campos = {}
+    for par in mensaje[len(PREFIJO_SALUDO):].split(";"):
+        if "=" in par:
+            clave, valor = par.split("=", 1)
+            campos[clave.strip()] = valor.strip()
+    return campos
+
+
+def negociar_formato(saludo, binario_disponible):
+    """Elige el formato de transporte según lo que anuncia el dispositivo y lo que soporta el servidor.
+
+    Se usa la trama binaria solo si la versión coincide y ambos lados la soportan; si no,
+    el texto compacto queda como respaldo.
+    """
+    formatos = saludo.get("f", FORMATO_TEXTO).split("|")
+    version = saludo.get("v")
+    if binario_disponible and version == str(VERSION) and FORMATO_BINARIO in formatos:
+        return FORMATO_BINARIO
+    return FORMATO_TEXTO
@@ -1,33 +1,163 @@
-import csv
+import argparse
+import math
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-# Leer la primera columna (Nivel) de data.csv
-niveles = []
-with open("data.csv", mode="r") as file:
-    reader = csv.reader(file)
-    next(reader)  # Saltar encabezado
-    for row in reader:
-        if row and row[0]:
-            valor = float(row[0])
-            if valor > 0.5:
-                niveles.append(valor)
-
-niveles = np.array(niveles)
-tiempo = np.arange(len(niveles)) * 0.1  # Cada dato es cada 100 ms
-
-# Guardar en un archivo Excel
-df = pd.DataFrame({'Tiempo (s)': tiempo, 'Nivel': niveles})
-df.to_excel('nivel_vs_tiempo.xlsx', index=False)
-
-# Graficar con zoom interactivo
-plt.figure(figsize=(10, 5))
-plt.plot(tiempo, niveles, label="Nivel (>0.1)")
-plt.xlabel("Tiempo (s)")
-plt.ylabel("Nivel")
-plt.title("Nivel vs Tiempo (filtrado)")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+from telemetria import BIN_FILE, CSV_FILE, BufferTelemetria, ErrorTelemetria
+
+# Archivos de salida del análisis
+SALIDA_CSV = "nivel_vs_tiempo.csv"
+SALIDA_BIN = "nivel_vs_tiempo.f64"    # float64 crudo, pares (Tiempo, Nivel): np.fromfile(...).reshape(-1, 2)
+SALIDA_EXCEL = "nivel_vs_tiempo.xlsx"
+
+# Solo se conservan niveles mayores a este umbral (cm)
+UMBRAL = 0.5
+
+# Periodo de muestreo cuando el registro no tiene columna Tiempo (cada dato es cada 100 ms)
+PERIODO = 0.1
+
+# Filas por bloque de lectura: la memoria usada no depende del largo del registro
+BLOQUE = 100_000
+
+# Filas máximas de la exportación a Excel (si hay más, se toma una de cada k)
+MAX_FILAS_EXCEL = 100_000
+
+# Puntos máximos que se conservan para la gráfica
+MAX_PUNTOS_GRAFICA = 20_000
+
+
+class MuestraGrafica:
+    """Conserva como máximo `maximo` puntos repartidos uniformemente en todo el registro.
+
+    Se guarda una de cada `paso` muestras; cuando se llena, se descarta la mitad y se duplica
+    el paso, así que la memoria es constante sin conocer de antemano el largo del registro.
+    """
+
+    def __init__(self, maximo=MAX_PUNTOS_GRAFICA):
+        self.maximo = maximo
+        self.paso = 1
+        self.vistas = 0
+        self.indices = np.empty(0, dtype=np.int64)
+        self.tiempo = np.empty(0)
+        self.nivel = np.empty(0)
+
+    def agregar(self, tiempo, nivel):
+        indices = np.arange(self.vistas, self.vistas + len(tiempo))
+        self.vistas += len(tiempo)
+        seleccion = indices % self.paso == 0
+        self.indices = np.concatenate((self.indices, indices[seleccion]))
+        self.tiempo = np.concatenate((self.tiempo, tiempo[seleccion]))
+        self.nivel = np.concatenate((self.nivel, nivel[seleccion]))
+        while len(self.indices) > self.maximo:
+            self.paso *= 2
+            seleccion = self.indices % self.paso == 0
+            self.indices, self.tiempo, self.nivel = self.indices[seleccion], self.tiempo[seleccion], self.nivel[seleccion]
+
+
+def analizar(entrada=CSV_FILE, salida=SALIDA_CSV, umbral=UMBRAL, bloque=BLOQUE, grafica=None):
+    """Filtra el registro por bloques y escribe (Tiempo, Nivel) en CSV o en binario según la extensión de salida.
+
+    El tiempo sale de la columna Tiempo (segundos desde la primera muestra); si no existe se
+    usa la posición de la fila en el registro. Devuelve (filas leídas, filas guardadas).
+    """
+    binario = not salida.lower().endswith(".csv")
+    leidas = guardadas = 0
+    t_inicio = None
+    with (open(salida, "wb") if binario else open(salida, "w", newline="")) as file:
+        for trozo in pd.read_csv(entrada, chunksize=bloque):
+            nivel = pd.to_numeric(trozo["Nivel"], errors="coerce").to_numpy(dtype=float)
+            if "Tiempo" in trozo:
+                tiempo = pd.to_numeric(trozo["Tiempo"], errors="coerce").to_numpy(dtype=float)
+                if t_inicio is None:
+                    t_inicio = tiempo[0]
+                tiempo = tiempo - t_inicio
+            else:
+                tiempo = (leidas + np.arange(len(nivel))) * PERIODO
+            leidas += len(nivel)
+
+            seleccion = nivel > umbral  # Los NaN (filas vacías) quedan fuera
+            tiempo, nivel = tiempo[seleccion], nivel[seleccion]
+            if binario:
+                np.column_stack((tiempo, nivel)).tofile(file)
+            else:
+                pd.DataFrame({"Tiempo (s)": tiempo, "Nivel": nivel}).to_csv(file, header=guardadas == 0, index=False)
+            guardadas += len(nivel)
+            if grafica is not None:
+                grafica.agregar(tiempo, nivel)
+    return leidas, guardadas
+
+
+def _bloques_salida(salida, bloque):
+    if salida.lower().endswith(".csv"):
+        for trozo in pd.read_csv(salida, chunksize=bloque):
+            yield trozo.to_numpy(dtype=float)
+    else:
+        datos = np.memmap(salida, dtype=np.float64, mode="r").reshape(-1, 2)
+        for inicio in range(0, len(datos), bloque):
+            yield np.asarray(datos[inicio:inicio + bloque])
+
+
+def exportar_excel(salida, total, ruta=SALIDA_EXCEL, maximo=MAX_FILAS_EXCEL, bloque=BLOQUE):
+    """Copia el resultado a Excel con a lo sumo `maximo` filas (una de cada k), escribiendo en modo streaming."""
+    from openpyxl import Workbook
+
+    paso = max(1, math.ceil(total / maximo))
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(["Tiempo (s)", "Nivel"])
+    vistas = escritas = 0
+    for datos in _bloques_salida(salida, bloque):
+        desfase = (-vistas) % paso
+        for tiempo, nivel in datos[desfase::paso].tolist():
+            hoja.append([tiempo, nivel])
+            escritas += 1
+        vistas += len(datos)
+    libro.save(ruta)
+    return escritas, paso
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Análisis por bloques del registro de nivel (filtra y exporta Tiempo/Nivel)")
+    parser.add_argument("entrada", nargs="?", default=CSV_FILE, help="CSV con columnas Nivel y, opcionalmente, Tiempo")
+    parser.add_argument("--salida", default=None, help=f"Archivo de salida: .csv por bloques o binario ({SALIDA_BIN})")
+    parser.add_argument("--binario", action="store_true", help=f"Escribir en binario ({SALIDA_BIN}) en lugar de CSV")
+    parser.add_argument("--umbral", type=float, default=UMBRAL)
+    parser.add_argument("--bloque", type=int, default=BLOQUE)
+    parser.add_argument("--excel", action="store_true", help=f"Exportar también a {SALIDA_EXCEL}")
+    parser.add_argument("--max-filas-excel", type=int, default=MAX_FILAS_EXCEL)
+    parser.add_argument("--sin-grafica", action="store_true")
+    args = parser.parse_args()
+
+    # Exportar la ventana actual del buffer de telemetría a data.csv antes de analizarla
+    if args.entrada == CSV_FILE and os.path.exists(BIN_FILE):
+        try:
+            telemetria = BufferTelemetria(solo_lectura=True)
+            telemetria.exportar_csv()
+            telemetria.cerrar()
+        except ErrorTelemetria as e:
+            print(f"No se pudo exportar la telemetría ({e}); se analiza el {CSV_FILE} existente")
+
+    salida = args.salida or (SALIDA_BIN if args.binario else SALIDA_CSV)
+    grafica = None if args.sin_grafica else MuestraGrafica()
+    leidas, guardadas = analizar(args.entrada, salida, args.umbral, args.bloque, grafica)
+    print(f"{guardadas} de {leidas} datos con nivel > {args.umbral} guardados en '{salida}'")
+
+    if args.excel:
+        escritas, paso = exportar_excel(salida, guardadas, maximo=args.max_filas_excel, bloque=args.bloque)
+        detalle = f" (una de cada {paso})" if paso > 1 else ""
+        print(f"{escritas} filas exportadas a '{SALIDA_EXCEL}'{detalle}")
+
+    if grafica is not None:
+        # Graficar con zoom interactivo
+        plt.figure(figsize=(10, 5))
+        plt.plot(grafica.tiempo, grafica.nivel, label=f"Nivel (>{args.umbral})")
+        plt.xlabel("Tiempo (s)")
+        plt.ylabel("Nivel")
+        plt.title("Nivel vs Tiempo (filtrado)")
+        plt.grid(True)
+        plt.legend()
+        plt.tight_layout()
+        plt.show()
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+
+import numpy as np
+
+import emulador
+import modelo_planta
+import mpc
+import protocolo
+
+# Actualizaciones del setpoint durante una rampa: a lo sumo una cada PERIODO_ENVIO (s) y
+# solo si cambia la décima de cm que transmite el comando s:
+PERIODO_ENVIO = 0.5
+RESOLUCION = 0.1
+
+# Banda alrededor del setpoint final en la que la receta se da por completada (cm)
+TOLERANCIA = 0.5
+
+# Tiempo que se sigue simulando (o esperando el nivel real) después del último tramo (s)
+MARGEN = 300.0
+
+TIPOS = ("escalon", "rampa", "mantener")
+
+
+class ErrorReceta(ValueError):
+    """Programa de receta mal escrito."""
+
+
+class Receta:
+    """Perfil de setpoint en el tiempo: escalones, rampas y esperas.
+
+    Cada tramo es (tipo, nivel, duracion): un escalón cambia el setpoint a nivel al instante,
+    una rampa lo lleva en línea recta desde el valor anterior hasta nivel en duracion
+    segundos y mantener lo deja igual durante duracion segundos. En texto los tramos se
+    separan con comas: "10,m60,20/120,m30,0" sube a 10 cm, espera 60 s, sube en rampa a
+    20 cm en 120 s, espera 30 s y baja a 0 cm.
+    """
+
+    def __init__(self, tramos, nombre=""):
+        self.tramos = [(tipo, float(nivel), float(duracion)) for tipo, nivel, duracion in tramos]
+        self.nombre = nombre
+        for tipo, nivel, duracion in self.tramos:
+            if tipo not in TIPOS:
+                raise ErrorReceta(f"Tipo de tramo desconocido: {tipo!r}")
+            if nivel < 0 or duracion < 0 or (tipo == "rampa" and duracion == 0):
+                raise ErrorReceta(f"Tramo inválido: {tipo} a {nivel} cm en {duracion} s")
+        if not self.tramos:
+            raise ErrorReceta("La receta no tiene tramos")
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """Crea la receta a partir de "<cm>" (escalón), "<cm>/<s>" (rampa) y "m<s>" (mantener)."""
+        tramos = []
+        for parte in texto.replace(" ", "").split(","):
+            try:
+                if parte[:1].lower() == "m":
+                    tramos.append(("mantener", 0.0, float(parte[1:])))
+                elif "/" in parte:
+                    nivel, duracion = parte.split("/")
+                    tramos.append(("rampa", float(nivel), float(duracion)))
+                else:
+                    tramos.append(("escalon", float(parte), 0.0))
+            except ValueError as e:
+                raise ErrorReceta(f"Tramo inválido: {parte!r}") from e
+        return cls(tramos, texto)
+
+    @classmethod
+    def cargar(cls, fuente):
+        """Lee la receta de un archivo JSON ([{"tipo": "rampa", "nivel": 20, "duracion": 120}, ...]) o de un texto."""
+        if not fuente.lower().endswith(".json"):
+            return cls.desde_texto(fuente)
+        if not os.path.exists(fuente):
+            raise ErrorReceta(f"No existe el archivo {fuente}")
+        with open(fuente) as file:
+            datos = json.load(file)
+        try:
+            tramos = [(tramo["tipo"], tramo.get("nivel", 0.0), tramo.get("duracion", 0.0)) for tramo in datos]
+        except (KeyError, TypeError) as e:
+            raise ErrorReceta(f"Formato de receta inválido en {fuente}") from e
+        return cls(tramos, os.path.basename(fuente))
+
+    @property
+    def duracion(self):
+        return sum(duracion for _, _, duracion in self.tramos)
+
+    def setpoint(self, t, inicial=0.0):
+        """Setpoint en los instantes t (s desde el inicio); inicial es el valor antes del primer tramo."""
+        t = np.asarray(t, dtype=float)
+        sp = np.full_like(t, float(inicial))
+        inicio, actual = 0.0, float(inicial)
+        for tipo, nivel, duracion in self.tramos:
+            if tipo == "escalon":
+                actual = nivel
+                sp[t >= inicio] = actual
+            elif tipo == "rampa":
+                tramo = t >= inicio
+                sp[tramo] = actual + (nivel - actual) * np.clip((t[tramo] - inicio) / duracion, 0, 1)
+                actual = nivel
+            inicio += duracion
+        return sp
+
+    def eventos(self, inicial=0.0, periodo=PERIODO_ENVIO):
+        """Comandos s: que reproducen el perfil: lista de (instante en s, setpoint en cm).
+
+        Al principio se fija el setpoint inicial; en las rampas se envía un valor nuevo cada
+        periodo (y el nivel final exacto al terminar) y nunca dos valores iguales seguidos.
+        """
+        eventos = [(0.0, _redondear(inicial))]
+
+        def agregar(t, valor):
+            valor = _redondear(valor)
+            if eventos[-1][0] == t:
+                eventos.pop()  # Dos cambios en el mismo instante: vale el último
+            if not eventos or eventos[-1][1] != valor:
+                eventos.append((t, valor))
+
+        inicio, actual = 0.0, float(inicial)
+        for tipo, nivel, duracion in self.tramos:
+            if tipo == "escalon":
+                agregar(inicio, nivel)
+            elif tipo == "rampa":
+                pasos = math.ceil(duracion / periodo)
+                for k in range(1, pasos + 1):
+                    fraccion = min(k * periodo / duracion, 1.0)
+                    agregar(inicio + min(k * periodo, duracion), actual + (nivel - actual) * fraccion)
+            if tipo != "mantener":
+                actual = nivel
+            inicio += duracion
+        return eventos
+
+    @property
+    def final(self):
+        """Setpoint al terminar la receta (None si solo tiene esperas)."""
+        niveles = [nivel for tipo, nivel, _ in self.tramos if tipo != "mantener"]
+        return niveles[-1] if niveles else None
+
+
+def _redondear(valor):
+    return round(round(valor / RESOLUCION) * RESOLUCION, 6)
+
+
+def predecir(receta, inicial=0.0, ajustes=None, altura=None, modelo=None):
+    """Simula la receta con el lazo del firmware sobre el modelo de la planta, antes de ejecutarla.
+
+    El lazo es el de controlMotors(): PID con histéresis (emulador.ControlFirmware) y bombas
+    con PWM mínimo (mpc.mando_aplicado), al periodo de control del dispositivo. ajustes es
+    el último reporte g: del dispositivo (protocolo.AjustesLazo); sin él se usan los ajustes
+    de fábrica. Devuelve un diccionario con la duración del perfil, el instante en que el
+    nivel entra (y se queda) en la banda de TOLERANCIA del setpoint final ("completada",
+    None si no lo logra en MARGEN segundos), el mayor error de seguimiento durante el
+    perfil, el nivel final y las series t, sp y h para graficar.
+    """
+    ajustes = emulador.AJUSTES if ajustes is None else ajustes
+    modelo = modelo_planta.cargar() if modelo is None else modelo
+    if altura is not None:
+        modelo = modelo_planta.ModeloPlanta(modelo.v_llenado, modelo.v_vaciado, altura, modelo.zona_llenado, modelo.zona_vaciado)
+    paso = ajustes.periodo_ms / 1000
+    t = np.arange(0, receta.duracion + MARGEN, paso)
+    sp = receta.setpoint(t, inicial)
+    control = emulador.ControlFirmware(ajustes.kp, ajustes.ki, ajustes.kd, ajustes.histeresis)
+
+    def controlar(nivel, dt, setpoint):
+        control.setpoint = setpoint
+        return control.paso(nivel, dt)
+
+    h, _ = mpc.simular(controlar, modelo, sp, paso, inicial=min(inicial, float(modelo.h_max)),
+                       minimo_llenado=ajustes.pwm_llenado / 255, minimo_vaciado=ajustes.pwm_vaciado / 255)
+
+    en_perfil = t <= receta.duracion
+    fuera = np.nonzero(~en_perfil & (np.abs(h - sp[-1]) > TOLERANCIA))[0]
+    if len(fuera) == 0:
+        completada = receta.duracion
+    elif fuera[-1] == len(t) - 1:
+        completada = None
+    else:
+        completada = float(t[fuera[-1] + 1])
+    return {
+        "duracion": receta.duracion,
+        "completada": completada,
+        "error_max": float(np.max(np.abs(sp[en_perfil] - h[en_perfil]))),
+        "nivel_final": float(h[-1]),
+        "t": t, "sp": sp, "h": h,
+    }
+
+
+def texto_prediccion(prediccion):
+    completada = prediccion["completada"]
+    texto = f"duración {prediccion['duracion']:.0f} s, "
+    texto += f"completado previsto a los {completada:.0f} s" if completada is not None else \
+             f"no se prevé alcanzar el setpoint final en {MARGEN:.0f} s"
+    return texto + f", error de seguimiento máx {prediccion['error_max']:.1f} cm"
+
+
+class EjecucionReceta:
+    """Ejecución de una receta sobre uno o varios dispositivos desde el bucle del backend.
+
+    Los comandos s: se envían en los instantes de Receta.eventos() medidos desde el inicio
+    (plazos absolutos, así que los atrasos no se acumulan) y a todos los dispositivos a la
+    vez. Al terminar el perfil espera a que el nivel medido de todos entre en la banda de
+    TOLERANCIA para registrar el tiempo real de la receta junto al previsto.
+    """
+
+    def __init__(self, numero, receta, dispositivos, inicial=0.0, prediccion=None):
+        self.numero = numero
+        self.receta = receta
+        self.dispositivos = dispositivos
+        self.eventos = receta.eventos(inicial)
+        self.prediccion = prediccion
+        self.estado = "pendiente"
+        self.setpoint = inicial
+        self.enviados = 0
+        self.atraso_max = 0.0   # Mayor atraso de un envío respecto de su instante (s)
+        self.completada = None  # Instante en que el nivel real quedó en la banda (s)
+        self._inicio = None
+        self._loop = None
+
+    @property
+    def activa(self):
+        return self.estado in ("pendiente", "en curso", "esperando el nivel")
+
+    def transcurrido(self):
+        return self._loop.time() - self._inicio if self._inicio is not None else 0.0
+
+    async def ejecutar(self, enviar):
+        """Corre la receta; enviar(dispositivo, mensaje) encola el comando (se llama en el bucle)."""
+        self._loop = asyncio.get_running_loop()
+        self._inicio = self._loop.time()
+        self.estado = "en curso"
+        try:
+            for instante, valor in self.eventos:
+                espera = self._inicio + instante - self._loop.time()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                self.atraso_max = max(self.atraso_max, self._loop.time() - self._inicio - instante)
+                for dispositivo in self.dispositivos:
+                    enviar(dispositivo, f"s:{valor:.1f}")
+                self.setpoint = valor
+                self.enviados += 1
+
+            self.estado = "esperando el nivel"
+            while not self._en_banda():
+                if self.transcurrido() > self.receta.duracion + MARGEN:
+                    self.estado = "no alcanzó el setpoint"
+                    return
+                await asyncio.sleep(PERIODO_ENVIO)
+            self.completada = self.transcurrido()
+            self.estado = "completada"
+        except asyncio.CancelledError:
+            self.estado = "cancelada"
+            raise
+
+    def _en_banda(self):
+        for dispositivo in self.dispositivos:
+            ultimas = dispositivo.telemetria.ultimas(1)
+            if not dispositivo.conectado or not ultimas or abs(ultimas[0][0] - self.setpoint) > TOLERANCIA:
+                return False
+        return True
+
+    def texto(self):
+        ids = ",".join(dispositivo.id for dispositivo in self.dispositivos)
+        texto = (f"Receta {self.numero} '{self.receta.nombre}' ({ids}): {self.estado}, "
+                 f"{min(self.transcurrido(), self.receta.duracion):.0f}/{self.receta.duracion:.0f} s, "
+                 f"setpoint {self.setpoint:.1f} cm, {self.enviados}/{len(self.eventos)} envíos, "
+                 f"atraso máx {self.atraso_max * 1000:.1f} ms")
+        if self.prediccion is not None and self.prediccion["completada"] is not None:
+            texto += f", completado previsto a los {self.prediccion['completada']:.0f} s"
+        if self.completada is not None:
+            texto += f", completada a los {self.completada:.0f} s"
+        return texto
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predice con el lazo del firmware en simulación cuánto tarda una receta de setpoint")
+    parser.add_argument("receta", help="Tramos '<cm>' (escalón), '<cm>/<s>' (rampa), 'm<s>' (mantener) separados por comas, o un archivo .json")
+    parser.add_argument("--nivel-inicial", type=float, default=0.0, help="Nivel del tanque al empezar (cm)")
+    parser.add_argument("--kp", type=float, default=emulador.KP)
+    parser.add_argument("--ki", type=float, default=emulador.KI)
+    parser.add_argument("--kd", type=float, default=emulador.KD)
+    parser.add_argument("--histeresis", type=float, default=emulador.HISTERESIS, help="Banda de histéresis (cm)")
+    parser.add_argument("--pwm-llenado", type=int, default=emulador.PWM_MINIMO, help="PWM mínimo de la bomba de llenado")
+    parser.add_argument("--pwm-vaciado", type=int, default=emulador.PWM_MINIMO, help="PWM mínimo de la bomba de vaciado")
+    parser.add_argument("--periodo-ms", type=int, default=emulador.AJUSTES.periodo_ms, help="Periodo del lazo de control (ms)")
+    parser.add_argument("--altura", type=float, default=None, help="Altura del recipiente (cm); por defecto la del modelo")
+    parser.add_argument("--grafica", action="store_true", help="Graficar el setpoint y el nivel previsto")
+    args = parser.parse_args()
+
+    try:
+        receta = Receta.cargar(args.receta)
+    except ErrorReceta as e:
+        parser.error(str(e))
+    ajustes = protocolo.AjustesLazo(args.kp, args.ki, args.kd, args.histeresis, args.pwm_llenado, args.pwm_vaciado, args.periodo_ms)
+    prediccion = predecir(receta, args.nivel_inicial, ajustes, args.altura)
+    print(f"Receta '{receta.nombre}': {len(receta.tramos)} tramos, {len(receta.eventos(args.nivel_inicial))} comandos s:")
+    print(texto_prediccion(prediccion) + f", nivel al final de la simulación {prediccion['nivel_final']:.1f} cm")
+
+    if args.grafica:
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(12, 6))
+        plt.plot(prediccion["t"], prediccion["h"], label=f"Nivel previsto (Kp={args.kp} Ki={args.ki} Kd={args.kd})")
+        plt.plot(prediccion["t"], prediccion["sp"], "k--", label="Setpoint", linewidth=2)
+        if prediccion["completada"] is not None:
+            plt.axvline(prediccion["completada"], color="g", linestyle=":", label="Completado previsto")
+        plt.xlabel("Tiempo (s)")
+        plt.ylabel("Altura del agua (cm)")
+        plt.title(f"Receta {receta.nombre}")
+        plt.legend()
+        plt.grid(True)
+        plt.tight_layout()
+        plt.show()
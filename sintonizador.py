@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import controlps
+
+# Rango de búsqueda de cada ganancia (Kp, Ki, Kd)
+LIMITES = np.array([
+    [0.05, 5.0],
+    [0.0, 1.0],
+    [0.0, 0.5],
+])
+
+# Pesos de la función de costo: IAE + sobrepaso (%) + tiempo de asentamiento (s)
+PESO_SOBREPASO = 2.0
+PESO_ASENTAMIENTO = 1.0
+PENALIZACION_SIN_ASENTAR = 1e4
+
+# Archivo donde se guardan las ganancias ordenadas
+SALIDA = "ganancias.json"
+
+
+def construir_setpoint(programa, t_total, dt):
+    """Crea el setpoint escalonado a partir de un programa "t0:valor,t1:valor,...".
+
+    Por ejemplo "0:20,40:0" mantiene 20 cm hasta los 40 s y luego 0 cm (como en controlps.py).
+    """
+    t = np.arange(0, t_total, dt)
+    sp = np.zeros_like(t)
+    for tramo in programa.split(","):
+        inicio, valor = tramo.split(":")
+        sp[t >= float(inicio)] = float(valor)
+    return sp
+
+
+def costo(metricas):
+    """Costo escalar por candidato: menor es mejor."""
+    asentamiento = np.where(np.isfinite(metricas["settling_time"]), metricas["settling_time"], PENALIZACION_SIN_ASENTAR)
+    return metricas["iae"] + PESO_SOBREPASO * metricas["overshoot"] + PESO_ASENTAMIENTO * asentamiento
+
+
+def _evaluar(argumentos):
+    """Evalúa un bloque de candidatos en un proceso del pool (función de nivel superior para poder serializarla)."""
+    ganancias, planta = argumentos
+    metricas = controlps.simulate_pid_batch(ganancias[:, 0], ganancias[:, 1], ganancias[:, 2], **planta)
+    return costo(metricas), metricas
+
+
+class Sintonizador:
+    """Búsqueda de ganancias PID con evolución diferencial multiarranque sobre el modelo de controlps.
+
+    Cada generación se reparte en bloques entre los procesos del pool y cada bloque se simula
+    de una sola vez con simulate_pid_batch.
+    """
+
+    def __init__(self, planta, procesos=None):
+        self.planta = planta
+        self.procesos = procesos or os.cpu_count() or 1
+        self.evaluados = []  # (costo, Kp, Ki, Kd, iae, sobrepaso, asentamiento)
+
+    def evaluar(self, executor, poblacion):
+        bloques = [bloque for bloque in np.array_split(poblacion, self.procesos) if len(bloque)]
+        costos = []
+        for bloque, (costo_bloque, metricas) in zip(bloques, executor.map(_evaluar, [(b, self.planta) for b in bloques])):
+            costos.append(costo_bloque)
+            for k in range(len(bloque)):
+                self.evaluados.append((
+                    float(costo_bloque[k]), *map(float, bloque[k]),
+                    float(metricas["iae"][k]), float(metricas["overshoot"][k]), float(metricas["settling_time"][k]),
+                ))
+        return np.concatenate(costos)
+
+    def evolucionar(self, executor, semilla, poblacion=64, generaciones=40, F=0.7, CR=0.9):
+        """Una corrida de evolución diferencial (DE/rand/1/bin) desde una población aleatoria."""
+        rng = np.random.default_rng(semilla)
+        bajo, alto = LIMITES[:, 0], LIMITES[:, 1]
+        actual = bajo + rng.random((poblacion, 3)) * (alto - bajo)
+        costos = self.evaluar(executor, actual)
+
+        for _ in range(generaciones):
+            # Mutación: a + F·(b - c) con tres individuos distintos elegidos al azar
+            indices = np.array([rng.choice(poblacion, 3, replace=False) for _ in range(poblacion)])
+            mutantes = actual[indices[:, 0]] + F * (actual[indices[:, 1]] - actual[indices[:, 2]])
+            mutantes = np.clip(mutantes, bajo, alto)
+
+            # Cruce binomial (al menos una ganancia viene del mutante)
+            cruce = rng.random((poblacion, 3)) < CR
+            cruce[np.arange(poblacion), rng.integers(0, 3, poblacion)] = True
+            pruebas = np.where(cruce, mutantes, actual)
+
+            # Selección
+            costos_pruebas = self.evaluar(executor, pruebas)
+            mejores = costos_pruebas < costos
+            actual[mejores] = pruebas[mejores]
+            costos[mejores] = costos_pruebas[mejores]
+
+    def ejecutar(self, reinicios=3, **opciones):
+        with ProcessPoolExecutor(max_workers=self.procesos) as executor:
+            for semilla in range(reinicios):
+                self.evolucionar(executor, semilla, **opciones)
+        return self.ranking()
+
+    def ranking(self, top=10):
+        """Mejores candidatos evaluados, sin repetir ganancias prácticamente iguales."""
+        ordenados = sorted(self.evaluados)
+        resultado = []
+        vistos = set()
+        for costo_c, Kp, Ki, Kd, iae, sobrepaso, asentamiento in ordenados:
+            clave = (round(Kp, 3), round(Ki, 3), round(Kd, 3))
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            resultado.append({
+                "Kp": round(Kp, 4), "Ki": round(Ki, 4), "Kd": round(Kd, 4),
+                "costo": costo_c, "iae": iae, "sobrepaso": sobrepaso,
+                "asentamiento": asentamiento if np.isfinite(asentamiento) else None,
+            })
+            if len(resultado) == top:
+                break
+        return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sintonización automática de ganancias PID sobre el modelo de controlps.py")
+    parser.add_argument("--setpoint", default="0:20,40:0", help="Programa de setpoint 't0:valor,t1:valor,...' (cm)")
+    parser.add_argument("--t-total", type=float, default=controlps.t_total, help="Duración de la simulación (s)")
+    parser.add_argument("--dt", type=float, default=0.1, help="Periodo de muestreo (s); 0.1 coincide con el firmware")
+    parser.add_argument("--h-max", type=float, default=controlps.h_max, help="Altura máxima del recipiente (cm)")
+    parser.add_argument("--v-llenado", type=float, default=controlps.v_llenado, help="Velocidad de llenado (cm/s)")
+    parser.add_argument("--v-vaciado", type=float, default=controlps.v_vaciado, help="Velocidad de vaciado (cm/s)")
+    parser.add_argument("--poblacion", type=int, default=64)
+    parser.add_argument("--generaciones", type=int, default=40)
+    parser.add_argument("--reinicios", type=int, default=3, help="Corridas independientes (multiarranque)")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, todos los núcleos)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--salida", default=SALIDA)
+    args = parser.parse_args()
+
+    planta = {
+        "sp": construir_setpoint(args.setpoint, args.t_total, args.dt),
+        "time_step": args.dt,
+        "level_max": args.h_max,
+        "v_fill": args.v_llenado,
+        "v_drain": args.v_vaciado,
+    }
+    sintonizador = Sintonizador(planta, args.procesos)
+    inicio = time.perf_counter()
+    sintonizador.ejecutar(args.reinicios, poblacion=args.poblacion, generaciones=args.generaciones)
+    ranking = sintonizador.ranking(args.top)
+    duracion = time.perf_counter() - inicio
+
+    print(f"{len(sintonizador.evaluados)} candidatos evaluados en {duracion:.1f} s con {sintonizador.procesos} procesos")
+    for i, candidato in enumerate(ranking, 1):
+        asentamiento = f"{candidato['asentamiento']:.1f} s" if candidato["asentamiento"] is not None else "no se asienta"
+        print(f"{i:2d}. Kp={candidato['Kp']:.4f} Ki={candidato['Ki']:.4f} Kd={candidato['Kd']:.4f}  "
+              f"IAE={candidato['iae']:.1f}  sobrepaso={candidato['sobrepaso']:.1f}%  asentamiento={asentamiento}")
+
+    with open(args.salida, "w") as file:
+        json.dump({"planta": {k: v for k, v in vars(args).items() if k not in ("salida", "top", "procesos")},
+                   "ranking": ranking}, file, indent=2)
+
+    if ranking:
+        mejor = ranking[0]
+        print("\nPara LevelSense.ino:")
+        print(f"float Kp = {mejor['Kp']};")
+        print(f"float Ki = {mejor['Ki']};")
+        print(f"float Kd = {mejor['Kd']};")
@@ -0,0 +1,222 @@
+import csv
+import mmap
+import os
+import struct
+import sys
+import threading
+
+import numpy as np
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Archivo binario donde se almacena la ventana de telemetría
+BIN_FILE = "data.bin"
+
+# Archivo CSV que se exporta bajo demanda para las herramientas existentes (real.py, gencsv.py)
+CSV_FILE = "data.csv"
+
+# Número de muestras que se conservan en el buffer circular (se lee al crear cada buffer)
+CAPACIDAD = 1000
+
+# Columnas de cada muestra (todas se guardan como float64):
+#   Tiempo      instante del ciclo de control en segundos de época del backend (reloj del dispositivo + desfase)
+#   Tiempo_ms   reloj monotónico del dispositivo (millis) tal como llegó; NaN si el firmware no lo envía
+#   Recepcion   instante en que el backend recibió el mensaje (época, s)
+CAMPOS = ("Nivel", "Potencia", "Tiempo", "Tiempo_ms", "Recepcion")
+
+# Cabecera del archivo: firma, versión, número de campos, capacidad y total de muestras escritas
+_CABECERA = struct.Struct("<4sHHIQ")
+_FIRMA = b"LSTM"
+_VERSION = 1
+
+
+class ErrorTelemetria(RuntimeError):
+    """El archivo de telemetría está en uso por otro escritor o no se puede leer."""
+
+
+class BufferTelemetria:
+    """Buffer circular de capacidad fija respaldado por un archivo binario mapeado en memoria.
+
+    Cada muestra ocupa un registro de tamaño fijo, por lo que agregar una muestra es O(1):
+    se escribe el registro en la posición de la cabeza y se incrementa el contador de la cabecera.
+    El contador se lee siempre desde el archivo, así que otro proceso que abra el mismo archivo
+    con solo_lectura=True ve las muestras nuevas sin releer nada más. Solo un proceso a la vez
+    puede abrirlo para escribir.
+    """
+
+    def __init__(self, ruta=BIN_FILE, capacidad=None, campos=CAMPOS, solo_lectura=False):
+        self.ruta = ruta
+        self.capacidad = CAPACIDAD if capacidad is None else capacidad
+        self.campos = tuple(campos)
+        self.solo_lectura = solo_lectura
+        self._lock = threading.Lock()
+        self._cerrojo = None
+
+        if solo_lectura:
+            # Lector (real.py, telemetria.py, benchmark_backend.py): usa el formato del archivo tal cual, sin migrarlo
+            # ni truncarlo, así que puede abrirlo mientras el backend escribe
+            firma, version, n_campos, capacidad = self._leer_cabecera()
+            if (firma, version) != (_FIRMA, _VERSION) or not 0 < n_campos <= len(self.campos):
+                raise ErrorTelemetria(f"'{self.ruta}' no es un buffer de telemetría compatible")
+            self.capacidad, self.campos = capacidad, self.campos[:n_campos]
+            self._registro = struct.Struct("<" + "d" * n_campos)
+            tamano = _CABECERA.size + self.capacidad * self._registro.size
+            if os.path.getsize(self.ruta) != tamano:
+                raise ErrorTelemetria(f"'{self.ruta}' está incompleto")
+            self._archivo = open(self.ruta, "rb")
+            self._mapa = mmap.mmap(self._archivo.fileno(), tamano, access=mmap.ACCESS_READ)
+            return
+
+        # Escritor: uno solo por archivo, para que nadie lo trunque o migre mientras otro lo usa
+        self._bloquear()
+        self._registro = struct.Struct("<" + "d" * len(self.campos))
+        tamano = _CABECERA.size + self.capacidad * self._registro.size
+        nuevo = not self._cabecera_valida(tamano)
+        anteriores = self._leer_anterior() if nuevo else []  # Se leen antes de truncar el archivo
+        modo = "w+b" if nuevo else "r+b"
+        self._archivo = open(self.ruta, modo)
+        if nuevo:
+            self._archivo.truncate(tamano)
+        self._mapa = mmap.mmap(self._archivo.fileno(), tamano)
+        if nuevo:
+            self._escribir_total(0)
+            for muestra in anteriores:
+                self.agregar(*muestra)
+
+    def _bloquear(self):
+        """Toma el cerrojo exclusivo de escritura (<ruta>.lock); falla si otro proceso ya escribe el archivo."""
+        self._cerrojo = open(self.ruta + ".lock", "a+b")
+        try:
+            if os.name == "nt":
+                self._cerrojo.seek(0)
+                msvcrt.locking(self._cerrojo.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self._cerrojo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._cerrojo.close()
+            self._cerrojo = None
+            raise ErrorTelemetria(f"'{self.ruta}' está en uso por otro proceso (¿hay otro backend corriendo?)") from None
+
+    def _leer_cabecera(self):
+        """Devuelve (firma, versión, campos, capacidad) del archivo existente."""
+        if not os.path.exists(self.ruta):
+            raise ErrorTelemetria(f"No existe '{self.ruta}'")
+        with open(self.ruta, "rb") as file:
+            datos = file.read(_CABECERA.size)
+        if len(datos) < _CABECERA.size:
+            raise ErrorTelemetria(f"'{self.ruta}' no es un buffer de telemetría")
+        return _CABECERA.unpack(datos)[:4]
+
+    def _cabecera_valida(self, tamano):
+        """Comprueba si el archivo existente tiene el mismo formato que este buffer."""
+        if not os.path.exists(self.ruta) or os.path.getsize(self.ruta) != tamano:
+            return False
+        with open(self.ruta, "rb") as file:
+            datos = file.read(_CABECERA.size)
+        if len(datos) < _CABECERA.size:
+            return False
+        firma, version, n_campos, capacidad, _ = _CABECERA.unpack(datos)
+        return (firma, version, n_campos, capacidad) == (_FIRMA, _VERSION, len(self.campos), self.capacidad)
+
+    def _leer_anterior(self):
+        """Lee las muestras de un archivo con otro formato (otras columnas u otra capacidad) para no perderlas al migrar.
+
+        Se conservan las últimas que entran en la capacidad nueva; las columnas que faltan se
+        completan con NaN y las que sobran se descartan.
+        """
+        if not os.path.exists(self.ruta):
+            return []
+        with open(self.ruta, "rb") as file:
+            datos = file.read()
+        if len(datos) < _CABECERA.size:
+            return []
+        firma, version, n_campos, capacidad, total = _CABECERA.unpack_from(datos, 0)
+        registro = struct.Struct("<" + "d" * n_campos)
+        if (firma, version) != (_FIRMA, _VERSION) or n_campos == 0 or len(datos) != _CABECERA.size + capacidad * registro.size:
+            return []
+        relleno = (float("nan"),) * max(0, len(self.campos) - n_campos)
+        return [(registro.unpack_from(datos, _CABECERA.size + (i % capacidad) * registro.size) + relleno)[:len(self.campos)]
+                for i in range(max(0, total - min(capacidad, self.capacidad)), total)]
+
+    def _escribir_total(self, total):
+        _CABECERA.pack_into(self._mapa, 0, _FIRMA, _VERSION, len(self.campos), self.capacidad, total)
+
+    @property
+    def total(self):
+        """Número de muestras escritas desde que se creó el archivo."""
+        return _CABECERA.unpack_from(self._mapa, 0)[4]
+
+    def __len__(self):
+        return min(self.total, self.capacidad)
+
+    def agregar(self, *valores):
+        """Agrega una muestra al final del buffer, sobrescribiendo la más antigua si está lleno."""
+        with self._lock:
+            total = self.total
+            posicion = _CABECERA.size + (total % self.capacidad) * self._registro.size
+            self._registro.pack_into(self._mapa, posicion, *valores)
+            self._escribir_total(total + 1)
+
+    def ultimas(self, n=None):
+        """Devuelve las últimas `n` muestras (todas si n es None) en orden cronológico."""
+        with self._lock:
+            total = self.total
+            disponibles = min(total, self.capacidad)
+            n = disponibles if n is None else min(n, disponibles)
+            inicio = total - n
+            tam = self._registro.size
+            muestras = []
+            for i in range(inicio, total):
+                posicion = _CABECERA.size + (i % self.capacidad) * tam
+                muestras.append(self._registro.unpack_from(self._mapa, posicion))
+            return muestras
+
+    def arreglo(self, n=None):
+        """Como ultimas(), pero devuelve un arreglo de NumPy (n, campos) leído de una sola vez."""
+        with self._lock:
+            total = self.total
+            disponibles = min(total, self.capacidad)
+            n = disponibles if n is None else min(n, disponibles)
+            registros = np.frombuffer(self._mapa, dtype="<f8", count=self.capacidad * len(self.campos),
+                                      offset=_CABECERA.size).reshape(self.capacidad, len(self.campos))
+            resultado = registros[np.arange(total - n, total) % self.capacidad]
+            del registros  # Liberar la vista para que el mapa se pueda cerrar
+            return resultado
+
+    def exportar_csv(self, ruta=CSV_FILE):
+        """Escribe la ventana actual en un CSV con encabezados, para real.py y las demás herramientas."""
+        muestras = self.ultimas()
+        with open(ruta, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.campos)
+            writer.writerows(muestras)
+        return len(muestras)
+
+    def sincronizar(self):
+        """Fuerza la escritura a disco de las páginas modificadas."""
+        if not self.solo_lectura:
+            self._mapa.flush()
+
+    def cerrar(self):
+        self.sincronizar()
+        self._mapa.close()
+        self._archivo.close()
+        if self._cerrojo is not None:
+            self._cerrojo.close()  # Libera el cerrojo de escritura
+            self._cerrojo = None
+
+
+if __name__ == "__main__":
+    # Exportar la ventana actual a CSV: python telemetria.py [destino.csv]
+    destino = sys.argv[1] if len(sys.argv) > 1 else CSV_FILE
+    try:
+        buffer = BufferTelemetria(solo_lectura=True)
+    except ErrorTelemetria as e:
+        print(f"No se pudo leer la telemetría: {e}")
+        sys.exit(1)
+    cantidad = buffer.exportar_csv(destino)
+    buffer.cerrar()
+    print(f"Exportación completada: {cantidad} datos almacenados en '{destino}'")
@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+import Backend
+
+
+class Conexion:
+    def __init__(self, direccion):
+        self.remote_address = (direccion, 40000)
+        self.respuesta = None
+
+    def respond(self, estado, texto):
+        self.respuesta = estado
+        return estado
+
+
+def solicitud(ruta, autorizacion=None):
+    return SimpleNamespace(path=ruta, headers={"Authorization": autorizacion} if autorizacion else {})
+
+
+def test_direcciones_locales():
+    assert [Backend.es_local(d) for d in ("127.0.0.1", "::1", "::ffff:127.0.0.1")] == [True, True, True]
+    assert [Backend.es_local(d) for d in ("192.168.1.5", "::ffff:10.0.0.1", "x", None)] == [False, False, False, False]
+
+
+def test_control_solo_local_sin_clave(monkeypatch):
+    monkeypatch.setattr(Backend, "TOKEN_CONTROL", None)
+    assert Backend.validar_solicitud(Conexion("127.0.0.1"), solicitud(Backend.RUTA_CONTROL)) is None
+    assert Backend.validar_solicitud(Conexion("192.168.1.5"), solicitud(Backend.RUTA_CONTROL)) == 403
+    assert Backend.validar_solicitud(Conexion("192.168.1.5"), solicitud("/")) is None  # Los ESP32 siguen entrando
+
+
+def test_control_con_clave(monkeypatch):
+    monkeypatch.setattr(Backend, "TOKEN_CONTROL", "secreto")
+    assert Backend.validar_solicitud(Conexion("192.168.1.5"), solicitud(Backend.RUTA_CONTROL, "Bearer secreto")) is None
+    for autorizacion in (None, "Bearer otro", "secreto", "Bearer secretó"):
+        assert Backend.validar_solicitud(Conexion("127.0.0.1"), solicitud(Backend.RUTA_CONTROL, autorizacion)) == 403
+
+
+def test_escritura_sigue_tras_un_error_de_disco(monkeypatch):
+    monkeypatch.setattr(Backend, "escritura", {"descartados": 0, "errores": 0})
+    guardados = []
+
+    def guardar(filas):
+        if not guardados:
+            guardados.append(None)
+            raise OSError("disco lleno")
+        guardados.append(filas)
+
+    dispositivo = SimpleNamespace(id="d", guardar=guardar)
+
+    async def probar():
+        monkeypatch.setattr(Backend, "_cola_escritura", asyncio.Queue(2))
+        tarea = asyncio.create_task(Backend.escribir_telemetria())
+        for i in range(3):
+            Backend._cola_escritura.put_nowait((dispositivo, [i]))
+            await asyncio.sleep(0.01)
+        assert not tarea.done()
+        tarea.cancel()
+
+    asyncio.run(probar())
+    assert guardados == [None, [1], [2]]
+    assert Backend.escritura["errores"] == 1
+
+
+def test_metricas_informa_la_escritura():
+    assert Backend.ejecutar_comando("METRICAS").splitlines()[-1].startswith("escritura:")
+
+
+def test_cancelar_responde_por_la_receta(monkeypatch):
+    monkeypatch.setattr(Backend, "recetas", {1: SimpleNamespace(activa=True, estado="en curso"),
+                                             2: SimpleNamespace(activa=False, estado="completada")})
+    loop = asyncio.new_event_loop()
+    monkeypatch.setattr(Backend, "_loop", loop)
+    try:
+        assert Backend.ejecutar_comando("CANCELAR 1") == "ok"
+        assert Backend.ejecutar_comando("CANCELAR 2") == "error: la receta 2 ya terminó (completada)"
+        assert Backend.ejecutar_comando("CANCELAR 7") == "error: receta desconocida"
+        assert Backend.ejecutar_comando("CANCELAR x").startswith("error: use 'CANCELAR")
+    finally:
+        loop.close()
+    assert Backend.ejecutar_comando("CANCELAR 1") == "error: el servidor no está en marcha"
+
+
+def test_mpc_envia_a_periodo_fijo_sin_telemetria(monkeypatch):
+    enviados = []
+
+    class Cliente:
+        async def send(self, mensaje):
+            enviados.append(mensaje)
+
+    controlador = SimpleNamespace(periodo=0.01, mando=lambda nivel: nivel / 10)
+    dispositivo = SimpleNamespace(id="d", cliente=Cliente(), conectado=True, nivel=4.0)
+    monkeypatch.setattr(Backend, "controladores", {"d": controlador})
+
+    async def probar():
+        tarea = asyncio.create_task(Backend._controlar_mpc(dispositivo))
+        await asyncio.sleep(0.055)  # Ningún mensaje de telemetría en este tiempo
+        Backend.controladores.pop("d")
+        await asyncio.wait_for(tarea, 1)  # Sin controlador la tarea termina sola
+
+    asyncio.run(probar())
+    assert 4 <= len(enviados) <= 7
+    assert set(enviados) == {"p:40.0"}
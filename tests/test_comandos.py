@@ -0,0 +1,139 @@
+import pytest
+
+import comandos
+import protocolo
+from comandos import ColaComandos
+
+
+def cola_con_ack():
+    cola = ColaComandos()
+    cola.reconectado(True)
+    return cola
+
+
+def seq_de(mensaje):
+    texto, _, seq = mensaje.rpartition(protocolo.SEPARADOR_SEQ)
+    return texto, int(seq)
+
+
+def test_cola_vacia():
+    assert ColaComandos().siguiente(0.0) == (None, None)
+
+
+def test_envio_numerado_y_acuse():
+    cola = cola_con_ack()
+    comando = cola.agregar("s:10.0", 0.0)
+    mensaje, espera = cola.siguiente(0.0)
+    assert seq_de(mensaje) == ("s:10.0", comando.seq)
+    assert espera == comandos.RETARDO_INICIAL
+    assert cola.confirmar(comando.seq, 0.05)
+    assert len(cola) == 0
+    assert cola.resumen()["confirmados"] == 1
+    assert cola.resumen()["latencia_ack_p50_ms"] == pytest.approx(50.0)
+
+
+def test_acuse_desconocido_o_repetido():
+    cola = cola_con_ack()
+    comando = cola.agregar("s:10.0", 0.0)
+    cola.siguiente(0.0)
+    assert not cola.confirmar(comando.seq + 1, 0.1)
+    assert cola.confirmar(comando.seq, 0.1)
+    assert not cola.confirmar(comando.seq, 0.2)  # Acuse tardío de un reintento
+
+
+def test_reintentos_con_espera_exponencial():
+    cola = cola_con_ack()
+    cola.agregar("c:30.0,10.0", 0.0)
+    ahora, esperas = 0.0, []
+    for _ in range(7):
+        mensaje, espera = cola.siguiente(ahora)
+        assert mensaje is not None
+        esperas.append(espera)
+        assert cola.siguiente(ahora + espera / 2) == (None, espera / 2)  # No se reenvía antes de tiempo
+        ahora += espera
+    assert esperas == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+    assert cola.resumen()["reintentos"] == 6
+    assert cola.resumen()["enviados"] == 1
+
+
+def test_un_comando_en_vuelo_a_la_vez():
+    cola = cola_con_ack()
+    primero = cola.agregar("c:30.0,10.0", 0.0)
+    cola.agregar("q:", 0.0)
+    cola.siguiente(0.0)
+    assert cola.siguiente(0.1)[0] is None
+    cola.confirmar(primero.seq, 0.1)
+    assert seq_de(cola.siguiente(0.1)[0])[0] == "q:"
+
+
+def test_setpoint_nuevo_reemplaza_al_pendiente():
+    cola = cola_con_ack()
+    anterior = cola.agregar("s:10.0", 0.0)
+    cola.siguiente(0.0)  # En vuelo
+    cola.agregar("h:0.5", 0.0)
+    nuevo = cola.agregar("s:12.0", 0.1)
+    assert [comando.texto for comando in cola.pendientes] == ["h:0.5", "s:12.0"]
+    assert nuevo.seq != anterior.seq
+    assert not cola.confirmar(anterior.seq, 0.2)
+    assert cola.resumen()["reemplazados"] == 1
+
+
+def test_consultas_no_se_agrupan():
+    cola = cola_con_ack()
+    cola.agregar("q:", 0.0)
+    cola.agregar("q:", 0.0)
+    cola.agregar("p:off", 0.0)
+    cola.agregar("p:off", 0.0)
+    assert len(cola) == 4
+
+
+def test_cola_llena_descarta_el_mas_antiguo(capsys):
+    cola = cola_con_ack()
+    for i in range(comandos.MAX_PENDIENTES + 2):
+        cola.agregar("q:", float(i))
+    assert len(cola) == comandos.MAX_PENDIENTES
+    assert cola.resumen()["descartados"] == 2
+    assert cola.pendientes[0].creado == 2.0
+    assert "Cola de comandos llena" in capsys.readouterr().out
+
+
+def test_sin_acuses_se_entrega_al_enviar():
+    cola = ColaComandos()
+    cola.agregar("s:10.0", 0.0)
+    cola.agregar("c:30.0,10.0", 0.0)
+    assert cola.siguiente(0.0) == ("s:10.0", 0.0)  # Sin número de secuencia
+    assert cola.siguiente(0.0) == ("c:30.0,10.0", 0.0)
+    assert cola.siguiente(0.0) == (None, None)
+    assert "sin acuses" in cola.texto()
+
+
+def test_reconexion_reenvia_el_comando_en_vuelo():
+    cola = cola_con_ack()
+    comando = cola.agregar("s:10.0", 0.0)
+    cola.siguiente(0.0)
+    assert cola.siguiente(0.1)[0] is None
+    cola.reconectado(True)
+    assert seq_de(cola.siguiente(0.1)[0]) == ("s:10.0", comando.seq)
+
+
+def test_reconexion_sin_acuses_vacia_la_cola():
+    cola = cola_con_ack()
+    cola.agregar("s:10.0", 0.0)
+    cola.siguiente(0.0)
+    cola.reconectado(False)  # Firmware anterior: el comando en vuelo se envía una vez más sin número
+    assert cola.siguiente(0.1) == ("s:10.0", 0.0)
+    assert len(cola) == 0
+
+
+def test_secuencia_da_la_vuelta_sin_cero():
+    cola = ColaComandos()
+    cola._seq = 0x7FFFFFFF
+    assert cola.agregar("q:", 0.0).seq == 1
+
+
+def test_ajuste_nuevo_reemplaza_al_pendiente():
+    cola = cola_con_ack()
+    cola.agregar("k:1.0,0.1,0.0", 0.0)
+    cola.agregar("r:50", 0.0)
+    cola.agregar("k:2.0,0.1,0.0", 0.1)
+    assert [comando.texto for comando in cola.pendientes] == ["r:50", "k:2.0,0.1,0.0"]
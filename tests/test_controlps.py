@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import controlps
+
+
+@pytest.mark.parametrize("ganancias", [(1.0, 0.1, 0.05), (0.3, 0.0, 0.1)])
+def test_lote_coincide_con_simulate_pid(ganancias):
+    h, _ = controlps.simulate_pid(*ganancias)
+    lote = controlps.simulate_pid_batch(*ganancias, keep_history=True)
+    assert lote["h"].shape == (1, len(controlps.t))
+    assert np.allclose(lote["h"][0], h)
+    assert lote["iae"][0] == pytest.approx(np.sum(np.abs(controlps.setpoint[1:] - h[:-1])) * controlps.dt)
+
+
+def test_cada_candidato_es_independiente():
+    kp = np.array([0.5, 1.0, 3.0])
+    lote = controlps.simulate_pid_batch(kp, 0.1, 0.05)
+    for i, k in enumerate(kp):
+        solo = controlps.simulate_pid_batch(k, 0.1, 0.05)
+        for metrica in ("iae", "ise", "overshoot", "settling_time"):
+            assert lote[metrica][i] == pytest.approx(solo[metrica][0])
+
+
+def test_metricas_de_un_escalon():
+    sp = np.full(2000, 10.0)
+    sp[0] = 0.0
+    lento = controlps.simulate_pid_batch(0.05, 0.0, 0.0, sp=sp)    # Llega sin pasarse y sin asentarse en 20 s
+    rapido = controlps.simulate_pid_batch(1.0, 0.0, 0.0, sp=sp, keep_history=True)
+    assert lento["overshoot"][0] == 0.0
+    assert lento["settling_time"][0] == np.inf
+    assert np.isfinite(rapido["settling_time"][0])
+    assert rapido["h"][0, -1] == pytest.approx(10.0, abs=0.2)
+    assert not np.signbit(rapido["overshoot"]).any()
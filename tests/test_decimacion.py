@@ -0,0 +1,48 @@
+import numpy as np
+
+from decimacion import lttb, minmax
+
+
+def serie(n=100_000, semilla=3):
+    rng = np.random.default_rng(semilla)
+    tiempo = np.cumsum(rng.uniform(0.05, 0.15, n))
+    valores = np.cumsum(rng.normal(size=n))
+    return tiempo, valores
+
+
+def test_minmax_conserva_los_extremos_de_cada_columna():
+    tiempo, valores = serie()
+    columnas = 400
+    t, v = minmax(tiempo, valores, columnas)
+    assert len(t) <= 2 * columnas
+    assert np.all(np.diff(t) > 0)
+    assert v.min() == valores.min() and v.max() == valores.max()
+    # Cada columna de píxeles conserva su mínimo y su máximo
+    columna = ((tiempo - tiempo[0]) * (columnas / (tiempo[-1] - tiempo[0]))).astype(int).clip(max=columnas - 1)
+    columna_t = ((t - tiempo[0]) * (columnas / (tiempo[-1] - tiempo[0]))).astype(int).clip(max=columnas - 1)
+    for c in (0, 123, columnas - 1):
+        assert v[columna_t == c].min() == valores[columna == c].min()
+        assert v[columna_t == c].max() == valores[columna == c].max()
+
+
+def test_minmax_no_toca_series_cortas():
+    tiempo, valores = serie(50)
+    t, v = minmax(tiempo, valores, 100)
+    assert np.array_equal(t, tiempo) and np.array_equal(v, valores)
+
+
+def test_lttb_conserva_bordes_y_picos():
+    tiempo = np.arange(10_000, dtype=float)
+    valores = np.zeros(10_000)
+    valores[4321] = 50.0
+    t, v = lttb(tiempo, valores, 200)
+    assert len(t) == 200
+    assert (t[0], t[-1]) == (0.0, 9999.0)
+    assert np.all(np.diff(t) > 0)
+    assert 50.0 in v
+
+
+def test_lttb_no_toca_series_cortas():
+    tiempo, valores = serie(100)
+    t, v = lttb(tiempo, valores, 500)
+    assert np.array_equal(t, tiempo) and np.array_equal(v, valores)
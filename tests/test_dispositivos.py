@@ -0,0 +1,94 @@
+import pytest
+
+import dispositivos
+import protocolo
+from protocolo import Muestra
+
+
+@pytest.fixture
+def dispositivo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Los buffers se crean en dispositivos/<id>.bin
+    return dispositivos.RegistroDispositivos().obtener("tanque1")
+
+
+def test_identificadores_validos():
+    assert dispositivos.id_valido("tanque_1-a")
+    for invalido in ("", None, "../data", "tanque 1", "x" * 33):
+        assert not dispositivos.id_valido(invalido)
+
+
+def test_registro_reutiliza_el_dispositivo(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registro = dispositivos.RegistroDispositivos()
+    assert registro.obtener("a") is registro.obtener("a")
+    assert registro.buscar("b") is None
+    assert (tmp_path / "dispositivos" / "a.bin").exists()
+    registro.obtener("a").telemetria.cerrar()  # Un solo escritor por archivo
+    registro.obtener("a").historial.cerrar()
+
+    otro = dispositivos.RegistroDispositivos()
+    otro.cargar_existentes()
+    assert [d.id for d in otro.todos()] == ["a"]
+
+
+def test_tiempos_con_el_reloj_del_dispositivo(dispositivo):
+    # Lote de tres muestras cada 100 ms; la última llegó 20 ms después de medirse
+    muestras = [Muestra(1, 1000, 1.0, 0.0), Muestra(2, 1100, 2.0, 0.0), Muestra(3, 1200, 3.0, 0.0)]
+    filas = dispositivo.procesar(muestras, 500.02)
+    assert [fila[2] for fila in filas] == pytest.approx([499.82, 499.92, 500.02])
+    # Una muestra que llega más rápido corrige el desfase
+    assert dispositivo.procesar([Muestra(4, 1300, 4.0, 0.0)], 500.11)[0][2] == pytest.approx(500.11)
+    assert dispositivo.desfase == pytest.approx(498.81)
+
+
+def test_cuenta_las_muestras_perdidas(dispositivo):
+    dispositivo.guardar(dispositivo.procesar([Muestra(10, 1000, 1.0, 0.0)], 100.0))
+    dispositivo.guardar(dispositivo.procesar([Muestra(14, 1400, 1.0, 0.0)], 100.4))
+    assert dispositivo.perdidas == 3
+    assert len(dispositivo.telemetria) == 2
+
+
+def test_metricas_de_jitter_y_latencia():
+    metricas = dispositivos.MetricasEnlace()
+    # Periodo de 100 ms con ±10 ms alternados; la muestra 5 se pierde y su hueco no cuenta como intervalo
+    tiempos = {1: 0, 2: 110, 3: 200, 4: 310, 6: 510, 7: 600}
+    for seq, t_ms in tiempos.items():
+        metricas.agregar(seq, t_ms, latencia=0.020 if seq % 2 else 0.040)
+    resumen = metricas.resumen()
+    assert resumen["periodo_ms"] == pytest.approx(100.0)
+    assert resumen["jitter_ms"] == pytest.approx(10.0)
+    assert resumen["periodo_max_ms"] == pytest.approx(110.0)
+    assert resumen["latencia_p50_ms"] == pytest.approx(30.0)
+    assert resumen["latencia_max_ms"] == pytest.approx(40.0)
+    assert "jitter 10.0 ms" in metricas.texto()
+    assert dispositivos.MetricasEnlace().texto() == "sin datos"
+
+
+def test_procesar_guarda_reloj_y_recepcion(dispositivo):
+    filas = dispositivo.procesar([Muestra(1, 1000, 1.0, 0.0), Muestra(2, 1100, 2.0, 0.0)], 50.0)
+    assert [fila[3:] for fila in filas] == [(1000.0, 50.0), (1100.0, 50.0)]
+    # La primera muestra del lote esperó un periodo más que la última
+    assert list(dispositivo.metricas.latencias) == pytest.approx([100.0, 0.0])
+    assert list(dispositivo.metricas.intervalos) == [100]
+
+
+def test_metricas_incluyen_el_estado_del_lazo():
+    metricas = dispositivos.MetricasEnlace()
+    metricas.lazo = protocolo.EstadoLazo(ciclos=10, atrasos=2, dt_max_us=105000, ejecucion_max_us=800, ecos_perdidos=1)
+    assert metricas.resumen()["lazo_dt_max_ms"] == pytest.approx(105.0)
+    assert "2 atrasos en 10 ciclos" in metricas.texto()
+
+
+def test_texto_de_ajustes(dispositivo):
+    assert dispositivo.texto_ajustes() == "sin reporte del dispositivo"
+    dispositivo.ajustes = protocolo.parsear_ajustes("g:0.15,0.02,0.05,0.2,65,70,100")
+    assert dispositivo.texto_ajustes() == "Kp=0.15 Ki=0.02 Kd=0.05, histéresis 0.2 cm, PWM mínimo 65/70, periodo 100 ms"
+
+
+def test_tiempos_no_retroceden_si_baja_el_desfase(dispositivo):
+    # Lote lento: la última muestra llegó 300 ms después de medirse
+    filas = dispositivo.procesar([Muestra(1, 1000, 1.0, 0.0), Muestra(2, 1100, 2.0, 0.0)], 100.3)
+    # Un mensaje rápido baja el desfase y su tiempo estimado queda antes que el anterior
+    siguiente = dispositivo.procesar([Muestra(3, 1150, 3.0, 0.0)], 100.16)
+    assert siguiente[0][2] == pytest.approx(filas[-1][2] + dispositivos.PASO_MINIMO)
+    assert dispositivo.procesar([Muestra(4, 1400, 4.0, 0.0)], 100.41)[0][2] == pytest.approx(100.41)
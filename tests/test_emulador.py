@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+import emulador
+from modelo_planta import ModeloPlanta
+
+
+def test_la_planta_recibe_el_pwm_minimo():
+    dispositivo = emulador.DispositivoVirtual("emu-0000", ModeloPlanta(v_llenado=1.0))
+    dispositivo.potencia = 5.0  # Por debajo del mínimo: la bomba arranca con el PWM mínimo
+    dispositivo.control.setpoint = 10.0
+    asyncio.run(dispositivo._paso(1.0))
+    assert dispositivo.h == pytest.approx(emulador.PWM_MINIMO / 255)
+
+    dispositivo.atender("m:0,0")
+    dispositivo.h, dispositivo.potencia = 0.0, 5.0
+    asyncio.run(dispositivo._paso(1.0))
+    assert dispositivo.h == pytest.approx(0.05)
+
+
+def test_c_cambia_la_altura_del_tanque():
+    dispositivo = emulador.DispositivoVirtual("emu-0000", ModeloPlanta(v_llenado=1.0, h_max=20.0))
+    dispositivo.h = 15.0
+    dispositivo.atender("c:12,8")
+    assert (dispositivo.altura, dispositivo.diametro, dispositivo.h) == (12.0, 8.0, 12.0)
+    dispositivo.potencia = 100.0
+    asyncio.run(dispositivo._paso(10.0))
+    assert dispositivo.h == 12.0
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import historial
+from telemetria import BufferTelemetria
+
+
+@pytest.fixture
+def hist(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reciente = BufferTelemetria(str(tmp_path / "reciente.bin"), capacidad=50, campos=("Nivel", "Potencia", "Tiempo"))
+    h = historial.Historial("tanque", reciente)
+    yield h
+    h.cerrar()
+    reciente.cerrar()
+
+
+def alimentar(h, tiempos, niveles, potencia=0.5):
+    for t, nivel in zip(tiempos, niveles):
+        h.reciente.agregar(nivel, potencia, t)
+        h.agregar(nivel, potencia, t)
+
+
+def test_resumen_de_un_segundo(hist):
+    tiempos = 1000.0 + np.arange(50) * 0.1  # Cinco segundos a 10 Hz
+    niveles = np.arange(50, dtype=float)
+    alimentar(hist, tiempos, niveles)
+    filas = hist.escalas["1s"].buffer.arreglo()
+    assert len(filas) == 4  # El quinto segundo sigue abierto
+    assert filas[0].tolist() == pytest.approx([1000.0, 0.0, 9.0, 4.5, 0.5, 10])
+    assert filas[3].tolist() == pytest.approx([1003.0, 30.0, 39.0, 34.5, 0.5, 10])
+
+
+def test_cada_escala_alimenta_a_la_siguiente(hist):
+    tiempos = 6000.0 + np.arange(130 * 4) * 0.25
+    niveles = np.sin(tiempos)
+    alimentar(hist, tiempos, niveles)
+    minutos = hist.escalas["1min"].buffer.arreglo()
+    assert minutos[:, 0].tolist() == [6000.0, 6060.0]
+    assert minutos[:, 5].tolist() == [240, 240]
+    assert minutos[0, 1] == pytest.approx(niveles[:240].min())
+    assert minutos[0, 2] == pytest.approx(niveles[:240].max())
+    assert minutos[0, 3] == pytest.approx(niveles[:240].mean())
+
+
+def test_consultar_usa_la_ventana_reciente_si_alcanza(hist):
+    tiempos = 100.0 + np.arange(200) * 0.1
+    alimentar(hist, tiempos, np.arange(200, dtype=float))
+    serie = hist.consultar(116.0, 119.0)
+    assert serie.escala == "reciente"
+    assert serie.tiempo[0] > 116.0 and serie.tiempo[-1] <= 119.0
+
+
+def test_consultar_pasa_al_resumen_y_respeta_max_puntos(hist):
+    tiempos = 100.0 + np.arange(600) * 0.1
+    niveles = np.zeros(600)
+    niveles[123] = 7.0  # Un pico aislado no debe perderse al reagrupar
+    niveles[456] = -3.0
+    alimentar(hist, tiempos, niveles)
+    serie = hist.consultar(100.0, 160.0, max_puntos=10)
+    assert serie.escala == "1s"
+    assert len(serie.tiempo) <= 10
+    assert serie.maximo.max() == 7.0
+    assert serie.minimo.min() == -3.0
+
+
+def test_consultar_sin_datos(hist):
+    serie = hist.consultar(0.0, 10.0)
+    assert serie.escala is None and len(serie.tiempo) == 0
@@ -0,0 +1,86 @@
+import csv
+
+import numpy as np
+import pytest
+
+import identificacion
+
+
+def velocidad(u, v_llenado, z_llenado, v_vaciado, z_vaciado):
+    """Planta con zona muerta: velocidad = v·(|u| - z)/(1 - z) fuera de la zona, 0 dentro."""
+    v, z = (v_llenado, z_llenado) if u > 0 else (v_vaciado, z_vaciado)
+    return np.sign(u) * v * max(abs(u) - z, 0.0) / (1 - z)
+
+
+def registro(ruta, parametros, n=6000, periodo=0.1, semilla=1):
+    """Escribe un CSV Nivel,Potencia,Tiempo de un ensayo que va y viene entre 4 y 16 cm con potencias al azar."""
+    rng = np.random.default_rng(semilla)
+    h, filas = 10.0, []
+    for i in range(n):
+        objetivo = 4.0 if (i // 400) % 2 else 16.0
+        u = np.sign(objetivo - h) * rng.uniform(0.3, 1.0) if abs(objetivo - h) > 0.2 else 0.0
+        filas.append((h, u * 100, i * periodo))
+        h += velocidad(u, *parametros) * periodo if u else 0.0
+    with open(ruta, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Nivel", "Potencia", "Tiempo"])
+        writer.writerows(filas)
+
+
+def test_recupera_velocidades_y_zona_muerta(tmp_path):
+    ruta = str(tmp_path / "ensayo.csv")
+    registro(ruta, (0.7, 0.2, 0.5, 0.1))
+    modelo = identificacion.identificar([ruta], bloque=700)  # Varios bloques: el ajuste se acumula entre ellos
+    assert modelo["v_llenado"] == pytest.approx(0.7, rel=1e-3)
+    assert modelo["zona_llenado"] == pytest.approx(0.2, abs=1e-3)
+    assert modelo["v_vaciado"] == pytest.approx(0.5, rel=1e-3)
+    assert modelo["zona_vaciado"] == pytest.approx(0.1, abs=1e-3)
+    assert modelo["curva"]["llenado"]["rmse"] < 1e-6
+    assert modelo["fuentes"][0]["usadas"] > 1000
+
+
+def test_el_bloque_no_cambia_el_resultado(tmp_path):
+    ruta = str(tmp_path / "ensayo.csv")
+    registro(ruta, (0.7, 0.0, 0.5, 0.0))
+    entero = identificacion.identificar([ruta], bloque=100000)
+    por_bloques = identificacion.identificar([ruta], bloque=333)
+    for clave in ("v_llenado", "v_vaciado", "zona_llenado", "zona_vaciado"):
+        assert por_bloques[clave] == pytest.approx(entero[clave])
+
+
+def test_ajuste_lineal_por_el_origen_con_una_sola_potencia():
+    ajuste = identificacion.AjusteLineal()
+    ajuste.agregar(np.ones(10), np.full(10, 0.6))
+    pendiente, ordenada, rmse = ajuste.resolver()
+    assert (pendiente, ordenada) == (pytest.approx(0.6), 0.0)
+    assert identificacion.AjusteLineal().resolver() is None
+
+
+def test_una_sola_potencia_no_deja_zona_negativa(tmp_path):
+    ruta = str(tmp_path / "ensayo.csv")
+    with open(ruta, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Nivel", "Potencia", "Tiempo"])
+        h = 4.0
+        for i in range(400):
+            u = 1.0 if i < 200 else -1.0  # Solo llenado y vaciado al 100%
+            writer.writerow([h, u * 100, i * 0.1])
+            h += (0.7 if u > 0 else -0.5) * 0.1
+    modelo = identificacion.identificar([ruta])
+    for accion in ("llenado", "vaciado"):
+        assert modelo[f"zona_{accion}"] == 0.0
+        assert not np.signbit(modelo[f"zona_{accion}"])
+
+
+def test_problemas_del_ajuste(tmp_path):
+    ruta = str(tmp_path / "ensayo.csv")
+    registro(ruta, (0.7, 0.2, 0.5, 0.1))
+    modelo = identificacion.identificar([ruta])
+    assert identificacion.problemas(modelo) == []
+    assert identificacion.problemas(modelo, min_muestras=10**6) == [
+        f"llenado: {modelo['curva']['llenado']['muestras']} muestras (mínimo 1000000)",
+        f"vaciado: {modelo['curva']['vaciado']['muestras']} muestras (mínimo 1000000)"]
+    modelo["curva"]["vaciado"]["rmse"] = 5.0
+    assert identificacion.problemas(modelo) == [f"vaciado: RMSE 5.000 cm/s (máximo {identificacion.MAX_RMSE})"]
+    del modelo["curva"]["llenado"]
+    assert identificacion.problemas(modelo)[0] == "sin muestras de llenado"
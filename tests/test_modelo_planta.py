@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from modelo_planta import ModeloPlanta
+
+
+def integrar(modelo, t, inicios, mandos, h0=0.0):
+    """Referencia paso a paso: el mismo perfil avanzando con paso() en cada intervalo de t."""
+    h = [h0]
+    for anterior, actual in zip(t[:-1], t[1:]):
+        u = mandos[np.searchsorted(inicios, actual, side="left") - 1]
+        h.append(float(modelo.paso(h[-1], u, actual - anterior)))
+    return np.array(h)
+
+
+def test_perfil_coincide_con_el_paso_a_paso():
+    modelo = ModeloPlanta(0.7, 0.5, 20.0)
+    t = np.arange(0, 120.0, 0.5)
+    inicios, mandos = [0.0, 20.0, 50.0, 90.0], [1.0, 0.0, -0.6, 0.8]
+    assert np.allclose(modelo.perfil(t, inicios, mandos, h0=2.0), integrar(modelo, t, inicios, mandos, 2.0))
+
+
+def test_perfil_se_recorta_al_recipiente():
+    modelo = ModeloPlanta(1.0, 1.0, 10.0)
+    niveles = modelo.perfil(np.array([0.0, 5.0, 30.0, 35.0, 60.0]), [0.0, 30.0], [1.0, -1.0], h0=0.0)
+    assert np.allclose(niveles, [0.0, 5.0, 10.0, 5.0, 0.0])
+
+
+def test_velocidades_asimetricas():
+    modelo = ModeloPlanta(0.8, 0.4, 20.0)
+    assert np.allclose(modelo.velocidad([1.0, 0.5, 0.0, -0.5, -1.0]), [0.8, 0.4, 0.0, -0.2, -0.4])
+    assert modelo.paso(19.9, 1.0, 1.0) == pytest.approx(20.0)
+
+
+def test_varias_geometrias_a_la_vez():
+    alturas = np.array([10.0, 20.0, 30.0])
+    modelo = ModeloPlanta(1.0, 0.5, alturas)
+    t = np.linspace(0, 40, 81)
+    niveles = modelo.perfil(t, [0.0, 25.0], [1.0, -1.0])
+    assert niveles.shape == (3, len(t))
+    for fila, altura in zip(niveles, alturas):
+        assert np.allclose(fila, ModeloPlanta(1.0, 0.5, altura).perfil(t, [0.0, 25.0], [1.0, -1.0]))
+
+
+def test_desde_caudales():
+    modelo = ModeloPlanta.desde_caudales(50.0, 25.0, 100.0, 15.0)
+    assert float(modelo.v_llenado) == 0.5 and float(modelo.v_vaciado) == 0.25 and modelo.geometrias == 1
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import mpc
+from modelo_planta import ModeloPlanta
+
+
+def test_mando_aplicado_respeta_el_pwm_minimo():
+    assert mpc.mando_aplicado(0.0) == 0.0
+    assert mpc.mando_aplicado(0.005) == 0.0
+    assert mpc.mando_aplicado(0.1) == pytest.approx(mpc.MANDO_MINIMO)
+    assert mpc.mando_aplicado(-0.1) == pytest.approx(-mpc.MANDO_MINIMO)
+    assert mpc.mando_aplicado(0.8) == 0.8
+
+
+def test_mandos_posibles():
+    controlador = mpc.ControladorMPC(ModeloPlanta())
+    controlador.setpoint = 10.0
+    assert controlador.mando(2.0) == 1.0  # Lejos por debajo: llenar a fondo
+    controlador = mpc.ControladorMPC(ModeloPlanta())
+    controlador.setpoint = 2.0
+    assert controlador.mando(15.0) == -1.0
+    assert controlador.calculos == 1 and "1 mandos" in controlador.texto()
+
+
+def test_lazo_cerrado_llega_al_setpoint():
+    planta = ModeloPlanta(zona_llenado=0.1, zona_vaciado=0.1)
+    controlador = mpc.ControladorMPC(planta)
+    setpoint = np.concatenate((np.full(600, 12.0), np.full(600, 5.0)))
+
+    def controlar(nivel, dt, sp):
+        controlador.setpoint = sp
+        u = controlador.mando(nivel)
+        assert u == 0.0 or abs(u) >= mpc.MANDO_MINIMO - 1e-9
+        return u * 100.0
+
+    h, potencia = mpc.simular(controlar, planta, setpoint)
+    resultado = mpc.metricas(h, potencia, setpoint)
+    assert h[599] == pytest.approx(12.0, abs=mpc.TOLERANCIA)
+    assert h[-1] == pytest.approx(5.0, abs=mpc.TOLERANCIA)
+    assert np.isfinite(resultado["asentamiento"])
+    assert resultado["sobrepaso"] < 1.0
+
+
+def test_metricas_de_un_escalon():
+    setpoint = np.full(100, 10.0)
+    h = np.concatenate(([0.0], np.full(47, 5.0), np.full(52, 10.0)))  # Entra en la banda en el ciclo 48
+    resultado = mpc.metricas(h, np.full(100, 50.0), setpoint)
+    assert resultado["asentamiento"] == pytest.approx(4.7)
+    assert resultado["sobrepaso"] == 0.0
+    assert resultado["cambios_sentido"] == 0
+    assert mpc.metricas(np.zeros(100), np.zeros(100), setpoint)["asentamiento"] == np.inf
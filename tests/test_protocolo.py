@@ -0,0 +1,88 @@
+import math
+
+import pytest
+
+import protocolo
+from protocolo import ErrorProtocolo, Muestra
+
+
+def test_muestra_binaria_ida_y_vuelta():
+    trama = protocolo.empaquetar_muestra(7, 1234, 12.5, -40.0)
+    assert len(trama) == protocolo.TRAMA_MUESTRA.size == 18
+    assert protocolo.parsear_binario(trama) == [Muestra(7, 1234, 12.5, -40.0)]
+
+
+def test_lote_binario_numera_las_muestras():
+    trama = protocolo.empaquetar_lote(0xFFFFFFFF, [(100, 1.0, 10.0), (200, 2.0, 20.0)])
+    muestras = protocolo.parsear_binario(trama)
+    assert [muestra.seq for muestra in muestras] == [0xFFFFFFFF, 0]
+    assert [muestra.t_ms for muestra in muestras] == [100, 200]
+
+
+@pytest.mark.parametrize("trama", [
+    b"",
+    b"\x01",
+    bytes([protocolo.VERSION + 1, protocolo.TIPO_MUESTRA]) + bytes(16),
+    bytes([protocolo.VERSION, 9]) + bytes(16),
+    protocolo.empaquetar_muestra(1, 1, 1.0, 1.0)[:-1],
+    protocolo.empaquetar_lote(1, [(1, 1.0, 1.0)]) + b"\x00",
+    protocolo.empaquetar_muestra(1, 1, 1.0, 150.0),
+    protocolo.empaquetar_muestra(1, 1, math.nan, 0.0),
+])
+def test_binario_invalido(trama):
+    with pytest.raises(ErrorProtocolo):
+        protocolo.parsear_binario(trama)
+
+
+def test_texto_compacto_lote_y_heredado():
+    assert protocolo.parsear_texto("t:5,1000,10.25,-3.5") == [Muestra(5, 1000, 10.25, -3.5)]
+    assert protocolo.parsear_texto("l:9;100,1.0,2.0;200,1.5,3.0") == [Muestra(9, 100, 1.0, 2.0), Muestra(10, 200, 1.5, 3.0)]
+    assert protocolo.parsear_texto("[4.5,60]") == [Muestra(None, None, 4.5, 60.0)]
+
+
+@pytest.mark.parametrize("mensaje", [
+    "t:1,2,3",
+    "t:1,2,abc,4",
+    "l:1",
+    "l:1;" + ";".join(["1,1,1"] * (protocolo.MAX_MUESTRAS_LOTE + 1)),
+    "[__import__('os'),0]",
+    "[1,2,3]",
+    "t:1,2,inf,0",
+    "x:1",
+])
+def test_texto_invalido(mensaje):
+    with pytest.raises(ErrorProtocolo):
+        protocolo.parsear_texto(mensaje)
+
+
+def test_saludo_y_negociacion():
+    saludo = protocolo.parsear_saludo(f"hola:v={protocolo.VERSION};f=bin|txt")
+    assert saludo == {"v": str(protocolo.VERSION), "f": "bin|txt"}
+    assert protocolo.negociar_formato(saludo, binario_disponible=True) == protocolo.FORMATO_BINARIO
+    assert protocolo.negociar_formato(saludo, binario_disponible=False) == protocolo.FORMATO_TEXTO
+    otra_version = protocolo.parsear_saludo(f"hola:v={protocolo.VERSION + 1};f=bin")
+    assert protocolo.negociar_formato(otra_version, binario_disponible=True) == protocolo.FORMATO_TEXTO
+    assert protocolo.negociar_formato({}, binario_disponible=True) == protocolo.FORMATO_TEXTO
+
+
+def test_estado_del_lazo():
+    assert protocolo.parsear_lazo("o:10,2,105000,800,1") == protocolo.EstadoLazo(10, 2, 105000, 800, 1)
+    for invalido in ("o:10,2", "o:a,b,c,d,e", "o:"):
+        with pytest.raises(ErrorProtocolo):
+            protocolo.parsear_lazo(invalido)
+
+
+def test_acuse_de_comando():
+    assert protocolo.parsear_acuse("a:17") == 17
+    assert protocolo.parsear_saludo("hola:id=t1;v=2;f=bin;a=1")["a"] == "1"
+    for invalido in ("a:", "a:x", "a:1.5"):
+        with pytest.raises(ErrorProtocolo):
+            protocolo.parsear_acuse(invalido)
+
+
+def test_reporte_de_ajustes():
+    ajustes = protocolo.parsear_ajustes("g:0.15,0.02,0.05,0.2,65,70,100")
+    assert ajustes == protocolo.AjustesLazo(0.15, 0.02, 0.05, 0.2, 65, 70, 100)
+    for invalido in ("g:0.15,0.02", "g:a,b,c,d,e,f,g", "g:0.1,0.1,0.1,0.1,65.5,70,100"):
+        with pytest.raises(ErrorProtocolo):
+            protocolo.parsear_ajustes(invalido)
@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import protocolo
+import recetas
+from modelo_planta import ModeloPlanta
+from recetas import ErrorReceta, Receta
+
+
+def test_receta_desde_texto():
+    receta = Receta.desde_texto("10, m60, 20/120, m30, 0")
+    assert receta.tramos == [("escalon", 10.0, 0.0), ("mantener", 0.0, 60.0), ("rampa", 20.0, 120.0),
+                             ("mantener", 0.0, 30.0), ("escalon", 0.0, 0.0)]
+    assert receta.duracion == 210.0
+    assert receta.final == 0.0
+    for invalida in ("", "10,x", "-5", "20/0", "m-1"):
+        with pytest.raises(ErrorReceta):
+            Receta.desde_texto(invalida)
+
+
+def test_perfil_de_setpoint():
+    receta = Receta.desde_texto("10,m60,20/120,m30")
+    t = np.array([0.0, 30.0, 60.0, 120.0, 180.0, 200.0])
+    assert receta.setpoint(t, inicial=5.0).tolist() == pytest.approx([10.0, 10.0, 10.0, 15.0, 20.0, 20.0])
+    assert Receta.desde_texto("m10,8").setpoint([0.0, 9.9, 10.0], inicial=3.0).tolist() == [3.0, 3.0, 8.0]
+
+
+def test_eventos_de_una_rampa():
+    eventos = Receta.desde_texto("2/1.2,m5").eventos(inicial=0.0)
+    assert eventos == [(0.0, 0.0), (0.5, 0.8), (1.0, 1.7), (1.2, 2.0)]
+    # Sin valores repetidos: una rampa lenta solo envía cuando cambia la décima
+    lenta = Receta.desde_texto("10.2/10").eventos(inicial=10.0)
+    assert [valor for _, valor in lenta] == [10.0, 10.1, 10.2]
+    assert all(a[1] != b[1] for a, b in zip(lenta, lenta[1:]))
+
+
+def test_prediccion_termina_en_el_setpoint():
+    receta = Receta.desde_texto("8,m30,4/20")
+    prediccion = recetas.predecir(receta, inicial=2.0, altura=15.5, modelo=ModeloPlanta())
+    assert prediccion["completada"] is not None and prediccion["completada"] >= receta.duracion
+    assert prediccion["nivel_final"] == pytest.approx(4.0, abs=recetas.TOLERANCIA)
+    assert prediccion["sp"][-1] == 4.0
+    assert "completado previsto" in recetas.texto_prediccion(prediccion)
+
+
+def test_prediccion_inalcanzable():
+    prediccion = recetas.predecir(Receta.desde_texto("30"), altura=15.5, modelo=ModeloPlanta())
+    assert prediccion["completada"] is None
+    assert prediccion["nivel_final"] <= 15.5
+
+
+def test_prediccion_con_los_ajustes_del_dispositivo():
+    receta = Receta.desde_texto("8")
+    lento = protocolo.AjustesLazo(0.15, 0.02, 0.05, 0.2, 65, 65, 250)
+    prediccion = recetas.predecir(receta, ajustes=lento, modelo=ModeloPlanta())
+    assert prediccion["t"][1] == pytest.approx(0.25)  # Simula al periodo de control reportado
+    assert prediccion["nivel_final"] == pytest.approx(8.0, abs=recetas.TOLERANCIA)
+
+
+def test_ejecucion_envia_y_espera_el_nivel():
+    nivel = SimpleNamespace(valor=0.0)
+    dispositivo = SimpleNamespace(id="t1", conectado=True,
+                                  telemetria=SimpleNamespace(ultimas=lambda n: [(nivel.valor, 0.0, 0.0)]))
+    enviados = []
+
+    def enviar(destino, mensaje):
+        enviados.append(mensaje)
+        nivel.valor = float(mensaje[2:])  # El tanque sigue al setpoint al instante
+
+    ejecucion = recetas.EjecucionReceta(1, Receta.desde_texto("1,1.5/0.6"), [dispositivo])
+    asyncio.run(ejecucion.ejecutar(enviar))
+    assert enviados == ["s:1.0", "s:1.4", "s:1.5"]  # El escalón en t=0 reemplaza al setpoint inicial
+    assert ejecucion.estado == "completada"
+    assert ejecucion.completada == pytest.approx(0.6, abs=0.1)
+    assert "completada a los" in ejecucion.texto()
@@ -0,0 +1,16 @@
+import numpy as np
+
+import sintonizador
+
+
+def test_programa_de_setpoint():
+    sp = sintonizador.construir_setpoint("0:20,40:0,60:5", 80.0, 10.0)
+    assert np.array_equal(sp, [20, 20, 20, 20, 0, 0, 5, 5])
+
+
+def test_costo_penaliza_no_asentarse():
+    metricas = {"iae": np.array([10.0, 10.0]), "overshoot": np.array([1.0, 1.0]),
+                "settling_time": np.array([5.0, np.inf])}
+    costo = sintonizador.costo(metricas)
+    assert costo[0] == 10.0 + sintonizador.PESO_SOBREPASO + sintonizador.PESO_ASENTAMIENTO * 5.0
+    assert costo[1] > costo[0] + sintonizador.PENALIZACION_SIN_ASENTAR / 2
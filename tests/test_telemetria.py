@@ -0,0 +1,138 @@
+import math
+
+import pytest
+
+from telemetria import CAMPOS, BufferTelemetria, ErrorTelemetria
+
+
+def muestra(i):
+    return tuple(float(i * (k + 1)) for k in range(len(CAMPOS)))
+
+
+def test_buffer_da_la_vuelta(tmp_path):
+    buffer = BufferTelemetria(str(tmp_path / "data.bin"), capacidad=5)
+    for i in range(12):
+        buffer.agregar(*muestra(i))
+    assert buffer.total == 12
+    assert len(buffer) == 5
+    assert buffer.ultimas() == [muestra(i) for i in range(7, 12)]
+    assert buffer.ultimas(2) == [muestra(10), muestra(11)]
+    buffer.cerrar()
+
+
+def test_buffer_sin_llenar(tmp_path):
+    buffer = BufferTelemetria(str(tmp_path / "data.bin"), capacidad=5)
+    assert buffer.ultimas() == []
+    buffer.agregar(*muestra(1))
+    assert buffer.ultimas(10) == [muestra(1)]
+    buffer.cerrar()
+
+
+def test_reabrir_conserva_las_muestras(tmp_path):
+    ruta = str(tmp_path / "data.bin")
+    buffer = BufferTelemetria(ruta, capacidad=4)
+    for i in range(6):
+        buffer.agregar(*muestra(i))
+    buffer.cerrar()
+
+    buffer = BufferTelemetria(ruta, capacidad=4)
+    assert buffer.total == 6
+    assert buffer.ultimas() == [muestra(i) for i in range(2, 6)]
+    buffer.cerrar()
+
+
+def test_otro_proceso_ve_las_muestras_nuevas(tmp_path):
+    ruta = str(tmp_path / "data.bin")
+    escritor = BufferTelemetria(ruta, capacidad=4)
+    lector = BufferTelemetria(ruta, solo_lectura=True)
+    escritor.agregar(*muestra(1))
+    assert lector.ultimas() == [muestra(1)]
+    assert lector.capacidad == 4
+    with pytest.raises(TypeError):
+        lector.agregar(*muestra(2))  # El mapa del lector es de solo lectura
+    escritor.cerrar()
+    lector.cerrar()
+
+
+def test_un_solo_escritor(tmp_path):
+    ruta = str(tmp_path / "data.bin")
+    escritor = BufferTelemetria(ruta, capacidad=4)
+    with pytest.raises(ErrorTelemetria):
+        BufferTelemetria(ruta, capacidad=8)  # No puede truncar ni migrar el archivo en uso
+    escritor.agregar(*muestra(1))
+    escritor.cerrar()
+    otro = BufferTelemetria(ruta, capacidad=4)  # Al cerrar se libera
+    assert otro.ultimas() == [muestra(1)]
+    otro.cerrar()
+
+
+def test_lector_sin_archivo_o_ajeno(tmp_path):
+    ruta = tmp_path / "data.bin"
+    with pytest.raises(ErrorTelemetria):
+        BufferTelemetria(str(ruta), solo_lectura=True)
+    ruta.write_bytes(b"no es telemetria, pero es largo")
+    with pytest.raises(ErrorTelemetria):
+        BufferTelemetria(str(ruta), solo_lectura=True)
+
+
+def test_migracion_desde_formato_con_menos_columnas(tmp_path):
+    ruta = str(tmp_path / "data.bin")
+    anterior = BufferTelemetria(ruta, capacidad=3, campos=CAMPOS[:3])
+    for i in range(5):
+        anterior.agregar(*muestra(i)[:3])
+    anterior.cerrar()
+
+    buffer = BufferTelemetria(ruta, capacidad=3)
+    filas = buffer.ultimas()
+    assert buffer.total == 3
+    assert [fila[:3] for fila in filas] == [muestra(i)[:3] for i in range(2, 5)]
+    assert all(math.isnan(fila[3]) and math.isnan(fila[4]) for fila in filas)
+    buffer.cerrar()
+
+
+def test_migracion_a_otra_capacidad(tmp_path):
+    ruta = str(tmp_path / "data.bin")
+    anterior = BufferTelemetria(ruta, capacidad=10)
+    for i in range(8):
+        anterior.agregar(*muestra(i))
+    anterior.cerrar()
+
+    menor = BufferTelemetria(ruta, capacidad=3)
+    assert menor.ultimas() == [muestra(i) for i in range(5, 8)]
+    menor.cerrar()
+    mayor = BufferTelemetria(ruta, capacidad=20)
+    assert mayor.ultimas() == [muestra(i) for i in range(5, 8)]
+    mayor.cerrar()
+
+
+def test_migracion_desde_formato_con_mas_columnas(tmp_path):
+    ruta = str(tmp_path / "data.bin")
+    anterior = BufferTelemetria(ruta, capacidad=4, campos=CAMPOS + ("Extra",))
+    anterior.agregar(*muestra(1), 99.0)
+    anterior.cerrar()
+
+    buffer = BufferTelemetria(ruta, capacidad=4)
+    assert buffer.ultimas() == [muestra(1)]
+    buffer.cerrar()
+
+
+def test_archivo_ajeno_se_reemplaza(tmp_path):
+    ruta = tmp_path / "data.bin"
+    ruta.write_bytes(b"no es telemetria")
+    buffer = BufferTelemetria(str(ruta), capacidad=3)
+    assert buffer.total == 0
+    buffer.agregar(*muestra(1))
+    assert buffer.ultimas() == [muestra(1)]
+    buffer.cerrar()
+
+
+def test_exportar_csv(tmp_path):
+    buffer = BufferTelemetria(str(tmp_path / "data.bin"), capacidad=3)
+    for i in range(4):
+        buffer.agregar(*muestra(i))
+    destino = tmp_path / "data.csv"
+    assert buffer.exportar_csv(str(destino)) == 3
+    lineas = destino.read_text().splitlines()
+    assert lineas[0] == ",".join(CAMPOS)
+    assert len(lineas) == 4
+    buffer.cerrar()
@@ -0,0 +1,45 @@
+import math
+
+import numpy as np
+import pytest
+
+from unidades import GeometriaTanque, cargar_tabla
+
+
+def test_cilindro():
+    geometria = GeometriaTanque(20.0, 10.0)
+    area_cm2 = math.pi * 25
+    assert geometria.volumen_maximo == pytest.approx(20 * area_cm2 / 1000)
+    assert np.allclose(geometria.convertir([0.0, 5.0, 20.0], "%"), [0.0, 25.0, 100.0])
+    assert geometria.convertir(10.0, "L") == pytest.approx(10 * area_cm2 / 1000)
+    assert geometria.maximo("cm") == 20.0
+
+
+@pytest.mark.parametrize("unidad", ["cm", "L", "%"])
+def test_ida_y_vuelta(unidad):
+    geometria = GeometriaTanque(22.0, 10.0)
+    for altura in (0.0, 3.3, 22.0):
+        assert geometria.a_altura(float(geometria.convertir(altura, unidad)), unidad) == pytest.approx(altura)
+
+
+def test_tabla_interpola_el_volumen(tmp_path):
+    ruta = tmp_path / "tanque.csv"
+    ruta.write_text("Altura,Volumen\n0,0\n10,1\n20,4\n")
+    geometria = GeometriaTanque(20.0, 10.0, cargar_tabla(str(ruta)))
+    assert np.allclose(geometria.convertir([5.0, 15.0], "L"), [0.5, 2.5])
+    assert geometria.a_altura(2.5, "L") == pytest.approx(15.0)
+    assert geometria.volumen_maximo == pytest.approx(4.0)
+
+
+def test_tabla_invalida_y_unidad_desconocida(tmp_path):
+    with pytest.raises(ValueError):
+        GeometriaTanque(20.0, 10.0, ([0, 10, 5], [0, 1, 2]))
+    with pytest.raises(ValueError):
+        GeometriaTanque(20.0, 10.0).convertir(1.0, "m3")
+    assert cargar_tabla(str(tmp_path / "no_existe.csv")) is None
+
+
+def test_sin_altura_el_porcentaje_es_cero():
+    geometria = GeometriaTanque(0.0, 10.0)
+    assert geometria.convertir(5.0, "%") == 0.0
+    assert geometria.a_altura(50.0, "%") == 0.0
@@ -0,0 +1,81 @@
+import csv
+import math
+import os
+
+import numpy as np
+
+# Archivo opcional con la tabla altura→volumen de un recipiente no cilíndrico (columnas Altura, Volumen)
+TABLA_TANQUE = "tanque.csv"
+
+# Unidades que maneja la interfaz: altura, volumen y porcentaje de llenado
+UNIDADES = ("cm", "L", "%")
+
+
+class GeometriaTanque:
+    """Capa de conversión entre altura del líquido (cm), volumen (L) y porcentaje de llenado.
+
+    Para un cilindro cada conversión es un único factor de escala precalculado, así que una
+    ventana completa de muestras se convierte con una multiplicación de NumPy. Si se da una
+    tabla (alturas en cm, volúmenes en L) el volumen se obtiene interpolando en ella, lo que
+    permite recipientes no cilíndricos.
+    """
+
+    def __init__(self, altura_maxima=0.0, diametro=0.0, tabla=None):
+        self.altura_maxima = float(altura_maxima)
+        self.diametro = float(diametro)
+        self.tabla_alturas = None
+        self.tabla_volumenes = None
+        if tabla is not None:
+            alturas, volumenes = tabla
+            self.tabla_alturas = np.asarray(alturas, dtype=float)
+            self.tabla_volumenes = np.asarray(volumenes, dtype=float)
+            if len(self.tabla_alturas) < 2 or np.any(np.diff(self.tabla_alturas) <= 0) or np.any(np.diff(self.tabla_volumenes) < 0):
+                raise ValueError("La tabla del tanque debe tener al menos dos filas con alturas crecientes y volúmenes no decrecientes")
+
+        # Factores precalculados: valor = altura * factor
+        area_cm2 = math.pi * (self.diametro / 2) ** 2
+        self.factores = {
+            "cm": 1.0,
+            "L": area_cm2 / 1000,  # Convertir de cm³ a L
+            "%": 100 / self.altura_maxima if self.altura_maxima > 0 else 0.0,
+        }
+
+    @property
+    def volumen_maximo(self):
+        return float(self.convertir(self.altura_maxima, "L"))
+
+    def maximo(self, unidad):
+        """Valor que corresponde al recipiente lleno en la unidad indicada."""
+        return float(self.convertir(self.altura_maxima, unidad))
+
+    def convertir(self, alturas, unidad):
+        """Convierte una altura o un arreglo de alturas (cm) a la unidad indicada."""
+        alturas = np.asarray(alturas, dtype=float)
+        if unidad == "L" and self.tabla_alturas is not None:
+            return np.interp(alturas, self.tabla_alturas, self.tabla_volumenes)
+        if unidad not in self.factores:
+            raise ValueError(f"Unidad no reconocida: {unidad}")
+        return alturas * self.factores[unidad]
+
+    def a_altura(self, valor, unidad):
+        """Convierte un valor en la unidad indicada a altura del líquido (cm)."""
+        if unidad == "L" and self.tabla_alturas is not None:
+            return float(np.interp(valor, self.tabla_volumenes, self.tabla_alturas))
+        if unidad not in self.factores:
+            raise ValueError(f"Unidad no reconocida: {unidad}")
+        factor = self.factores[unidad]
+        return float(valor) / factor if factor > 0 else 0.0
+
+
+def cargar_tabla(ruta=TABLA_TANQUE):
+    """Lee la tabla altura (cm) → volumen (L) de un recipiente no cilíndrico, o None si no existe."""
+    if not os.path.exists(ruta):
+        return None
+    alturas = []
+    volumenes = []
+    with open(ruta, mode="r") as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            alturas.append(float(row["Altura"]))
+            volumenes.append(float(row["Volumen"]))
+    return alturas, volumenes